@@ -19,6 +19,7 @@ from click_option_group import (
 from src.features.smarterdb import (
     Dataset, global_connection, SmarterDBException)
 from src.features.plinkio import TextPlinkIO, IlluminaReportIO, BinaryPlinkIO
+from src.features.snapshot import VariantSnapshot
 from src.data.common import WORKING_ASSEMBLIES, PLINK_SPECIES_OPT, AssemblyConf
 
 # Get an instance of a logger
@@ -231,10 +232,23 @@ def deal_with_illumina(
     help=(
         'set SNP as missing when there are coding errors '
         '(no more CodingException)'))
+@click.option(
+    '--snapshot',
+    type=click.Path(exists=True),
+    help=(
+        'search variants in a snapshot file generated with '
+        'export_snapshot.py instead of SMARTER-database'))
+@click.option(
+    '--write_bed',
+    is_flag=True,
+    help=(
+        'write the PLINK binary files directly (no text files and no '
+        'plink conversion)'))
 def main(
         file_, bfile, report, snpfile, src_coding, dst_coding, assembly,
         species, chip_name, results_dir, search_field, search_by_positions,
-        src_version, src_imported_from, ignore_coding_errors):
+        src_version, src_imported_from, ignore_coding_errors, snapshot,
+        write_bed):
     """
     Convert a PLINK/Illumina report file in a SMARTER-like output file, without
     inserting data in SMARTER-database. Useful to convert data relying on
@@ -274,6 +288,14 @@ def main(
         plinkio, output_dir, output_map, output_ped = deal_with_illumina(
             report, snpfile, assembly, species)
 
+    if snapshot:
+        snapshot = VariantSnapshot(snapshot)
+
+        if snapshot.species != species.capitalize():
+            raise SmarterDBException(
+                f"Snapshot species '{snapshot.species}' differs from "
+                f"'{species}'")
+
     # ok check for results dir
     results_dir = Path(results_dir)
     results_dir.mkdir(parents=True, exist_ok=True)
@@ -288,7 +310,8 @@ def main(
         # fetch variants relying positions
         plinkio.fetch_coordinates_by_positions(
             src_assembly=src_assembly,
-            dst_assembly=dst_assembly
+            dst_assembly=dst_assembly,
+            snapshot=snapshot
         )
 
     else:
@@ -297,35 +320,49 @@ def main(
             src_assembly=src_assembly,
             dst_assembly=dst_assembly,
             search_field=search_field,
-            chip_name=chip_name
+            chip_name=chip_name,
+            snapshot=snapshot
         )
 
-    logger.info("Writing a new map file with updated coordinates")
-    plinkio.update_mapfile(str(output_map))
-
-    logger.info("Writing a new ped file with fixed genotype")
-    plinkio.update_pedfile(
-        outputfile=output_ped,
-        dataset=None,
-        src_coding=src_coding,
-        create_samples=False,
-        ignore_coding_errors=ignore_coding_errors,
-        dst_coding=dst_coding
-    )
+    if write_bed:
+        # write binary files without the text files and plink
+        logger.info("Writing a new binary fileset with fixed genotype")
+        plinkio.update_bedfile(
+            outputprefix=final_prefix,
+            dataset=None,
+            src_coding=src_coding,
+            create_samples=False,
+            ignore_coding_errors=ignore_coding_errors,
+            dst_coding=dst_coding
+        )
+
+    else:
+        logger.info("Writing a new map file with updated coordinates")
+        plinkio.update_mapfile(str(output_map))
+
+        logger.info("Writing a new ped file with fixed genotype")
+        plinkio.update_pedfile(
+            outputfile=output_ped,
+            dataset=None,
+            src_coding=src_coding,
+            create_samples=False,
+            ignore_coding_errors=ignore_coding_errors,
+            dst_coding=dst_coding
+        )
 
-    # ok time to convert data in plink binary format
-    cmd = ["plink"] + PLINK_SPECIES_OPT[species] + [
-        "--file",
-        f"{output_dir / output_ped.stem}",
-        "--make-bed",
-        "--out",
-        f"{final_prefix}"
-    ]
+        # ok time to convert data in plink binary format
+        cmd = ["plink"] + PLINK_SPECIES_OPT[species] + [
+            "--file",
+            f"{output_dir / output_ped.stem}",
+            "--make-bed",
+            "--out",
+            f"{final_prefix}"
+        ]
 
-    # debug
-    logger.info("Executing: " + " ".join(cmd))
+        # debug
+        logger.info("Executing: " + " ".join(cmd))
 
-    subprocess.run(cmd, check=True)
+        subprocess.run(cmd, check=True)
 
     logger.info(f"{Path(__file__).name} ended")
 
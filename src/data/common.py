@@ -10,17 +10,22 @@ Common stuff for smarter scripts
 
 import logging
 
-from typing import Union
+from typing import Union, Callable, TYPE_CHECKING
 from pathlib import Path
 from collections import namedtuple
 
-from mongoengine.queryset import QuerySet
-
-import pandas as pd
+from bson import ObjectId
+from pymongo import InsertOne, ReplaceOne, UpdateMany
+from mongoengine.queryset import QuerySet, transform
 
 from src.features.smarterdb import (
     Dataset, VariantGoat, VariantSheep, SampleSheep, SampleGoat, Location,
-    Probeset, SmarterDBException, SEX)
+    Probeset, SmarterDBException, SEX, Phenotype)
+from src.features.utils import PLINK_CHR_SET
+
+# pandas is imported when needed, since it slows down the startup of scripts
+if TYPE_CHECKING:
+    import pandas as pd
 
 # Get an instance of a logger
 logger = logging.getLogger(__name__)
@@ -38,9 +43,11 @@ WORKING_ASSEMBLIES = {
 PLINK_SPECIES_OPT = {
     # got this one from documentation + allow-no-sex, since I have
     # phenotypes with ambigous sex
-    'Sheep': ['--chr-set', '26', 'no-xy', 'no-mt', '--allow-no-sex'],
+    'Sheep': [
+        '--chr-set', str(PLINK_CHR_SET['Sheep']), 'no-xy', 'no-mt',
+        '--allow-no-sex'],
     # this let to model 29 chromosome, X, Y, MT and contigs
-    'Goat': ['--chr-set', '29', '--allow-extra-chr']
+    'Goat': ['--chr-set', str(PLINK_CHR_SET['Goat']), '--allow-extra-chr']
 }
 
 
@@ -176,7 +183,7 @@ def get_sample_species(species: str) -> Union[SampleSheep, SampleGoat]:
     return SampleSpecie
 
 
-def pandas_open(datapath: Path, **kwargs) -> pd.DataFrame:
+def pandas_open(datapath: Path, **kwargs) -> "pd.DataFrame":
     """Open an excel or csv file with pandas and returns a dataframe
 
     Args:
@@ -187,6 +194,8 @@ def pandas_open(datapath: Path, **kwargs) -> pd.DataFrame:
         pd.DataFrame: file content as a pandas dataframe
     """
 
+    import pandas as pd
+
     data = None
 
     if datapath.suffix in ['.xls', '.xlsx']:
@@ -229,6 +238,21 @@ def update_variant(
     record = qs.get()
     logger.debug(f"found {record} in database")
 
+    update_record = merge_variant(record, variant, location)
+
+    if update_record:
+        record.save()
+
+    return update_record
+
+
+def merge_variant(
+        record: Union[VariantSheep, VariantGoat],
+        variant: Union[VariantSheep, VariantGoat],
+        location: Location) -> bool:
+    """Apply variant and location to an existing record (in memory).
+    Returns True if record need to be updated"""
+
     update_record = False
 
     # check that the snp I want to update has the same illumina_top
@@ -271,12 +295,270 @@ def update_variant(
     if updated:
         update_record = True
 
-    if update_record:
-        record.save()
-
     return update_record
 
 
+class VariantBatchLoader():
+    """
+    Insert or update variants in batches. Existing variants are fetched
+    with one ``$in`` query for each search field, then the same rules of
+    :py:func:`update_variant` (or a custom function) are applied in memory.
+    New variants are inserted and only the changed variants are replaced
+    with a single ``bulk_write``. Use it as a context manager in order to
+    write the last batch::
+
+        with VariantBatchLoader(VariantSheep) as loader:
+            for variant, location in records:
+                loader.add_variant(
+                    variant, location, search=[("name", variant.name)])
+    """
+
+    def __init__(
+            self,
+            VariantSpecie: Union[VariantSheep, VariantGoat],
+            batch_size: int = 1000):
+
+        self.VariantSpecie = VariantSpecie
+        self.batch_size = batch_size
+
+        self.items = []
+        self.n_inserted = 0
+        self.n_updated = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+
+    def _add(self, item: dict):
+        self.items.append(item)
+
+        if len(self.items) >= self.batch_size:
+            self.flush()
+
+    def add_variant(
+            self,
+            variant: Union[VariantSheep, VariantGoat],
+            location: Location,
+            search: list,
+            fallback: Callable = None,
+            ignore_errors: bool = False):
+        """
+        Update the variant found in database or insert a new one, like
+        :py:func:`update_variant` and :py:func:`new_variant` do. If more
+        than one variant is found, the variant is ignored
+
+        Parameters
+        ----------
+        variant : Union[VariantSheep, VariantGoat]
+            The new variant data.
+        location : Location
+            The new variant location.
+        search : list
+            A list of ``(field, value)`` tuples. A variant matching any of
+            them is returned.
+        fallback : Callable, optional
+            A function returning a list of variants, called when ``search``
+            doesn't find anything. The default is None.
+        ignore_errors : bool, optional
+            Ignore (and log) SmarterDBException while updating a variant.
+            The default is False.
+        """
+
+        self._add({
+            "search": search,
+            "fallback": fallback,
+            "variant": variant,
+            "location": location,
+            "ignore_errors": ignore_errors,
+        })
+
+    def update_variant(
+            self,
+            search: list,
+            callback: Callable,
+            missing: Callable = None,
+            update_all: bool = False):
+        """
+        Update an existing variant using a custom function
+
+        Parameters
+        ----------
+        search : list
+            A list of ``(field, value)`` tuples. A variant matching any of
+            them is returned.
+        callback : Callable
+            A function called with the variant found in database. Should
+            return True if the variant need to be updated.
+        missing : Callable, optional
+            A function called when no variant is found. The default is None
+            (log a warning).
+        update_all : bool, optional
+            Call the function with all the variants found. The default is
+            False (variants found more than once are ignored).
+        """
+
+        self._add({
+            "search": search,
+            "callback": callback,
+            "missing": missing,
+            "update_all": update_all,
+        })
+
+    def _index_record(self, index: dict, record, fields):
+        for field in fields:
+            values = getattr(record, field)
+
+            if not isinstance(values, list):
+                values = [values]
+
+            for value in values:
+                index.setdefault((field, value), dict())[record.id] = record
+
+    def _search(self, index: dict, records: dict, item: dict) -> list:
+        matches = dict()
+
+        for field, value in item["search"]:
+            matches.update(index.get((field, value), dict()))
+
+        if not matches and item.get("fallback"):
+            for record in item["fallback"]():
+                # mind to records already fetched
+                record = records.setdefault(record.id, record)
+                matches[record.id] = record
+
+        return list(matches.values())
+
+    def _new_variant(self, variant, location):
+        variant.locations.append(location)
+
+        # set the illumina_top attribute relying on the first location
+        variant.illumina_top = location.illumina_top
+
+        # like VariantSpecies.save() does
+        if not variant.name and variant.affy_snp_id:
+            variant.name = variant.affy_snp_id
+
+        variant.id = ObjectId()
+
+        logger.debug(f"adding {variant} to database")
+
+        return variant
+
+    def flush(self):
+        """Process the collected items and write changes to database"""
+
+        if not self.items:
+            return
+
+        # search all the values by field
+        values = dict()
+
+        for item in self.items:
+            for field, value in item["search"]:
+                if value is not None:
+                    values.setdefault(field, set()).add(value)
+
+        # fetch variants and index them by (field, value)
+        records, index = dict(), dict()
+
+        for field, field_values in values.items():
+            for record in self.VariantSpecie.objects(
+                    **{f"{field}__in": list(field_values)}):
+                record = records.setdefault(record.id, record)
+                self._index_record(index, record, [field])
+
+        new_records, changed = dict(), dict()
+
+        for item in self.items:
+            matches = self._search(index, records, item)
+
+            if "callback" in item:
+                if len(matches) == 1:
+                    if item["callback"](matches[0]):
+                        changed[matches[0].id] = matches[0]
+
+                elif len(matches) == 0:
+                    if item["missing"]:
+                        item["missing"]()
+
+                    else:
+                        logger.warning(
+                            f"Can't find a variant using {item['search']}")
+
+                elif item["update_all"]:
+                    logger.warning(
+                        f"Got {len(matches)} variants using "
+                        f"{item['search']}: updating all")
+
+                    for record in matches:
+                        if item["callback"](record):
+                            changed[record.id] = record
+
+                else:
+                    logger.warning(
+                        f"Got {len(matches)} variants using "
+                        f"{item['search']}: ignoring")
+
+                continue
+
+            if len(matches) == 1:
+                record = matches[0]
+                logger.debug(f"found {record} in database")
+
+                try:
+                    if merge_variant(
+                            record, item["variant"], item["location"]):
+                        changed[record.id] = record
+
+                except SmarterDBException as exc:
+                    if not item["ignore_errors"]:
+                        raise
+
+                    logger.warning(
+                        f"Error with {item['variant']}: {exc} - "
+                        "ignoring snp")
+
+            elif len(matches) == 0:
+                record = self._new_variant(item["variant"], item["location"])
+                new_records[record.id] = record
+                records[record.id] = record
+
+                # the next items could update this variant
+                self._index_record(index, record, list(values))
+
+        # insert the new variants and replace only the changed ones
+        changed = [
+            record for record_id, record in changed.items()
+            if record_id not in new_records]
+
+        operations = []
+
+        for record in new_records.values():
+            record.validate()
+            operations.append(InsertOne(record.to_mongo().to_dict()))
+
+        for record in changed:
+            record.validate()
+            operations.append(
+                ReplaceOne({"_id": record.id}, record.to_mongo().to_dict()))
+
+        if operations:
+            self.VariantSpecie._get_collection().bulk_write(
+                operations, ordered=False)
+
+        self.n_inserted += len(new_records)
+        self.n_updated += len(changed)
+
+        logger.debug(
+            f"Processed {len(self.items)} items: {len(new_records)} "
+            f"inserted, {len(changed)} updated")
+
+        self.items = []
+
+
 def update_chip_name(
         variant: Union[VariantSheep, VariantGoat],
         record: Union[VariantSheep, VariantGoat]
@@ -513,7 +795,7 @@ def update_rs_id(
 
 
 def deal_with_sex_and_alias(
-        sex_column: str, alias_column: str, row: pd.Series):
+        sex_column: str, alias_column: str, row: "pd.Series"):
     """
     Deal with sex and alias parameters
 
@@ -549,9 +831,97 @@ def deal_with_sex_and_alias(
     alias = None
 
     if alias_column:
+        import pandas as pd
+
         value = row.get(alias_column)
 
         if pd.notnull(value) and pd.notna(value):
             alias = value
 
     return sex, alias
+
+
+def update_phenotype(
+        SampleSpecie: Union[SampleSheep, SampleGoat],
+        dst_dataset: Dataset,
+        query: dict,
+        phenotype: dict) -> UpdateMany:
+    """
+    Return the update which set phenotype attributes to all the samples of
+    a dataset matching a query. Only the provided attributes are set, the
+    other phenotype attributes of samples are preserved. Updates need to be
+    sent with :py:func:`write_phenotypes`
+
+    Parameters
+    ----------
+    SampleSpecie : Union[SampleSheep, SampleGoat]
+        The sample class to update.
+    dst_dataset : Dataset
+        The dataset of samples.
+    query : dict
+        The fields used to select samples (ex. ``{'breed': breed}``).
+    phenotype : dict
+        The phenotype attributes to set.
+
+    Raises
+    ------
+    ValidationError
+        When a value is not valid for a :py:class:`Phenotype` attribute.
+
+    Returns
+    -------
+    UpdateMany
+        The update operation, or None if there's nothing to update.
+    """
+
+    if not phenotype:
+        logger.debug(f"Skipping {query}: nothing to update")
+        return None
+
+    # validate and convert values like Phenotype.save() does
+    phenotype = Phenotype(**phenotype)
+    phenotype.validate()
+
+    update = {
+        f"phenotype.{key}": value
+        for key, value in phenotype.to_mongo().items()}
+
+    logger.debug(
+        f"Update samples with {query} phenotype with '{phenotype}'")
+
+    return UpdateMany(
+        transform.query(SampleSpecie, dataset=dst_dataset, **query),
+        {"$set": update})
+
+
+def write_phenotypes(
+        SampleSpecie: Union[SampleSheep, SampleGoat],
+        operations: list) -> int:
+    """
+    Send phenotype updates with a single bulk write
+
+    Parameters
+    ----------
+    SampleSpecie : Union[SampleSheep, SampleGoat]
+        The sample class to update.
+    operations : list
+        The updates returned by :py:func:`update_phenotype`. None values
+        are ignored.
+
+    Returns
+    -------
+    int
+        The number of updated samples.
+    """
+
+    operations = [operation for operation in operations if operation]
+
+    if not operations:
+        return 0
+
+    # keep rows order: the last row matching a sample wins
+    result = SampleSpecie._get_collection().bulk_write(operations)
+
+    logger.info(f"Updated {result.modified_count} samples phenotype")
+
+    return result.modified_count
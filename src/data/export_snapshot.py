@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 11:02:48 2026
+
+@author: Paolo Cozzi <paolo.cozzi@ibba.cnr.it>
+
+Export a species/assembly/chip slice of SMARTER variants into a local file,
+which can be used by SNPconvert.py to convert genotypes without a database
+connection
+"""
+
+import click
+import logging
+
+from pathlib import Path
+
+from src.features.smarterdb import global_connection, SmarterDBException
+from src.features.snapshot import export_snapshot
+from src.data.common import (
+    WORKING_ASSEMBLIES, AssemblyConf, get_variant_species)
+
+logger = logging.getLogger(__name__)
+
+
+@click.command()
+@click.option(
+    '--species',
+    type=str,
+    required=True,
+    help="The SMARTER assembly species (Goat or Sheep)")
+@click.option(
+    '--assembly',
+    type=str,
+    required=True,
+    help="Destination assembly of the converted genotypes")
+@click.option(
+    '--src_version',
+    type=str,
+    help="Source assembly version")
+@click.option(
+    '--src_imported_from',
+    type=str,
+    help="Source assembly imported_from")
+@click.option(
+    '--chip_name',
+    type=str,
+    help="Export only variants of this SMARTER SupportedChip name")
+@click.option(
+    '--output',
+    type=click.Path(),
+    required=True,
+    help="The snapshot output file (.npz)")
+def main(species, assembly, src_version, src_imported_from, chip_name,
+         output):
+    """
+    Export SMARTER variants with their locations in a local snapshot file,
+    to be used with the ``--snapshot`` option of
+    :ref:`SNPconvert.py <SNPconvert>`
+    """
+
+    logger.info(f"{Path(__file__).name} started")
+
+    # find assembly configuration
+    if assembly not in WORKING_ASSEMBLIES:
+        raise SmarterDBException(
+            f"assembly {assembly} not managed by smarter")
+
+    assemblies = [WORKING_ASSEMBLIES[assembly]]
+
+    if src_version and src_imported_from:
+        src_assembly = AssemblyConf(src_version, src_imported_from)
+        logger.info(f"Got '{src_assembly} as source assembly'")
+        assemblies.insert(0, src_assembly)
+
+    VariantSpecie = get_variant_species(species)
+
+    export_snapshot(output, VariantSpecie, assemblies, chip_name)
+
+    logger.info(f"{Path(__file__).name} ended")
+
+
+if __name__ == '__main__':
+    log_fmt = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    logging.basicConfig(level=logging.INFO, format=log_fmt)
+
+    # connect to database
+    global_connection()
+
+    main()
@@ -9,14 +9,14 @@ Created on Wed Jun  9 15:44:58 2021
 import re
 import click
 import logging
+import functools
 
-from mongoengine.queryset import Q
 
-from src.features.illumina import IlluSNP, IlluSNPException
+from src.features.illumina import resolve_sequences
 from src.features.smarterdb import (
-    global_connection, SupportedChip, Location, Probeset, SmarterDBException)
+    global_connection, SupportedChip, Location, Probeset)
 from src.features.affymetrix import read_Manifest
-from src.data.common import get_variant_species, update_variant, new_variant
+from src.data.common import get_variant_species, VariantBatchLoader
 
 logger = logging.getLogger(__name__)
 
@@ -63,32 +63,29 @@ def fix_illumina_args(record):
     return args
 
 
-def search_database(record, VariantSpecie):
-    # if I have a cust_id, search with it
+def get_search_fields(record) -> list:
+    """Return the (field, value) tuples used to search for a variant in a
+    :py:class:`VariantBatchLoader`: the cust_id (if any) or the affy_snp_id
+    as name, or the affy_snp_id (private Affy SNP with unmatched cust_id).
+    When nothing is found with a cust_id, search with
+    :py:func:`search_fixed_illumina_name`"""
+
     if record.cust_id:
-        # search for cust_id or affy_snp_id
-        # (private Affy SNP with unmatched cust_id)
-        qs = VariantSpecie.objects.filter(
-            Q(name=record.cust_id) | Q(affy_snp_id=record.affy_snp_id))
+        return [("name", record.cust_id), ("affy_snp_id", record.affy_snp_id)]
 
-        if qs.count() == 0:
-            logger.debug(f"Can't find a Variant using {record.cust_id}")
+    return [("name", record.affy_snp_id), ("affy_snp_id", record.affy_snp_id)]
 
-            args = fix_illumina_args(record)
-            qs = VariantSpecie.objects.filter(**args)
 
-            if qs.count() == 0:
-                logger.debug(f"Can't find a Variant using {args}")
+def search_fixed_illumina_name(record, VariantSpecie) -> list:
+    """Search a variant using the illumina name derived from cust_id"""
 
-    else:
-        # search by affy id
-        qs = VariantSpecie.objects.filter(
-            Q(name=record.affy_snp_id) | Q(affy_snp_id=record.affy_snp_id))
+    args = fix_illumina_args(record)
+    variants = list(VariantSpecie.objects.filter(**args))
 
-        if qs.count() == 0:
-            logger.debug(f"Can't find a Variant using {record.affy_snp_id}")
+    if not variants:
+        logger.debug(f"Can't find a Variant using {args}")
 
-    return qs
+    return variants
 
 
 @click.command()
@@ -110,87 +107,97 @@ def main(species_class, manifest, chip_name, version):
 
     logger.info(f"Reading from {manifest}")
 
-    # grep a sample SNP
-    for i, record in enumerate(read_Manifest(manifest)):
-        # ['probe_set_id', 'affy_snp_id', 'dbsnp_rs_id', 'dbsnp_loctype',
-        # 'chromosome', 'physical_position', 'position_end', 'strand',
-        # 'chrx_pseudo_autosomal_region_1', 'cytoband', 'flank', 'allele_a',
-        # 'allele_b', 'ref_allele', 'alt_allele', 'associated_gene',
-        # 'genetic_map', 'microsatellite', 'allele_frequencies',
-        # 'heterozygous_allele_frequencies', 'number_of_individuals',
-        # 'in_hapmap', 'strand_versus_dbsnp', 'probe_count',
-        # 'chrx_pseudo_autosomal_region_2', 'minor_allele',
-        # 'minor_allele_frequency', 'omim', 'biomedical',
-        # 'annotation_notes', 'ordered_alleles', 'allele_count',
-        # 'genome', 'cust_id', 'cust_genes', 'cust_traits', 'date']
-        logger.debug(f"Processing {record}")
-
-        affymetrix_ab = f"{record.allele_a}/{record.allele_b}"
-
-        alleles = get_alleles(record)
-
-        # get the illumina coded snp relying on sequence
-        try:
-            illusnp = IlluSNP(record.flank, max_iter=25).toTop()
-
-        except IlluSNPException as e:
-            logger.debug(e)
-            logger.warning(
-                f"Ignoring {record}: only 2 allelic SNPs are supported")
-            continue
-
-        # update chip data indipendentely if it is an update or not
-        affymetrix_chip.n_of_snps += 1
-
-        # create a location object
-        location = Location(
-            version=version,
-            chrom=record.chromosome,
-            position=record.physical_position,
-            affymetrix_ab=affymetrix_ab,
-            alleles=alleles,
-            strand=record.strand,
-            illumina=illusnp.illumina,
-            illumina_strand=illusnp.strand,
-            imported_from="affymetrix",
-            date=record.date,
-        )
-
-        rs_id = None
-
-        if record.dbsnp_rs_id:
-            rs_id = [record.dbsnp_rs_id]
-
-        variant = VariantSpecie(
-            chip_name=[chip_name],
-            rs_id=rs_id,
-            probesets=[
-                Probeset(
-                    chip_name=chip_name,
-                    probeset_id=[record.probe_set_id]
-                )],
-            affy_snp_id=record.affy_snp_id,
-            sequence={chip_name: record.flank},
-            cust_id=record.cust_id,
-        )
-
-        logger.debug(f"Processing location {variant}, {location}")
-
-        qs = search_database(record, VariantSpecie)
-
-        if qs.count() == 1:
-            try:
-                update_variant(qs, variant, location)
-
-            except SmarterDBException as exc:
-                # TODO: remove this exception handling
-                logger.warn(f"Error with {variant}: {exc} - ignoring snp")
-
-        elif qs.count() == 0:
-            new_variant(variant, location)
-
-        if (i+1) % 5000 == 0:
-            logger.info(f"{i+1} variants processed")
+    records = list(read_Manifest(manifest))
+
+    # get the illumina coded snps relying on sequences (all at once)
+    illumina, illumina_strand, _ = [
+        array.tolist() for array in resolve_sequences(
+            [record.flank for record in records],
+            max_iter=25,
+            to_top=True,
+            ignore_errors=True)]
+
+    with VariantBatchLoader(VariantSpecie) as loader:
+        # grep a sample SNP
+        for i, record in enumerate(records):
+            # ['probe_set_id', 'affy_snp_id', 'dbsnp_rs_id',
+            # 'dbsnp_loctype', 'chromosome', 'physical_position',
+            # 'position_end', 'strand', 'chrx_pseudo_autosomal_region_1',
+            # 'cytoband', 'flank', 'allele_a', 'allele_b', 'ref_allele',
+            # 'alt_allele', 'associated_gene',
+            # 'genetic_map', 'microsatellite', 'allele_frequencies',
+            # 'heterozygous_allele_frequencies', 'number_of_individuals',
+            # 'in_hapmap', 'strand_versus_dbsnp', 'probe_count',
+            # 'chrx_pseudo_autosomal_region_2', 'minor_allele',
+            # 'minor_allele_frequency', 'omim', 'biomedical',
+            # 'annotation_notes', 'ordered_alleles', 'allele_count',
+            # 'genome', 'cust_id', 'cust_genes', 'cust_traits', 'date']
+            logger.debug(f"Processing {record}")
+
+            affymetrix_ab = f"{record.allele_a}/{record.allele_b}"
+
+            alleles = get_alleles(record)
+
+            if not illumina[i]:
+                logger.warning(
+                    f"Ignoring {record}: only 2 allelic SNPs are supported")
+                continue
+
+            # update chip data indipendentely if it is an update or not
+            affymetrix_chip.n_of_snps += 1
+
+            # create a location object
+            location = Location(
+                version=version,
+                chrom=record.chromosome,
+                position=record.physical_position,
+                affymetrix_ab=affymetrix_ab,
+                alleles=alleles,
+                strand=record.strand,
+                illumina=illumina[i],
+                illumina_strand=illumina_strand[i],
+                imported_from="affymetrix",
+                date=record.date,
+            )
+
+            rs_id = None
+
+            if record.dbsnp_rs_id:
+                rs_id = [record.dbsnp_rs_id]
+
+            variant = VariantSpecie(
+                chip_name=[chip_name],
+                rs_id=rs_id,
+                probesets=[
+                    Probeset(
+                        chip_name=chip_name,
+                        probeset_id=[record.probe_set_id]
+                    )],
+                affy_snp_id=record.affy_snp_id,
+                sequence={chip_name: record.flank},
+                cust_id=record.cust_id,
+            )
+
+            logger.debug(f"Processing location {variant}, {location}")
+
+            # search variants by name or affy_snp_id, then with the
+            # illumina name derived from cust_id. Ignore errors when updating
+            # a variant
+            fallback = None
+
+            if record.cust_id:
+                fallback = functools.partial(
+                    search_fixed_illumina_name, record, VariantSpecie)
+
+            loader.add_variant(
+                variant,
+                location,
+                search=get_search_fields(record),
+                fallback=fallback,
+                ignore_errors=True)
+
+            if (i+1) % 5000 == 0:
+                logger.info(f"{i+1} variants processed")
 
     # update chip info
     affymetrix_chip.save()
@@ -8,9 +8,11 @@ Created on Wed Mar  3 18:07:13 2021
 Load data from dbSNP dump files and update illumina SNPs
 """
 
+import copy
 import click
 import logging
 import pathlib
+import multiprocessing
 
 from typing import Union
 from functools import partial
@@ -20,103 +22,43 @@ from src.features.smarterdb import (
 from src.features.dbsnp import read_dbSNP, search_chip_snps
 from src.features.illumina import IlluSNP
 from src.data.common import (
-    get_variant_species, update_location, update_rs_id, AssemblyConf)
+    get_variant_species, update_location, update_rs_id, AssemblyConf,
+    VariantBatchLoader)
 
 logger = logging.getLogger(__name__)
 
-# global variables (defined in main)
-VariantSpecie = None
-assembly_conf = None
+# the SNP names searched by worker processes (see init_worker)
+WORKER_SNP_NAMES = None
 
 
-def search_variant(
-        sss: dict,
-        rs_id: str,
-        locSnpIds: set[str],
-        VariantSpecie: Union[VariantSheep, VariantGoat]) -> list[
-            Union[VariantSheep, VariantGoat]]:
-    """
-    Return VariantSheep or VariantGoat instance for the provided SS
-    evidences
-
-    Parameters
-    ----------
-    sss : dict
-        A dictionary with all the dbSNP SS hits for illuminas.
-    rs_id : str
-        The rsId identifier of such SNP.
-    locSnpIds : set[str]
-        A list of Illumina probe names.
-    VariantSpecie : Union[VariantSheep, VariantGoat]
-        The specie class (VariantSheep or VariantGoat) to be used when
-        searching in SMARTER database
-
-    Returns
-    -------
-    list[Union[VariantSheep, VariantGoat]]
-        A list of variants (Sheep Or Goat).
-    """
-
-    if len(sss) > 1:
-        logger.debug(f"Got {len(sss)} ss for '{rs_id}'")
-        variants = VariantSpecie.objects.filter(name__in=list(locSnpIds))
-
-    elif len(sss) == 1:
-        ss = sss[0]
-
-        # ok get a variant from database and return it
-        variants = VariantSpecie.objects.filter(name=ss['locSnpId'])
-
-    if len(variants) > 1:
-        logger.warning(
-            f"Got {len(variants)} Variants for '{rs_id}'")
-
-    return variants
-
-
-def process_variant(
+def make_location(
         snp: dict,
-        variant: Union[VariantSheep, VariantGoat],
-        supported_chips: list) -> Location:
+        ss: dict,
+        assembly_conf: AssemblyConf) -> Location:
     """
-    Process a SNP read from dbSNP XML file and return a new Location object
+    Create a Location object from a dbSNP rsId and one of its SS. Illumina
+    attributes are not defined (see :py:func:`set_illumina`), except the
+    ``illumina_strand`` provided by SS
 
     Parameters
     ----------
     snp : dict
         A dictionary with all data from a dbSNP rsId.
-    variant : Union[VariantSheep, VariantGoat]
-        A SMARTER variant object.
-    supported_chips : list
-        A list of supported chips as string.
+    ss : dict
+        The SS data of the SMARTER variant.
+    assembly_conf : AssemblyConf
+        The assembly version and source of the new Location.
 
     Returns
     -------
     Location
         A SMARTER Location object for the read SNP.
-
     """
-    global assembly_conf
-
-    logger.debug(f"Processing '{variant.name}'")
-
-    # get the SS relying on ss[locSnpId']
-    ss = next(filter(lambda ss: ss['locSnpId'] == variant.name, snp['ss']))
-
-    logger.debug(f"Got {ss} as ss data")
 
     assembly = snp.get('assembly')
 
     logger.debug(f"Got {assembly} as assembly")
 
-    # next: I need to determine the illumina top for this SNP
-    for chip_name in supported_chips:
-        if chip_name in variant.sequence:
-            sequence = variant.sequence[chip_name]
-            break
-
-    illu_snp = IlluSNP(sequence=sequence, max_iter=25)
-
     chromosome = "0"
     position = 0
 
@@ -128,7 +70,6 @@ def process_variant(
         chromosome = assembly['component']['chromosome']
         position = int(assembly['component']['maploc']['physMapInt'])+1
 
-    # Using assembly_conf when creating a Location
     return Location(
         ss_id=f"ss{ss['ssId']}",
         version=assembly_conf.version,
@@ -136,19 +77,45 @@ def process_variant(
         chrom=chromosome,
         position=position,
         alleles=ss['observed'],
-        illumina_strand=ss.get('strand', illu_snp.strand),
+        illumina_strand=ss.get('strand'),
         strand=ss.get('orient'),
-        illumina=illu_snp.illumina
     )
 
 
-def process_dbsnp_file(
+def set_illumina(
+        location: Location,
+        variant: Union[VariantSheep, VariantGoat],
+        supported_chips: list,
+        has_strand: bool = True) -> Location:
+    """Determine the illumina attributes of a location relying on variant
+    sequence. The ``illumina_strand`` is determined only if SS doesn't have
+    a ``strand`` (``has_strand`` is False)"""
+
+    # next: I need to determine the illumina top for this SNP
+    for chip_name in supported_chips:
+        if chip_name in variant.sequence:
+            sequence = variant.sequence[chip_name]
+            break
+
+    illu_snp = IlluSNP(sequence=sequence, max_iter=25)
+
+    if not has_strand:
+        location.illumina_strand = illu_snp.strand
+
+    location.illumina = illu_snp.illumina
+
+    return location
+
+
+def parse_dbsnp_file(
         input_file: pathlib.Path,
         sender: str,
         all_snp_names: set[str],
-        supported_chips: list[str]):
+        assembly_conf: AssemblyConf) -> list[tuple]:
     """
-    Process a single dbSNP file and put data into database
+    Read a single dbSNP file and collect the data of the SNPs in SMARTER
+    database. Doesn't require a database connection, so it could be called
+    by a worker process
 
     Parameters
     ----------
@@ -158,25 +125,30 @@ def process_dbsnp_file(
         The SNP sender (ex. AGR_BS, IGGC).
     all_snp_names : set[str]
         A set containing all the SNP names than need to be updated.
-    supported_chips : list[str]
-        A list of supported chips (required to collect the original sequence).
+    assembly_conf : AssemblyConf
+        The assembly version and source of the new Locations.
 
     Returns
     -------
-    None.
-
+    list[tuple]
+        A list of ``(locSnpId, rs_id, Location, has_strand)`` tuples, where
+        ``has_strand`` is True if SS has a ``strand`` key
     """
 
-    global VariantSpecie
-
     logger.info(f"Reading from '{input_file}'")
 
+    records = []
+
     handle_filter = partial(search_chip_snps, handle=sender)
 
+    # decode only the records with a SMARTER variant from sender
+    dbsnp_records = read_dbSNP(
+        input_file, minimal=True, handle=sender, locSnpIds=all_snp_names)
+
     # cicle amoung dbsnp object
-    for i, snp in enumerate(filter(handle_filter, read_dbSNP(input_file))):
-        if (i+1) % 5000 == 0:
-            logger.info(f"{i+1} variants processed for '{input_file}'")
+    for i, snp in enumerate(filter(handle_filter, dbsnp_records), start=1):
+        if i % 5000 == 0:
+            logger.info(f"{i} variants processed for '{input_file}'")
 
         # determine rs_id once
         rs_id = f"rs{snp['rsId']}"
@@ -192,32 +164,75 @@ def process_dbsnp_file(
             logger.debug(f"Skipping '{locSnpIds}': not in database")
             continue
 
-        variants = search_variant(sss, rs_id, locSnpIds, VariantSpecie)
+        if len(sss) > 1:
+            logger.debug(f"Got {len(sss)} ss for '{rs_id}'")
+
+        for locSnpId in sorted(locSnpIds.intersection(all_snp_names)):
+            # get the first SS relying on ss[locSnpId']
+            ss = next(filter(lambda ss: ss['locSnpId'] == locSnpId, sss))
 
-        for variant in variants:
-            location = process_variant(snp, variant, supported_chips)
+            records.append((
+                locSnpId,
+                rs_id,
+                make_location(snp, ss, assembly_conf),
+                'strand' in ss))
 
-            # Should I update a location or not?
-            update_variant = False
+    logger.info(
+        f"Got {len(records)} SMARTER variants from '{input_file}'")
 
-            variant, updated = update_location(location, variant)
+    return records
 
-            if updated:
-                update_variant = True
 
-            variant, updated = update_rs_id(
-                # create a fake variant with rs_id to use this method
-                VariantSpecie(rs_id=[rs_id]),
-                variant)
+def init_worker(all_snp_names: set[str]):
+    """Receive the SNP names once, when a worker process starts, instead of
+    pickling them for each file"""
 
-            if updated:
-                update_variant = True
+    global WORKER_SNP_NAMES
 
-            if update_variant:
-                # update variant with snpchimp data
-                variant.save()
+    WORKER_SNP_NAMES = all_snp_names
 
-    logger.info(f"{i+1} variants processed for '{input_file}'")
+
+def parse_dbsnp_worker(
+        input_file: pathlib.Path,
+        sender: str,
+        assembly_conf: AssemblyConf) -> list[tuple]:
+    """Call :py:func:`parse_dbsnp_file` in a worker process, with the SNP
+    names received by :py:func:`init_worker`"""
+
+    return parse_dbsnp_file(
+        input_file, sender, WORKER_SNP_NAMES, assembly_conf)
+
+
+def update_dbsnp_variant(
+        variant: Union[VariantSheep, VariantGoat],
+        location: Location,
+        rs_id: str,
+        supported_chips: list[str],
+        has_strand: bool = True) -> bool:
+    """Update a SMARTER variant with dbSNP data. Returns True if variant
+    need to be saved"""
+
+    # the same location could be applied to variants with the same name
+    location = set_illumina(
+        copy.deepcopy(location), variant, supported_chips, has_strand)
+
+    # Should I update a location or not?
+    update_variant = False
+
+    variant, updated = update_location(location, variant)
+
+    if updated:
+        update_variant = True
+
+    variant, updated = update_rs_id(
+        # create a fake variant with rs_id to use this method
+        type(variant)(rs_id=[rs_id]),
+        variant)
+
+    if updated:
+        update_variant = True
+
+    return update_variant
 
 
 @click.command()
@@ -259,9 +274,16 @@ def process_dbsnp_file(
     default="dbSNP152",
     help="The source of this data"
 )
-def main(species_class, input_dir, pattern, sender, version, imported_from):
-    global VariantSpecie
-    global assembly_conf
+@click.option(
+    '--workers',
+    type=click.IntRange(min=1),
+    default=1,
+    help="Read dbSNP files using this number of processes",
+    show_default=True
+)
+def main(species_class, input_dir, pattern, sender, version, imported_from,
+         workers):
+    """Update SMARTER illumina variants with dbSNP data"""
 
     # determine assembly configuration
     assembly_conf = AssemblyConf(version=version, imported_from=imported_from)
@@ -287,8 +309,56 @@ def main(species_class, input_dir, pattern, sender, version, imported_from):
 
     logger.info(f"Got {len(all_snp_names)} SNPs for 'illumina' manufacturer")
 
-    for input_file in pathlib.Path(input_dir).glob(pattern):
-        process_dbsnp_file(input_file, sender, all_snp_names, supported_chips)
+    input_files = sorted(pathlib.Path(input_dir).glob(pattern))
+
+    with VariantBatchLoader(VariantSpecie) as loader:
+        if workers > 1:
+            logger.info(f"Reading dbSNP files with {workers} processes")
+
+            # SNP names are sent once to each worker
+            pool = multiprocessing.Pool(
+                workers, initializer=init_worker, initargs=(all_snp_names,))
+
+            # results are applied in the same order of files
+            results = pool.imap(
+                partial(
+                    parse_dbsnp_worker,
+                    sender=sender,
+                    assembly_conf=assembly_conf),
+                input_files)
+
+        else:
+            pool = None
+            results = map(
+                partial(
+                    parse_dbsnp_file,
+                    sender=sender,
+                    all_snp_names=all_snp_names,
+                    assembly_conf=assembly_conf),
+                input_files)
+
+        try:
+            # apply worker results to database in batches
+            for records in results:
+                for locSnpId, rs_id, location, has_strand in records:
+                    # update all the variants with the same name
+                    loader.update_variant(
+                        search=[("name", locSnpId)],
+                        callback=partial(
+                            update_dbsnp_variant,
+                            location=location,
+                            rs_id=rs_id,
+                            supported_chips=supported_chips,
+                            has_strand=has_strand),
+                        update_all=True)
+
+        finally:
+            if pool:
+                pool.terminate()
+                pool.join()
+
+    logger.info(
+        f"{loader.n_updated} variants updated from {len(input_files)} files")
 
     logger.info("Completed")
 
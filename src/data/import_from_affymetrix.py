@@ -183,10 +183,16 @@ def deal_with_report(report: str, dataset: Dataset, assembly: str):
     '--skip_coordinate_check',
     is_flag=True,
     help="Skip coordinate check (only valid for affymetrix report)")
+@click.option(
+    '--write_bed',
+    is_flag=True,
+    help=(
+        'write the PLINK binary files directly (no text files and no '
+        'plink conversion)'))
 def main(
         prefix, report, dataset, src_coding, breed_code, chip_name, assembly,
         create_samples, sample_field, search_field, src_version,
-        src_imported_from, max_samples, skip_coordinate_check):
+        src_imported_from, max_samples, skip_coordinate_check, write_bed):
     """
     Read genotype data from affymetrix files and convert it
     to the desidered assembly version using Illumina TOP coding
@@ -258,32 +264,46 @@ def main(
         skip_check=skip_coordinate_check
     )
 
-    logger.info("Writing a new map file with updated coordinates")
-    plinkio.update_mapfile(str(output_map))
-
-    logger.info("Writing a new ped file with fixed genotype (illumina TOP)")
-    plinkio.update_pedfile(
-        outputfile=output_ped,
-        dataset=dataset,
-        src_coding=src_coding,
-        breed=breed_code,
-        create_samples=create_samples,
-        sample_field=sample_field
-    )
-
-    # ok time to convert data in plink binary format
-    cmd = ["plink"] + PLINK_SPECIES_OPT[dataset.species] + [
-        "--file",
-        f"{output_dir / output_ped.stem}",
-        "--make-bed",
-        "--out",
-        f"{final_prefix}"
-    ]
-
-    # debug
-    logger.info("Executing: " + " ".join(cmd))
-
-    subprocess.run(cmd, check=True)
+    if write_bed:
+        # write binary files without the text files and plink
+        logger.info("Writing a new binary fileset with fixed genotype")
+        plinkio.update_bedfile(
+            outputprefix=final_prefix,
+            dataset=dataset,
+            src_coding=src_coding,
+            breed=breed_code,
+            create_samples=create_samples,
+            sample_field=sample_field
+        )
+
+    else:
+        logger.info("Writing a new map file with updated coordinates")
+        plinkio.update_mapfile(str(output_map))
+
+        logger.info(
+            "Writing a new ped file with fixed genotype (illumina TOP)")
+        plinkio.update_pedfile(
+            outputfile=output_ped,
+            dataset=dataset,
+            src_coding=src_coding,
+            breed=breed_code,
+            create_samples=create_samples,
+            sample_field=sample_field
+        )
+
+        # ok time to convert data in plink binary format
+        cmd = ["plink"] + PLINK_SPECIES_OPT[dataset.species] + [
+            "--file",
+            f"{output_dir / output_ped.stem}",
+            "--make-bed",
+            "--out",
+            f"{final_prefix}"
+        ]
+
+        # debug
+        logger.info("Executing: " + " ".join(cmd))
+
+        subprocess.run(cmd, check=True)
 
     logger.info(f"{Path(__file__).name} ended")
 
@@ -83,9 +83,15 @@ def get_output_files(reportpath: str, working_dir: Path, assembly: str):
     '--create_samples',
     is_flag=True,
     help="Create a new SampleSheep or SampleGoat object if doesn't exist")
+@click.option(
+    '--write_bed',
+    is_flag=True,
+    help=(
+        'write the PLINK binary files directly (no text files and no '
+        'plink conversion)'))
 def main(
         dataset, snpfile, report, src_coding, breed_code, chip_name, assembly,
-        create_samples):
+        create_samples, write_bed):
     """
     Read genotype data from an Illumina report file and convert it
     to the desired assembly version using Illumina TOP coding
@@ -146,31 +152,43 @@ def main(
         chip_name=illumina_chip.name
     )
 
-    logger.info("Writing a new map file with updated coordinates")
-    report.update_mapfile(str(output_map))
-
-    # creating ped file for writing updated genotypes
-    report.update_pedfile(
-        output_ped,
-        dataset,
-        src_coding,
-        breed=breed_code,
-        create_samples=create_samples
-    )
-
-    # ok time to convert data in plink binary format
-    cmd = ["plink"] + PLINK_SPECIES_OPT[dataset.species] + [
-        "--file",
-        f"{output_dir / output_ped.stem}",
-        "--make-bed",
-        "--out",
-        f"{final_prefix}"
-    ]
-
-    # debug
-    logger.info("Executing: " + " ".join(cmd))
-
-    subprocess.run(cmd, check=True)
+    if write_bed:
+        # write binary files without the text files and plink
+        logger.info("Writing a new binary fileset with fixed genotype")
+        report.update_bedfile(
+            final_prefix,
+            dataset,
+            src_coding,
+            breed=breed_code,
+            create_samples=create_samples
+        )
+
+    else:
+        logger.info("Writing a new map file with updated coordinates")
+        report.update_mapfile(str(output_map))
+
+        # creating ped file for writing updated genotypes
+        report.update_pedfile(
+            output_ped,
+            dataset,
+            src_coding,
+            breed=breed_code,
+            create_samples=create_samples
+        )
+
+        # ok time to convert data in plink binary format
+        cmd = ["plink"] + PLINK_SPECIES_OPT[dataset.species] + [
+            "--file",
+            f"{output_dir / output_ped.stem}",
+            "--make-bed",
+            "--out",
+            f"{final_prefix}"
+        ]
+
+        # debug
+        logger.info("Executing: " + " ".join(cmd))
+
+        subprocess.run(cmd, check=True)
 
     logger.info(f"{Path(__file__).name} ended")
 
@@ -192,11 +192,17 @@ def deal_with_binary_plink(bfile: str, dataset: Dataset, assembly: str):
     help=(
         'set SNP as missing when there are coding errors '
         '(no more CodingException)'))
+@click.option(
+    '--write_bed',
+    is_flag=True,
+    help=(
+        'write the PLINK binary files directly (no text files and no '
+        'plink conversion)'))
 def main(
         file_, bfile, dataset, src_coding, chip_name, assembly,
         create_samples,
         sample_field, search_field, search_by_positions, src_version,
-        src_imported_from, ignore_coding_errors):
+        src_imported_from, ignore_coding_errors, write_bed):
     """
     Read genotype data from a PLINK file (text or binary) and convert it
     to the desired assembly version using Illumina TOP coding
@@ -274,32 +280,45 @@ def main(
             chip_name=illumina_chip.name
         )
 
-    logger.info("Writing a new map file with updated coordinates")
-    plinkio.update_mapfile(str(output_map))
-
-    logger.info("Writing a new ped file with fixed genotype")
-    plinkio.update_pedfile(
-        outputfile=output_ped,
-        dataset=dataset,
-        src_coding=src_coding,
-        create_samples=create_samples,
-        sample_field=sample_field,
-        ignore_coding_errors=ignore_coding_errors
-    )
+    if write_bed:
+        # write binary files without the text files and plink
+        logger.info("Writing a new binary fileset with fixed genotype")
+        plinkio.update_bedfile(
+            outputprefix=final_prefix,
+            dataset=dataset,
+            src_coding=src_coding,
+            create_samples=create_samples,
+            sample_field=sample_field,
+            ignore_coding_errors=ignore_coding_errors
+        )
+
+    else:
+        logger.info("Writing a new map file with updated coordinates")
+        plinkio.update_mapfile(str(output_map))
+
+        logger.info("Writing a new ped file with fixed genotype")
+        plinkio.update_pedfile(
+            outputfile=output_ped,
+            dataset=dataset,
+            src_coding=src_coding,
+            create_samples=create_samples,
+            sample_field=sample_field,
+            ignore_coding_errors=ignore_coding_errors
+        )
 
-    # ok time to convert data in plink binary format
-    cmd = ["plink"] + PLINK_SPECIES_OPT[dataset.species] + [
-        "--file",
-        f"{output_dir / output_ped.stem}",
-        "--make-bed",
-        "--out",
-        f"{final_prefix}"
-    ]
+        # ok time to convert data in plink binary format
+        cmd = ["plink"] + PLINK_SPECIES_OPT[dataset.species] + [
+            "--file",
+            f"{output_dir / output_ped.stem}",
+            "--make-bed",
+            "--out",
+            f"{final_prefix}"
+        ]
 
-    # debug
-    logger.info("Executing: " + " ".join(cmd))
+        # debug
+        logger.info("Executing: " + " ".join(cmd))
 
-    subprocess.run(cmd, check=True)
+        subprocess.run(cmd, check=True)
 
     logger.info(f"{Path(__file__).name} ended")
 
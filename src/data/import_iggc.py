@@ -11,17 +11,18 @@ Import data from International Goat Genome Consortium metadata files
 import csv
 import click
 import logging
+import functools
 
 from pathlib import Path
 from collections import namedtuple
 from dateutil.parser import parse as parse_date
-from mongoengine.errors import DoesNotExist
 
 from src.features.smarterdb import (
     global_connection, Location, VariantGoat)
 from src.features.utils import text_or_gzip_open, sanitize
-from src.features.illumina import IlluSNP
-from src.data.common import update_location, update_rs_id
+from src.features.illumina import IlluSNP, resolve_sequences
+from src.data.common import (
+    update_location, update_rs_id, VariantBatchLoader)
 
 
 logger = logging.getLogger(__name__)
@@ -36,7 +37,10 @@ def check_strand(strand):
         return None
 
 
-def update_stuff(variant, location, force_update, record, rs_column):
+def update_stuff(variant, location, force_update, record, rs_column) -> bool:
+    """Update variant with consortium location and rs_id. Returns True if
+    variant need to be saved"""
+
     # Should I update a location or not?
     update_variant = False
 
@@ -54,9 +58,43 @@ def update_stuff(variant, location, force_update, record, rs_column):
         if updated:
             update_variant = True
 
-    if update_variant:
-        # update variant with consortium data
-        variant.save()
+    return update_variant
+
+
+def update_consortium_variant(
+        variant, record, version, date, force_update, chrom_column,
+        pos_column, strand_column, sequence_column, rs_column,
+        illumina, illumina_strand, alleles) -> bool:
+    """Define a consortium location for variant and update it. Illumina
+    attributes are resolved in advance with
+    :py:func:`src.features.illumina.resolve_sequences`"""
+
+    logger.debug(f"Got variant {variant}")
+
+    if not illumina:
+        # raise the same exception of an unresolved sequence
+        IlluSNP(sequence=getattr(record, sequence_column), max_iter=25)
+
+    # create a location from input data
+    location = Location(
+        version=version,
+        chrom=getattr(record, chrom_column),
+        position=getattr(record, pos_column),
+        alleles=alleles,
+        strand=check_strand(getattr(record, strand_column)),
+        illumina=illumina,
+        illumina_strand=illumina_strand,
+        imported_from="consortium",
+        date=date,
+    )
+
+    logger.debug(f"Got Location {location}")
+
+    return update_stuff(variant, location, force_update, record, rs_column)
+
+
+def variant_not_found(snp_name):
+    logger.warning(f"SNP '{snp_name}' not found")
 
 
 @click.command()
@@ -122,7 +160,9 @@ def main(datafile, version, force_update, date, entry_column, chrom_column,
         header = [sanitize(col) for col in header]
         Record = namedtuple("Record", header)
 
-        for i, line in enumerate(reader):
+        records = []
+
+        for line in reader:
             # fix position columns
             try:
                 idx = header.index(pos_column)
@@ -134,44 +174,39 @@ def main(datafile, version, force_update, date, entry_column, chrom_column,
                 line[idx] = 0
 
             # make a record from csv line
-            record = Record._make(line)
+            records.append(Record._make(line))
+
+    # define illumina snps from sequences (all at once)
+    illumina, illumina_strand, alleles = [
+        array.tolist() for array in resolve_sequences(
+            [getattr(record, sequence_column) for record in records],
+            max_iter=25,
+            ignore_errors=True)]
 
+    with VariantBatchLoader(VariantGoat) as loader:
+        for i, record in enumerate(records):
             logger.debug(f"Processing {record}")
 
-            # get a variant
+            # get a variant and update it
             snp_name = getattr(record, entry_column)
 
-            try:
-                variant = VariantGoat.objects.get(name=snp_name)
-
-            except DoesNotExist:
-                logger.warning(f"SNP '{snp_name}' not found")
-                continue
-
-            logger.debug(f"Got variant {variant}")
-
-            # define an illumina snp from sequence
-            illusnp = IlluSNP(
-                sequence=getattr(record, sequence_column), max_iter=25)
-
-            logger.debug(f"Got SNP {illusnp}")
-
-            # create a location from input data
-            location = Location(
-                version=version,
-                chrom=getattr(record, chrom_column),
-                position=getattr(record, pos_column),
-                alleles=illusnp.alleles,
-                strand=check_strand(getattr(record, strand_column)),
-                illumina=illusnp.illumina,
-                illumina_strand=illusnp.strand,
-                imported_from="consortium",
-                date=date,
-            )
-
-            logger.debug(f"Got Location {location}")
-
-            update_stuff(variant, location, force_update, record, rs_column)
+            loader.update_variant(
+                search=[("name", snp_name)],
+                callback=functools.partial(
+                    update_consortium_variant,
+                    record=record,
+                    version=version,
+                    date=date,
+                    force_update=force_update,
+                    chrom_column=chrom_column,
+                    pos_column=pos_column,
+                    strand_column=strand_column,
+                    sequence_column=sequence_column,
+                    rs_column=rs_column,
+                    illumina=illumina[i],
+                    illumina_strand=illumina_strand[i],
+                    alleles=alleles[i]),
+                missing=functools.partial(variant_not_found, snp_name))
 
             if (i+1) % 5000 == 0:
                 logger.info(f"{i+1} variants processed")
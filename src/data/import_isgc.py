@@ -11,6 +11,7 @@ Import data from International Sheep Genome Consortium metadata files
 import csv
 import click
 import logging
+import functools
 
 from pathlib import Path
 from collections import namedtuple
@@ -19,7 +20,7 @@ from dateutil.parser import parse as parse_date
 from src.features.smarterdb import (
     global_connection, Location, complement, SmarterDBException, VariantSheep)
 from src.features.utils import text_or_gzip_open
-from src.data.common import update_location
+from src.data.common import update_location, VariantBatchLoader
 
 logger = logging.getLogger(__name__)
 
@@ -47,6 +48,40 @@ def check_strand(variant, alleles):
             f"Cannot determine an illumina strand for '{alleles}' ({variant})")
 
 
+def update_consortium_variant(
+        variant, record, version, date, force_update, chrom_column,
+        pos_column, alleles_column) -> bool:
+    """Add a consortium location to variant. Returns True if variant need
+    to be saved"""
+
+    # try to determine illumina_strand
+    illumina_strand = check_strand(
+        variant,
+        getattr(record, alleles_column))
+
+    # create a location from input data
+    location = Location(
+        version=version,
+        chrom=getattr(record, chrom_column),
+        position=getattr(record, pos_column),
+        illumina=getattr(record, alleles_column),
+        illumina_strand=illumina_strand,
+        imported_from="consortium",
+        date=date,
+    )
+
+    # Should I update a location or not?
+    variant, updated = update_location(
+        location, variant, force_update)
+
+    return updated
+
+
+def variant_not_found(name):
+    raise VariantSheep.DoesNotExist(
+        f"Variant '{name}' matching query does not exist.")
+
+
 @click.command()
 @click.option('--datafile', type=str, required=True)
 @click.option('--version', type=str, required=True)
@@ -93,7 +128,8 @@ def main(datafile, version, force_update, date,
     if date:
         date = parse_date(date)
 
-    with text_or_gzip_open(datafile) as handle:
+    with text_or_gzip_open(datafile) as handle, \
+            VariantBatchLoader(VariantSheep) as loader:
         reader = csv.reader(handle, delimiter=",")
         header = next(reader)
         Record = namedtuple("Record", header)
@@ -119,33 +155,20 @@ def main(datafile, version, force_update, date,
             # make a record from csv line
             record = Record._make(line)
 
-            # get a variant
-            variant = VariantSheep.objects.get(
-                name=getattr(record, entry_column))
-
-            # try to determine illumina_strand
-            illumina_strand = check_strand(
-                variant,
-                getattr(record, alleles_column))
-
-            # create a location from input data
-            location = Location(
-                version=version,
-                chrom=getattr(record, chrom_column),
-                position=getattr(record, pos_column),
-                illumina=getattr(record, alleles_column),
-                illumina_strand=illumina_strand,
-                imported_from="consortium",
-                date=date,
-            )
-
-            # Should I update a location or not?
-            variant, updated = update_location(
-                location, variant, force_update)
-
-            if updated:
-                # update variant with snpchimp data
-                variant.save()
+            # get a variant and update it
+            loader.update_variant(
+                search=[("name", getattr(record, entry_column))],
+                callback=functools.partial(
+                    update_consortium_variant,
+                    record=record,
+                    version=version,
+                    date=date,
+                    force_update=force_update,
+                    chrom_column=chrom_column,
+                    pos_column=pos_column,
+                    alleles_column=alleles_column),
+                missing=functools.partial(
+                    variant_not_found, getattr(record, entry_column)))
 
             if (i+1) % 5000 == 0:
                 logger.info(f"{i+1} variants processed")
@@ -9,10 +9,10 @@ Created on Tue Mar  2 10:38:05 2021
 import click
 import logging
 
-from src.features.illumina import read_Manifest
+from src.features.illumina import read_Manifest_columns
 from src.features.smarterdb import (
     Location, global_connection, SupportedChip)
-from src.data.common import get_variant_species, update_variant, new_variant
+from src.data.common import get_variant_species, VariantBatchLoader
 
 logger = logging.getLogger(__name__)
 
@@ -37,46 +37,54 @@ def main(species_class, manifest, chip_name, version, sender):
 
     logger.info(f"Reading from {manifest}")
 
-    # grep a sample SNP
-    for i, record in enumerate(read_Manifest(manifest, delimiter=",")):
-        # update chip data indipendentely if it is an update or not
-        illumina_chip.n_of_snps += 1
-
-        # create a location object
-        location = Location(
-            version=version,
-            chrom=record.chr,
-            position=record.mapinfo,
-            illumina=record.snp,
-            illumina_strand=record.ilmnstrand,
-            strand=record.sourcestrand,
-            imported_from="manifest",
-            date=record.date,
-        )
-
-        variant = VariantSpecie(
-            chip_name=[chip_name],
-            name=record.name,
-            sequence={chip_name: record.sourceseq},
-            sender=sender
-        )
-
-        # search for a snp in database (relying on name)
-        qs = VariantSpecie.objects.filter(name=record.name)
-
-        if qs.count() == 1:
-            update_variant(qs, variant, location)
-
-        elif qs.count() == 0:
-            new_variant(variant, location)
-
-        if (i+1) % 5000 == 0:
-            logger.info(f"{i+1} variants processed")
+    # the manifest columns required to define variants
+    columns = [
+        "name", "chr", "mapinfo", "snp", "ilmnstrand", "sourcestrand",
+        "sourceseq", "date"]
+
+    n_records = 0
+
+    with VariantBatchLoader(VariantSpecie) as loader:
+        # read manifest in batches of columns
+        for batch in read_Manifest_columns(manifest, delimiter=","):
+            for (name, chrom, position, snp, ilmnstrand, sourcestrand,
+                    sourceseq, date) in zip(
+                        *[batch[column] for column in columns]):
+                n_records += 1
+
+                # update chip data indipendentely if it is an update or not
+                illumina_chip.n_of_snps += 1
+
+                # create a location object
+                location = Location(
+                    version=version,
+                    chrom=chrom,
+                    position=position,
+                    illumina=snp,
+                    illumina_strand=ilmnstrand,
+                    strand=sourcestrand,
+                    imported_from="manifest",
+                    date=date,
+                )
+
+                variant = VariantSpecie(
+                    chip_name=[chip_name],
+                    name=name,
+                    sequence={chip_name: sourceseq},
+                    sender=sender
+                )
+
+                # search for a snp in database (relying on name)
+                loader.add_variant(
+                    variant, location, search=[("name", name)])
+
+                if n_records % 5000 == 0:
+                    logger.info(f"{n_records} variants processed")
 
     # update chip info
     illumina_chip.save()
 
-    logger.info(f"{i+1} variants processed")
+    logger.info(f"{n_records} variants processed")
 
     logger.info("Completed")
 
@@ -17,11 +17,12 @@ import itertools
 from click_option_group import optgroup, RequiredMutuallyExclusiveOptionGroup
 from pathlib import Path
 import pandas as pd
+from mongoengine.queryset import transform
+from pymongo import UpdateMany
 
 from src.features.smarterdb import global_connection, Dataset, SEX
 from src.data.common import (
-    deal_with_datasets, pandas_open, get_sample_species,
-    deal_with_sex_and_alias)
+    deal_with_datasets, pandas_open, get_sample_species)
 from src.features.utils import sanitize
 
 logger = logging.getLogger(__name__)
@@ -42,43 +43,85 @@ def strip_multiple_values(value: str):
     return results
 
 
-def get_locations(row: pd.Series, columns: dict, label: str):
-    locations = None
+def get_column(data: pd.DataFrame, column: str) -> pd.Series:
+    """Return a column as an object Series with None instead of NA values.
+    A column not in data is returned as a Series of None"""
+
+    if column and column in data.columns:
+        values = data[column].astype(object)
+        return values.where(values.notna(), None)
+
+    return pd.Series([None] * len(data), index=data.index, dtype=object)
+
+
+def get_locations(data: pd.DataFrame, columns: dict) -> pd.Series:
+    """Return the (longitude, latitude) locations of each row"""
+
+    locations = get_column(data, None)
 
     if columns["latitude_column"] and columns["longitude_column"]:
-        latitude = row.get(columns["latitude_column"])
-        longitude = row.get(columns["longitude_column"])
+        latitude = get_column(data, columns["latitude_column"])
+        longitude = get_column(data, columns["longitude_column"])
+
+        mask = latitude.notna() & longitude.notna()
 
-        if pd.notna(latitude) and pd.notna(longitude):
-            latitude = strip_multiple_values(latitude)
-            longitude = strip_multiple_values(longitude)
+        latitude = latitude[mask].map(strip_multiple_values)
+        longitude = longitude[mask].map(strip_multiple_values)
 
-            locations = list(itertools.zip_longest(longitude, latitude))
+        locations[mask] = pd.Series(
+            [[list(point) for point in itertools.zip_longest(lon, lat)]
+             for lon, lat in zip(longitude, latitude)],
+            index=latitude.index,
+            dtype=object)
 
-        logger.debug(f"Got locations '{locations}' for '{label}'")
+        logger.debug(f"Got {mask.sum()} locations")
 
     return locations
 
 
-def get_metadata(row: pd.Series, columns: dict, label: str):
-    metadata = dict()
+def get_metadata(data: pd.DataFrame, columns: dict) -> pd.Series:
+    """Return the metadata dictionary of each row"""
+
+    # the metadata keys and their columns
+    metadata_columns = dict()
 
     # set notes column with a fixed attribute
     if columns["notes_column"]:
-        notes = row.get(columns["notes_column"])
-        if pd.notnull(notes):
-            metadata["notes"] = notes
-
-            logger.debug(f"Got notes: '{notes}' for '{label}'")
+        metadata_columns["notes"] = columns["notes_column"]
 
     if columns["metadata_column"]:
         for column in columns["metadata_column"]:
-            if pd.notnull(row.get(column)):
-                metadata[sanitize(column)] = row.get(column)
+            metadata_columns[sanitize(column)] = column
+
+    values = [
+        get_column(data, column).tolist()
+        for column in metadata_columns.values()]
+
+    # ignore missing values
+    metadata = [
+        {key: value
+         for key, value in zip(metadata_columns, record)
+         if value is not None}
+        for record in zip(*values)] if values else [dict() for _ in data.index]
+
+    logger.debug(f"Got metadata for {len(metadata)} records")
+
+    return pd.Series(metadata, index=data.index, dtype=object)
+
+
+def get_sex(data: pd.DataFrame, columns: dict) -> pd.Series:
+    """Return the SEX of each row, or None if sex is unknown"""
+
+    sex = get_column(data, None)
+
+    if columns["sex_column"]:
+        sex = data[columns["sex_column"]].astype(str).str.strip().map(
+            SEX.from_string).astype(object)
 
-        logger.debug(f"Got metadata: '{metadata}' for '{label}'")
+        # drop sex column if unknown
+        sex = sex.where(sex != SEX.UNKNOWN, None)
 
-    return metadata
+    return sex
 
 
 def add_metadata_by_breed(
@@ -87,26 +130,20 @@ def add_metadata_by_breed(
         columns: dict):
     """Add metadata relying on breed name (column)"""
 
-    for index, row in data.iterrows():
-        breed = row.get(columns["breed_column"])
+    breeds = data[columns["breed_column"]]
 
-        # get additional columns for breed
-        locations = get_locations(row, columns, breed)
-        metadata = get_metadata(row, columns, breed)
+    # get additional columns for breed
+    locations = get_locations(data, columns)
+    metadata = get_metadata(data, columns)
 
-        # mind to custom species
-        species = None
+    # mind to custom species
+    species = get_column(data, columns["species_column"])
 
-        if columns["species_column"]:
-            species = row.get(columns["species_column"])
+    operations = [
+        update_samples(dst_dataset, {'breed': breed}, *values)
+        for breed, *values in zip(breeds, species, locations, metadata)]
 
-        logger.debug(
-            f"Got breed: '{breed}', locations: {locations}, "
-            f"metadata: {metadata}"
-        )
-
-        update_samples(
-            dst_dataset, {'breed': breed}, species, locations, metadata)
+    write_samples(dst_dataset, operations)
 
 
 def add_metadata_by_sample(
@@ -116,37 +153,29 @@ def add_metadata_by_sample(
         id_field="id_column"):
     """Add metadata relying on original_id or alias"""
 
-    for index, row in data.iterrows():
-        sample_id = str(row.get(columns[id_field]))
-
-        # get additional columns for original_id
-        locations = get_locations(row, columns, sample_id)
-        metadata = get_metadata(row, columns, sample_id)
-
-        # mind to custom species
-        species = None
-
-        if columns["species_column"]:
-            species = row.get(columns["species_column"])
+    sample_ids = data[columns[id_field]].astype(str)
 
-        sex = None
+    # get additional columns for original_id
+    locations = get_locations(data, columns)
+    metadata = get_metadata(data, columns)
+    sex = get_sex(data, columns)
 
-        if columns["sex_column"]:
-            sex, _ = deal_with_sex_and_alias(columns["sex_column"], None, row)
+    # mind to custom species
+    species = get_column(data, columns["species_column"])
 
-        logger.debug(
-            f"Got {id_field}: '{sample_id}', locations: {locations}, "
-            f"sex: {sex}, metadata: {metadata}"
-        )
+    # prepare query field
+    if id_field == 'id_column':
+        field = 'original_id'
 
-        # prepare query kwargs
-        if id_field == 'id_column':
-            query = {'original_id': sample_id}
+    elif id_field == 'alias_column':
+        field = 'alias'
 
-        elif id_field == 'alias_column':
-            query = {'alias': sample_id}
+    operations = [
+        update_samples(dst_dataset, {field: sample_id}, *values)
+        for sample_id, *values in zip(
+            sample_ids, species, locations, metadata, sex)]
 
-        update_samples(dst_dataset, query, species, locations, metadata, sex)
+    write_samples(dst_dataset, operations)
 
 
 def update_samples(
@@ -155,39 +184,66 @@ def update_samples(
         species: str,
         locations: list,
         metadata: dict,
-        sex: SEX = None):
+        sex: SEX = None) -> UpdateMany:
+    """Return the update which set the provided fields in all the samples of
+    dst_dataset matching query, or None if there's nothing to set. Metadata
+    keys are set one by one, so the other keys of a sample are preserved"""
 
     # mind dataset species
     SampleSpecie = get_sample_species(dst_dataset.species)
 
-    # ok iterate over all samples of this dataset
-    for sample in SampleSpecie.objects.filter(
-            dataset=dst_dataset, **query):
+    # set only the provided features
+    update = dict()
+
+    if locations:
+        update["set__locations"] = locations
+
+    if species:
+        update["set__species"] = species
+
+    if sex:
+        update["set__sex"] = sex
+
+    # convert values and field names as mongoengine does
+    update = transform.update(SampleSpecie, **update)
+    update.setdefault("$set", dict())
 
-        # set locations features
-        if locations:
-            sample.locations = locations
+    if metadata:
+        for key, value in metadata.items():
+            update["$set"][f"metadata.{key}"] = value
 
-        # set metadata if necessary
-        if metadata:
-            sample.metadata = metadata
+    if not update["$set"]:
+        return None
 
-        # set species if any
-        if species:
-            sample.species = species
+    logger.debug(
+        f"Update samples with {query} with species: "
+        f"'{species}', locations: '{locations}', sex: '{sex}' "
+        f"and metadata: '{metadata}'")
+
+    return UpdateMany(
+        transform.query(SampleSpecie, dataset=dst_dataset, **query),
+        update)
+
+
+def write_samples(dst_dataset: Dataset, operations: list) -> int:
+    """Send all the sample updates with a single bulk write. Returns the
+    number of updated samples"""
+
+    # ignore the rows without values
+    operations = [operation for operation in operations if operation]
+
+    if not operations:
+        return 0
+
+    # mind dataset species
+    SampleSpecie = get_sample_species(dst_dataset.species)
 
-        # set sex if received
-        if sex:
-            sample.sex = sex
+    # keep rows order: the last row matching a sample wins
+    result = SampleSpecie._get_collection().bulk_write(operations)
 
-        if any([locations, metadata, species, sex]):
-            logger.info(
-                f"Updating '{sample}' with species: '{sample.species}', "
-                f"locations: '{locations}', sex: '{sex}' "
-                f"and metadata: '{metadata}'")
+    logger.info(f"Updated {result.modified_count} samples")
 
-            # update sample
-            sample.save()
+    return result.modified_count
 
 
 @click.command()
@@ -12,38 +12,18 @@ individual
 import click
 import logging
 
-import numpy as np
 from click_option_group import optgroup, RequiredMutuallyExclusiveOptionGroup
 from pathlib import Path
 
-from src.features.smarterdb import global_connection, Phenotype
-from src.data.common import pandas_open, deal_with_datasets, get_sample_species
+from src.features.smarterdb import global_connection
+from src.data.common import (
+    pandas_open, deal_with_datasets, get_sample_species, update_phenotype,
+    write_phenotypes)
 from src.features.utils import sanitize
 
 logger = logging.getLogger(__name__)
 
 
-def create_or_update_phenotype(
-        sample, phenotype: dict):
-
-    if not phenotype:
-        logger.debug(f"Skipping {sample}: nothing to update")
-        return
-
-    if not sample.phenotype:
-        logger.debug(f"Create a new phenotype for {sample}")
-        sample.phenotype = Phenotype()
-
-    for key, value in phenotype.items():
-        setattr(sample.phenotype, key, value)
-
-    logger.info(
-        f"Updating '{sample}' phenotype with '{sample.phenotype}'")
-
-    # update sample
-    sample.save()
-
-
 @click.command()
 @click.option(
     '--src_dataset', type=str, required=True,
@@ -99,23 +79,21 @@ def main(src_dataset, dst_dataset, datafile, sheet_name, breed_column,
     # open data with pandas
     data = pandas_open(datapath, na_values=na_values, sheet_name=sheet_name)
 
-    # process unique ids
-    for id_ in data[id_column].unique():
-        subset = data[data[id_column] == id_]
-
-        phenotype = {}
-
-        for column in columns:
-            phenotype[sanitize(column)] = subset[column] \
-                .replace({np.nan: None}).to_list()
+    # collect all the values of the same id in lists
+    values = data[list(columns)].astype(object)
+    values = values.where(values.notna(), None)
+    values.columns = [sanitize(column) for column in columns]
 
-        original_id = str(id_)
+    phenotypes = values.groupby(data[id_column], sort=False).agg(list)
 
-        # ok iterate over all samples of this dataset
-        for sample in SampleSpecie.objects.filter(
-                dataset=dst_dataset, original_id=original_id):
+    # update all samples of this dataset
+    operations = [
+        update_phenotype(
+            SampleSpecie, dst_dataset, {'original_id': str(id_)}, phenotype)
+        for id_, phenotype in zip(
+            phenotypes.index, phenotypes.to_dict(orient="records"))]
 
-            create_or_update_phenotype(sample, phenotype)
+    write_phenotypes(SampleSpecie, operations)
 
     logger.info(f"{Path(__file__).name} ended")
 
@@ -8,21 +8,22 @@ Created on Tue May 11 12:11:45 2021
 
 import click
 import logging
+import collections
 
 from click_option_group import optgroup, RequiredMutuallyExclusiveOptionGroup
 from pathlib import Path
 import pandas as pd
 
-from src.features.smarterdb import global_connection, Dataset, Phenotype, Breed
+from src.features.smarterdb import global_connection, Dataset, Breed
 from src.data.common import (
-    deal_with_datasets, pandas_open, get_sample_species)
+    deal_with_datasets, pandas_open, get_sample_species, update_phenotype,
+    write_phenotypes)
 from src.features.utils import sanitize
 
 logger = logging.getLogger(__name__)
 
 
-def get_named_columns(
-        row: pd.Series, columns: dict, label: str):
+def get_named_columns(data: pd.DataFrame, columns: dict) -> pd.DataFrame:
     """Function to get info from column which are declared attributes in
     smarterdb"""
 
@@ -34,128 +35,125 @@ def get_named_columns(
         'length': 'length_column',
     }
 
-    results = dict()
+    results = pd.DataFrame(index=data.index)
 
     for key, column_name in attr2keys.items():
-        if columns[column_name]:
-            value = row.get(columns[column_name])
-            if pd.notnull(value) and pd.notna(value):
-                logger.debug(
-                    f"Got '{key}': '{value}' for '{label}'")
-                results[key] = value
+        if columns[column_name] and columns[column_name] in data.columns:
+            results[key] = data[columns[column_name]]
+
+    logger.debug(f"Got {list(results.columns)} named columns")
 
     return results
 
 
-def get_additional_column(row: pd.Series, columns: dict, label: str):
-    additional_column = dict()
+def get_additional_column(
+        data: pd.DataFrame, columns: dict) -> pd.DataFrame:
+    additional_column = pd.DataFrame(index=data.index)
 
     if columns["additional_column"]:
         for column in columns["additional_column"]:
-            if pd.notnull(row.get(column)):
-                additional_column[sanitize(column)] = row.get(column)
+            if column in data.columns:
+                additional_column[sanitize(column)] = data[column]
 
         logger.debug(
-            f"Got additional_column: '{additional_column}' for '{label}'")
+            f"Got additional_column: '{list(additional_column.columns)}'")
 
     return additional_column
 
 
-def create_or_update_phenotype(
-        sample, named_columns: dict, additional_column: dict):
+def update_value(value):
+    # capitalize only if is a string
+    if isinstance(value, str):
+        value = value.capitalize()
 
-    if not additional_column and not named_columns:
-        logger.debug(f"Skipping {sample}: nothing to update")
-        return
+    return value
 
-    if not sample.phenotype:
-        logger.debug(f"Create a new phenotype for {sample}")
-        sample.phenotype = Phenotype()
 
-    def update_value(value):
-        # capitalize only if is a string
-        if isinstance(value, str):
-            value = value.capitalize()
+def get_phenotypes(
+        data: pd.DataFrame, columns: dict, key: pd.Series) -> pd.Series:
+    """Merge named and additional columns in a phenotype dictionary for each
+    unique key. When a key is repeated, the last not null value of each
+    column is considered"""
 
-        return value
+    # set all the other not managed phenotypes colums
+    values = pd.concat(
+        [get_named_columns(data, columns),
+         get_additional_column(data, columns)], axis=1)
 
-    for key, value in named_columns.items():
-        setattr(sample.phenotype, key, update_value(value))
+    # an additional column could override a named column
+    values = values.loc[:, ~values.columns.duplicated(keep="last")]
 
-    # set all the other not managed phenotypes colums
-    if additional_column:
-        for key, value in additional_column.items():
-            setattr(sample.phenotype, key, update_value(value))
+    values = values.groupby(key, sort=False).last().astype(object)
 
-    logger.info(
-        f"Updating '{sample}' phenotype with '{sample.phenotype}'")
+    for column in values.columns:
+        values[column] = values[column].map(update_value)
 
-    # update sample
-    sample.save()
+    values = values.where(values.notna(), None)
 
+    # ignore missing values
+    phenotypes = [
+        {name: value for name, value in record.items() if value is not None}
+        for record in values.to_dict(orient="records")]
 
-def add_phenotype_by_breed(
+    return pd.Series(phenotypes, index=values.index, dtype=object)
+
+
+def add_phenotype_by_column(
         data: pd.DataFrame,
         dst_dataset: Dataset,
-        columns: dict):
-    """Add metadata relying on breed name (column)"""
+        columns: dict,
+        key: pd.Series,
+        field: str):
+    """Add phenotypes to all the samples of dst_dataset with the same field
+    value of key column with a single bulk write"""
 
     logger.debug(f"Received columns: {columns}")
 
     # mind dataset species
     SampleSpecie = get_sample_species(dst_dataset.species)
 
-    for index, row in data.iterrows():
-        logger.debug(f"{index}, {row}")
-        breed = row.get(columns["breed_column"])
+    phenotypes = get_phenotypes(data, columns, key)
 
-        # check that this breed exists
-        qs = Breed.objects.filter(name=breed, species=dst_dataset.species)
+    # update all samples of this dataset
+    operations = [
+        update_phenotype(
+            SampleSpecie, dst_dataset, {field: value}, phenotype)
+        for value, phenotype in phenotypes.items()]
 
-        if qs.count() != 1:
-            raise Exception(f"Breed '{breed}' not found in database!")
-
-        # get columns modelled in smarter database
-        named_columns = get_named_columns(row, columns, breed)
-
-        # get additional columns for breed
-        additional_column = get_additional_column(row, columns, breed)
-
-        # ok iterate over all samples of this dataset
-        for sample in SampleSpecie.objects.filter(
-                dataset=dst_dataset, breed=breed):
+    write_phenotypes(SampleSpecie, operations)
 
-            create_or_update_phenotype(
-                sample, named_columns, additional_column)
 
-
-def add_phenotype_by_sample(
+def add_phenotype_by_breed(
         data: pd.DataFrame,
         dst_dataset: Dataset,
         columns: dict):
     """Add metadata relying on breed name (column)"""
 
-    logger.debug(f"Received columns: {columns}")
+    breeds = data[columns["breed_column"]]
 
-    # mind dataset species
-    SampleSpecie = get_sample_species(dst_dataset.species)
+    # check that breeds exist
+    found = Breed.objects.filter(
+        name__in=breeds.unique().tolist(),
+        species=dst_dataset.species).scalar("name")
+    found = collections.Counter(found)
 
-    for index, row in data.iterrows():
-        logger.debug(f"{index}, {row}")
-        original_id = str(row.get(columns["id_column"]))
+    for breed in breeds.unique():
+        if found[breed] != 1:
+            raise Exception(f"Breed '{breed}' not found in database!")
 
-        # get columns modelled in smarter database
-        named_columns = get_named_columns(row, columns, original_id)
+    add_phenotype_by_column(data, dst_dataset, columns, breeds, 'breed')
 
-        # get additional columns for breed
-        additional_column = get_additional_column(row, columns, original_id)
 
-        # ok iterate over all samples of this dataset
-        for sample in SampleSpecie.objects.filter(
-                dataset=dst_dataset, original_id=original_id):
+def add_phenotype_by_sample(
+        data: pd.DataFrame,
+        dst_dataset: Dataset,
+        columns: dict):
+    """Add metadata relying on breed name (column)"""
+
+    original_ids = data[columns["id_column"]].astype(str)
 
-            create_or_update_phenotype(
-                sample, named_columns, additional_column)
+    add_phenotype_by_column(
+        data, dst_dataset, columns, original_ids, 'original_id')
 
 
 def add_phenotype_by_alias(
@@ -164,27 +162,9 @@ def add_phenotype_by_alias(
         columns: dict):
     """Add metadata relying on alias (column)"""
 
-    logger.debug(f"Received columns: {columns}")
-
-    # mind dataset species
-    SampleSpecie = get_sample_species(dst_dataset.species)
-
-    for index, row in data.iterrows():
-        logger.debug(f"{index}, {row}")
-        original_id = str(row.get(columns["alias_column"]))
-
-        # get columns modelled in smarter database
-        named_columns = get_named_columns(row, columns, original_id)
-
-        # get additional columns for breed
-        additional_column = get_additional_column(row, columns, original_id)
-
-        # ok iterate over all samples of this dataset
-        for sample in SampleSpecie.objects.filter(
-                dataset=dst_dataset, alias=original_id):
+    aliases = data[columns["alias_column"]].astype(str)
 
-            create_or_update_phenotype(
-                sample, named_columns, additional_column)
+    add_phenotype_by_column(data, dst_dataset, columns, aliases, 'alias')
 
 
 @click.command()
@@ -16,21 +16,23 @@ import click
 import logging
 import functools
 
+from typing import TYPE_CHECKING
 from pathlib import Path
 from click_option_group import (
     optgroup, RequiredMutuallyExclusiveOptionGroup,
     MutuallyExclusiveOptionGroup)
 from mongoengine.errors import DoesNotExist
 
-from pandas.core.series import Series
-
 from src.data.common import (
     deal_with_datasets, pandas_open, get_sample_species,
     deal_with_sex_and_alias)
 from src.features.smarterdb import (
-    global_connection, Breed, get_or_create_sample, get_sample_type,
+    global_connection, Breed, get_sample_type, bulk_create_samples,
     SmarterDBException)
-from src.features.utils import UnknownCountry, countries
+from src.features.utils import UnknownCountry, get_countries
+
+if TYPE_CHECKING:
+    from pandas import Series
 
 logger = logging.getLogger(__name__)
 
@@ -52,7 +54,7 @@ def find_country(country: str):
         return UnknownCountry()
 
     # transform country string with pycountry
-    fuzzy = countries.search_fuzzy(country)[0]
+    fuzzy = get_countries().search_fuzzy(country)[0]
 
     logger.info(f"Found {fuzzy} for {country}")
 
@@ -60,7 +62,7 @@ def find_country(country: str):
 
 
 def deal_with_breeds(
-        code: str, code_column: str, dst_dataset: str, row: Series):
+        code: str, code_column: str, dst_dataset: str, row: "Series"):
     """
     Determine breeds and code for each sample in dataset or apply the same
     stuff to each samples
@@ -113,7 +115,8 @@ def deal_with_breeds(
     return breed, code
 
 
-def deal_with_countries(country: str, country_column: str, row: Series):
+def deal_with_countries(
+        country: str, country_column: str, row: "Series"):
     """
     Search for countries relying on dataset or by input value
 
@@ -245,6 +248,17 @@ def main(
 
     logger.info(f"Got columns: {data.columns.to_list()}")
 
+    # track samples already in database. Samples are identified by
+    # original_id, breed_code and alias in the destination dataset
+    samples = dict()
+
+    for sample in SampleSpecie.objects(dataset=dst_dataset):
+        key = (sample.original_id, sample.breed_code, sample.alias)
+        samples.setdefault(key, []).append(sample)
+
+    # the samples which need to be created
+    new_samples = []
+
     for index, row in data.iterrows():
         logger.debug(f"Got: {row.to_list()}")
 
@@ -279,21 +293,42 @@ def main(
             )
             continue
 
-        # get or create a new Sample Obj
-        sample, created = get_or_create_sample(
-            SampleSpecies=SampleSpecie,
+        # coerce alias as string (if any)
+        if alias:
+            alias = str(alias)
+
+        key = (original_id, breed.code, alias)
+
+        if key in samples:
+            if len(samples[key]) > 1:
+                raise SmarterDBException(
+                    f"Got {len(samples[key])} results for '{original_id}'")
+
+            logger.debug(f"Sample '{original_id}', alias: '{alias}' "
+                         "found in database")
+            continue
+
+        # define a new Sample Obj. Samples will be inserted all together
+        logger.info(f"Registering sample '{original_id}' in database")
+
+        sample = SampleSpecie(
             original_id=original_id,
-            dataset=dst_dataset,
-            type_=type_,
-            breed=breed,
             country=country.name,
             species=species,
+            breed=breed.name,
+            breed_code=breed.code,
+            dataset=dst_dataset,
+            type_=type_,
             chip_name=chip_name,
             sex=sex,
-            alias=alias)
+            alias=alias
+        )
+
+        samples[key] = [sample]
+        new_samples.append(sample)
 
-        if created:
-            logger.info(f"Sample '{sample}' added to database")
+    for sample in bulk_create_samples(SampleSpecie, new_samples):
+        logger.info(f"Sample '{sample}' added to database")
 
     logger.info(f"{Path(__file__).name} ended")
 
@@ -8,17 +8,45 @@ Created on Tue Mar  2 10:38:05 2021
 
 import click
 import logging
+import functools
 
-from mongoengine.errors import DoesNotExist
-
-from src.features.snpchimp import read_snpChimp
+from src.features.snpchimp import read_snpChimp_columns
 from src.features.smarterdb import (
     Location, global_connection)
-from src.data.common import get_variant_species, update_location, update_rs_id
+from src.data.common import (
+    get_variant_species, update_location, update_rs_id, VariantBatchLoader)
 
 logger = logging.getLogger(__name__)
 
 
+def update_snpchimp_variant(variant, location, rs, VariantSpecie) -> bool:
+    """Update a variant with SNPchiMp location and rs_id. Returns True if
+    variant need to be saved"""
+
+    # Should I update a location or not?
+    update_variant = False
+
+    variant, updated = update_location(location, variant)
+
+    if updated:
+        update_variant = True
+
+    if rs:
+        variant, updated = update_rs_id(
+            # create a fake variant with rs_id to use this method
+            VariantSpecie(rs_id=[rs]),
+            variant)
+
+        if updated:
+            update_variant = True
+
+    return update_variant
+
+
+def skip_record(snp_name):
+    logger.warning(f"Skipping {snp_name}: variant not found in database")
+
+
 @click.command()
 @click.option('--species_class', type=str, required=True)
 @click.option('--snpchimp', type=str, required=True)
@@ -31,57 +59,50 @@ def main(species_class, snpchimp, version):
 
     logger.info(f"Reading from {snpchimp}")
 
-    # grep a sample SNP
-    for i, snpchimp in enumerate(read_snpChimp(snpchimp)):
-        # get a variant from database (I suppose to have a variant for
-        # each snpchimp record)
-        try:
-            variant = VariantSpecie.objects.get(name=snpchimp.snp_name)
-
-        except DoesNotExist as exc:
-            logger.warning(f"Skipping {snpchimp}: {exc}")
-
-        else:
-            # read location from SnpChimp data
-            location = Location(
-                ss_id=snpchimp.ss,
-                version=version,
-                chrom=snpchimp.chromosome,
-                position=snpchimp.position,
-                illumina_top=snpchimp.alleles_a_b_top,
-                illumina_forward=snpchimp.alleles_a_b_forward,
-                illumina_strand=snpchimp.strand,
-                strand=snpchimp.orient,
-                alleles=snpchimp.alleles,
-                imported_from="SNPchiMp v.3"
-            )
-
-            # Should I update a location or not?
-            update_variant = False
-
-            variant, updated = update_location(location, variant)
-
-            if updated:
-                update_variant = True
-
-            if snpchimp.rs:
-                variant, updated = update_rs_id(
-                    # create a fake variant with rs_id to use this method
-                    VariantSpecie(rs_id=[snpchimp.rs]),
-                    variant)
-
-                if updated:
-                    update_variant = True
-
-            if update_variant:
-                # update variant with snpchimp data
-                variant.save()
-
-        finally:
-            if (i+1) % 5000 == 0:
-                logger.info(f"{i+1} variants processed")
-
-    logger.info(f"{i+1} variants processed")
+    # the SNPchiMp columns required to define locations
+    columns = [
+        "snp_name", "ss", "chromosome", "position", "alleles_a_b_top",
+        "alleles_a_b_forward", "strand", "orient", "alleles", "rs"]
+
+    n_records = 0
+
+    with VariantBatchLoader(VariantSpecie) as loader:
+        # read SNPchiMp data in chunks of columns
+        for chunk in read_snpChimp_columns(snpchimp):
+            for (snp_name, ss, chrom, position, illumina_top,
+                    illumina_forward, illumina_strand, strand, alleles,
+                    rs) in zip(*[chunk[column] for column in columns]):
+                n_records += 1
+
+                # read location from SnpChimp data
+                location = Location(
+                    ss_id=ss,
+                    version=version,
+                    chrom=chrom,
+                    position=position,
+                    illumina_top=illumina_top,
+                    illumina_forward=illumina_forward,
+                    illumina_strand=illumina_strand,
+                    strand=strand,
+                    alleles=alleles,
+                    imported_from="SNPchiMp v.3"
+                )
+
+                # update a variant from database (I suppose to have a
+                # variant for each snpchimp record)
+                loader.update_variant(
+                    search=[("name", snp_name)],
+                    callback=functools.partial(
+                        update_snpchimp_variant,
+                        location=location,
+                        rs=rs,
+                        VariantSpecie=VariantSpecie),
+                    missing=functools.partial(skip_record, snp_name))
+
+                if n_records % 5000 == 0:
+                    logger.info(f"{n_records} variants processed")
+
+    logger.info(f"{n_records} variants processed")
 
     logger.info("Completed")
 
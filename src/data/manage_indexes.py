@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 15:58:40 2026
+
+@author: Paolo Cozzi <paolo.cozzi@ibba.cnr.it>
+
+Create and verify the indexes of SMARTER variants collections, and check
+that the queries used to search variants don't scan the whole collection
+"""
+
+import click
+import logging
+
+from pathlib import Path
+
+from src.features.smarterdb import global_connection, SmarterDBException
+from src.features.indexes import (
+    ensure_variant_indexes, get_hot_queries, explain_queries)
+from src.data.common import (
+    WORKING_ASSEMBLIES, AssemblyConf, get_variant_species)
+
+logger = logging.getLogger(__name__)
+
+
+@click.command()
+@click.option(
+    '--species_class',
+    type=str,
+    required=True,
+    help="The SMARTER assembly species (Goat or Sheep)")
+@click.option(
+    '--assembly',
+    type=str,
+    help="Explain queries for this destination assembly")
+@click.option(
+    '--src_version',
+    type=str,
+    help="Source assembly version")
+@click.option(
+    '--src_imported_from',
+    type=str,
+    help="Source assembly imported_from")
+@click.option(
+    '--chip_name',
+    type=str,
+    help="Explain queries using this SMARTER SupportedChip name")
+@click.option(
+    '--drop_stale',
+    is_flag=True,
+    help="Drop indexes not defined in SMARTER variant classes")
+def main(species_class, assembly, src_version, src_imported_from, chip_name,
+         drop_stale):
+    """
+    Create the indexes of SMARTER variants collection. If an assembly is
+    provided, report the query plans used to search variants and fail if
+    a query does a collection scan
+    """
+
+    logger.info(f"{Path(__file__).name} started")
+
+    VariantSpecie = get_variant_species(species_class)
+
+    ensure_variant_indexes(VariantSpecie, drop_stale)
+
+    if assembly:
+        # find assembly configuration
+        if assembly not in WORKING_ASSEMBLIES:
+            raise SmarterDBException(
+                f"assembly {assembly} not managed by smarter")
+
+        src_assembly, dst_assembly = WORKING_ASSEMBLIES[assembly], None
+
+        if src_version and src_imported_from:
+            dst_assembly = src_assembly
+            src_assembly = AssemblyConf(src_version, src_imported_from)
+            logger.info(f"Got '{src_assembly} as source assembly'")
+
+        queries = get_hot_queries(
+            VariantSpecie, src_assembly, dst_assembly, chip_name)
+
+        explain_queries(queries)
+
+    logger.info(f"{Path(__file__).name} ended")
+
+
+if __name__ == '__main__':
+    log_fmt = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    logging.basicConfig(level=logging.INFO, format=log_fmt)
+
+    # connect to database
+    global_connection()
+
+    main()
@@ -38,15 +38,34 @@ logger = logging.getLogger(__name__)
     required=True,
     help="Search processed genotypes belonging to this assembly"
 )
-def main(species_class, assembly):
+@click.option(
+    '--use_plink',
+    is_flag=True,
+    help="Merge genotypes by calling 'plink --merge-list'"
+)
+@click.option(
+    '--incremental',
+    is_flag=True,
+    help=(
+        "Merge only new or changed datasets into the existing merged "
+        "genotypes"
+    )
+)
+def main(species_class, assembly, use_plink, incremental):
     """
     Search for processed genotype files for a certain species in
-    ``data/processed`` folder and then call PLINK to join all genotypes
-    in the same dataset
+    ``data/processed`` folder and then join all genotypes in the same
+    dataset. Genotypes are merged in process, or by calling PLINK with
+    ``--use_plink``. With ``--incremental``, only the samples of new or
+    changed datasets are merged with the existing merged genotypes
     """
 
     logger.info(f"{Path(__file__).name} started")
 
+    if use_plink and incremental:
+        raise click.UsageError(
+            "--incremental can't be used with --use_plink")
+
     # find assembly configuration
     if assembly not in WORKING_ASSEMBLIES:
         raise Exception(f"assembly {assembly} not managed by smarter")
@@ -59,6 +78,9 @@ def main(species_class, assembly):
     )
     merge_file = get_interim_dir() / smarter_tag
 
+    # track the files to merge and their datasets
+    prefixes, datasets = [], []
+
     with merge_file.open(mode="w") as handle:
         for dataset in Dataset.objects(species=species_class.capitalize()):
             logger.debug(f"Got {dataset}")
@@ -82,24 +104,38 @@ def main(species_class, assembly):
 
                     # track file to merge
                     handle.write(f"{prefix}\n")
+                    prefixes.append(prefix)
+                    datasets.append(str(dataset.id))
 
     # ok check for results dir
     final_dir = get_processed_dir() / assembly
     final_dir.mkdir(parents=True, exist_ok=True)
 
-    # ok time to convert data in plink binary format
-    cmd = ["plink"] + PLINK_SPECIES_OPT[dataset.species] + [
-        "--merge-list",
-        f"{merge_file}",
-        "--make-bed",
-        "--out",
-        f"{final_dir / smarter_tag}"
-    ]
-
-    # debug
-    logger.info("Executing: " + " ".join(cmd))
-
-    subprocess.run(cmd, check=True)
+    if not use_plink:
+        # imported here, since pandas slows down the startup of the script
+        from src.features.plinkmerge import merge_binary_plink
+
+        merge_binary_plink(
+            prefixes,
+            final_dir / smarter_tag,
+            datasets=datasets,
+            incremental=incremental,
+            species=species_class.capitalize())
+
+    else:
+        # ok time to convert data in plink binary format
+        cmd = ["plink"] + PLINK_SPECIES_OPT[dataset.species] + [
+            "--merge-list",
+            f"{merge_file}",
+            "--make-bed",
+            "--out",
+            f"{final_dir / smarter_tag}"
+        ]
+
+        # debug
+        logger.info("Executing: " + " ".join(cmd))
+
+        subprocess.run(cmd, check=True)
 
     logger.info(f"{Path(__file__).name} ended")
 
@@ -130,24 +130,183 @@ def process_rs_elem(elem: ET.Element):
     return snp.to_dict()
 
 
-def read_dbSNP(path: str):
-    with text_or_gzip_open(path, mode="rb") as handle:
-        for event, elem in ET.iterparse(handle, events=("end", )):
-            tag = re.sub(r"\{.*\}", "", elem.tag)
-
-            if tag.lower() == "rs":
-                logger.debug(
-                    f"Found tag: {elem.tag}, "
-                    f"attrib: {elem.attrib}, text: {str(elem.text).strip()}")
-                yield process_rs_elem(elem)
-
-                # release memory after processing elem
-                elem.clear()
-
-            else:
-                logger.debug(
-                    f"Ignoring tag: {elem.tag}, "
-                    f"attrib: {elem.attrib}, text: {str(elem.text).strip()}")
+def local_name(tag: str) -> str:
+    """Remove the namespace from a tag"""
+
+    return tag.rpartition("}")[2]
+
+
+def decode_ss_elem(elem: ET.Element, minimal: bool = False) -> dict:
+    """Decode a dbSNP ``Ss`` element"""
+
+    ss = dict(elem.attrib)
+
+    for sequence in elem.iterchildren("{*}Sequence"):
+        for child in sequence.iterchildren():
+            tag = local_name(child.tag)
+
+            if tag == "Observed":
+                ss["observed"] = child.text.strip()
+
+            elif not minimal and tag == "Seq5":
+                ss["seq5"] = child.text.strip()
+
+            elif not minimal and tag == "Seq3":
+                ss["seq3"] = child.text.strip()
+
+    return ss
+
+
+def decode_assembly_elem(elem: ET.Element) -> dict:
+    """Decode a dbSNP ``Assembly`` element"""
+
+    assembly = dict(elem.attrib)
+
+    for child in elem.iterchildren():
+        tag = local_name(child.tag)
+
+        if tag == "Component":
+            assembly["component"] = dict(child.attrib)
+
+            for maploc in child.iterchildren("{*}MapLoc"):
+                assembly["component"]["maploc"] = dict(maploc.attrib)
+
+        elif tag == "SnpStat":
+            assembly["snpstat"] = dict(child.attrib)
+
+    return assembly
+
+
+def decode_rs_elem(elem: ET.Element, minimal: bool = False) -> dict:
+    """
+    Decode a dbSNP ``Rs`` element in a dictionary, like
+    :py:func:`process_rs_elem` does, by reading only the known children
+    elements
+
+    Parameters
+    ----------
+    elem : ET.Element
+        A dbSNP ``Rs`` element.
+    minimal : bool, optional
+        Decode only the attributes required to update SMARTER variants
+        (skip ``create``, ``update``, ``exemplar`` and the ``Ss``
+        flanking sequences). The default is False.
+
+    Returns
+    -------
+    dict
+        The dbSNP record as a dictionary
+    """
+
+    snp = dict(elem.attrib)
+
+    for child in elem.iterchildren():
+        tag = local_name(child.tag)
+
+        if tag == "Ss":
+            snp.setdefault("ss", []).append(decode_ss_elem(child, minimal))
+
+        elif tag == "Assembly":
+            snp["assembly"] = decode_assembly_elem(child)
+
+        elif minimal:
+            continue
+
+        elif tag == "Create":
+            snp["create"] = dict(child.attrib)
+
+        elif tag == "Update":
+            snp["update"] = dict(child.attrib)
+
+        elif tag == "Sequence":
+            snp["exemplar"] = dict(child.attrib)
+
+            for observed in child.iterchildren("{*}Observed"):
+                snp["exemplar"]["observed"] = observed.text.strip()
+
+    return snp
+
+
+def has_ss(
+        elem: ET.Element, handle: str = None, locSnpIds: set = None) -> bool:
+    """
+    Check ``Ss`` attributes of a dbSNP ``Rs`` element without decoding it
+
+    Parameters
+    ----------
+    elem : ET.Element
+        A dbSNP ``Rs`` element.
+    handle : str, optional
+        The ``Ss`` handle (sender) required. The default is None (any
+        handle).
+    locSnpIds : set, optional
+        The ``Ss`` locSnpId required. The default is None (any locSnpId).
+
+    Returns
+    -------
+    bool
+        True if at least one ``Ss`` matches both the requirements
+    """
+
+    for ss in elem.iterchildren("{*}Ss"):
+        if handle and ss.get("handle") != handle:
+            continue
+
+        if locSnpIds is not None and ss.get("locSnpId") not in locSnpIds:
+            continue
+
+        return True
+
+    return False
+
+
+def read_dbSNP(
+        path: str,
+        minimal: bool = False,
+        handle: str = None,
+        locSnpIds: set = None):
+    """
+    Read a dbSNP XML file (even compressed) and yield a dictionary for
+    each ``Rs`` element. Only ``Rs`` elements are returned by the parser
+    and processed elements are removed from the tree, in order to keep
+    memory usage constant. If ``handle`` or ``locSnpIds`` are provided,
+    only the ``Rs`` elements having a matching ``Ss`` are decoded
+
+    Parameters
+    ----------
+    path : str
+        The dbSNP XML file path.
+    minimal : bool, optional
+        Decode only the attributes required to update SMARTER variants.
+        The default is False.
+    handle : str, optional
+        Decode only records with a ``Ss`` from this handle. The default is
+        None.
+    locSnpIds : set, optional
+        Decode only records with a ``Ss`` having one of these locSnpId.
+        The default is None.
+
+    Yields
+    ------
+    dict
+        The dbSNP record as a dictionary
+    """
+
+    prefilter = handle is not None or locSnpIds is not None
+
+    with text_or_gzip_open(path, mode="rb") as xmlfile:
+        for event, elem in ET.iterparse(
+                xmlfile, events=("end", ), tag="{*}Rs"):
+            if not prefilter or has_ss(elem, handle, locSnpIds):
+                yield decode_rs_elem(elem, minimal)
+
+            # release memory after processing elem
+            elem.clear(keep_tail=True)
+
+            # delete the processed elements (and the ignored ones) from
+            # the root element
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
 
 
 def search_chip_snps(snp, handle="AGR_BS"):
@@ -10,12 +10,15 @@ import re
 import csv
 import datetime
 import logging
+import functools
+import itertools
 import collections
+import multiprocessing
 from typing import Tuple
 
-import Bio.Seq
+import numpy as np
 
-from typing import Union
+from typing import Union, Iterable, Iterator
 from dateutil.parser import parse as parse_date
 
 from src.features.utils import sanitize, text_or_gzip_open
@@ -26,6 +29,16 @@ logger = logging.getLogger(__name__)
 # the desidered SNP pattern
 SNP_PATTERN = re.compile(r"\[([acgt]/[acgt])\]", re.IGNORECASE)
 
+# complement DNA bases (even IUPAC ambiguity codes)
+COMPLEMENT = str.maketrans(
+    "ACGTRYSWKMBDHVN",
+    "TGCAYRSWMKVHDBN")
+
+COMPLEMENT_BYTES = bytes.maketrans(b"ACGT", b"TGCA")
+
+# the maximum number of sequences processed by IlluSNP which are cached
+ILLUSNP_CACHE_SIZE = 2**16
+
 
 class IlluSNPException(Exception):
     """Base exception class for IlluSNP"""
@@ -152,7 +165,12 @@ def read_snpMap(path: str, size=2048, skip=0, delimiter=None):
             yield record
 
 
-def read_Manifest(path: str, size=2048, skip=0, delimiter=None):
+def _read_Manifest_rows(
+        path: str, size=2048, skip=0, delimiter=None) -> Iterator[list]:
+    """Read the [Assay] section of an illumina manifest. The first item
+    returned is the sanitized header, then the processed rows as lists
+    are returned. Column indexes are determined once"""
+
     with text_or_gzip_open(path) as handle:
         if delimiter:
             reader = csv.reader(handle, delimiter=delimiter)
@@ -183,8 +201,13 @@ def read_Manifest(path: str, size=2048, skip=0, delimiter=None):
 
         logger.info(header)
 
-        # define a datatype for my data
-        SnpChip = collections.namedtuple("SnpChip", header)
+        yield header
+
+        # determine column indexes once
+        mapinfo_idx = header.index('mapinfo')
+        sourceseq_idx = header.index('sourceseq')
+        snp_idx = header.index('snp')
+        name_idx = header.index('name')
 
         # add records to data
         for record in reader:
@@ -198,37 +221,89 @@ def read_Manifest(path: str, size=2048, skip=0, delimiter=None):
 
             # forcing data types
             try:
-                record[header.index('mapinfo')] = int(
-                    record[header.index('mapinfo')])
+                record[mapinfo_idx] = int(record[mapinfo_idx])
 
             except ValueError as e:
                 logging.warning(
                     "Cannot parse %s:%s" % (record, str(e)))
 
             # check that record is not an indel
-            sequence = record[header.index('sourceseq')]
-            match = re.search(SNP_PATTERN, sequence)
+            sequence = record[sourceseq_idx]
 
-            if match is None:
+            if SNP_PATTERN.search(sequence) is None:
                 logger.warning(
                     "Can't find a SNP in %s. No indels and only 2 "
                     "allelic SNPs are supported" % (sequence))
 
                 # in this case, skip this record
-                logger.warning(f"Skipping {record[header.index('name')]}")
+                logger.warning(f"Skipping {record[name_idx]}")
                 continue
 
             # drop brakets from SNP [A/G] -> A/G
-            record[header.index('snp')] = re.sub(
-                r'[\[\]]',
-                "",
-                record[header.index('snp')])
+            snp = record[snp_idx]
+
+            if snp[:1] == "[" and snp[-1:] == "]":
+                record[snp_idx] = snp[1:-1]
 
-            # convert into collection
-            record = SnpChip._make(record)
             yield record
 
 
+def read_Manifest(path: str, size=2048, skip=0, delimiter=None):
+    rows = _read_Manifest_rows(path, size, skip, delimiter)
+
+    # define a datatype for my data
+    SnpChip = collections.namedtuple("SnpChip", next(rows))
+
+    # add records to data
+    for record in rows:
+        # convert into collection
+        yield SnpChip._make(record)
+
+
+def read_Manifest_columns(
+        path: str,
+        batch_size: int = 10000,
+        size=2048,
+        skip=0,
+        delimiter=None) -> Iterator[dict]:
+    """
+    Read an illumina manifest like :py:func:`read_Manifest` does, but
+    return records in batches of columns
+
+    Parameters
+    ----------
+    path : str
+        The manifest file path.
+    batch_size : int, optional
+        The maximum number of records in each batch. The default is 10000.
+    size : int, optional
+        The number of bytes read to determine the CSV dialect. The default
+        is 2048.
+    skip : int, optional
+        Skip this number of lines before reading the header. The default
+        is 0 (search for the [Assay] section).
+    delimiter : str, optional
+        The CSV delimiter. The default is None (determine the CSV dialect).
+
+    Yields
+    ------
+    dict
+        A ``{column: [value, ...]}`` dictionary, with the sanitized column
+        names as keys
+    """
+
+    rows = _read_Manifest_rows(path, size, skip, delimiter)
+    header = next(rows)
+
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+
+        if not batch:
+            break
+
+        yield dict(zip(header, map(list, zip(*batch))))
+
+
 def read_snpList(path: str, size=2048, skip=0, delimiter=None):
     with text_or_gzip_open(path) as handle:
         if delimiter:
@@ -304,6 +379,254 @@ def read_illuminaRow(path: str, size=2048):
                     f"Error for line {i+len(skipped)+1}:{record}: {exc}. ")
 
 
+def _field_bytes(
+        buffer: np.ndarray,
+        starts: np.ndarray,
+        ends: np.ndarray) -> np.ndarray:
+    """Return the concatenated bytes of all the ``buffer[start:end]`` fields
+    (``starts`` and ``ends`` need to be sorted and not overlapping)"""
+
+    # the lengths of the alternated skipped and selected bytes
+    lengths = np.empty(2*len(starts)+1, dtype=np.int64)
+    lengths[0] = starts[0] if len(starts) else len(buffer)
+    lengths[1::2] = ends - starts
+    lengths[2::2] = np.append(starts[1:], len(buffer)) - ends
+
+    selected = np.zeros(len(lengths), dtype=bool)
+    selected[1::2] = True
+
+    return buffer[np.repeat(selected, lengths)]
+
+
+def _split_illuminaChunk(
+        buffer: np.ndarray, delimiter: int, n_columns: int) -> tuple:
+    """Split a buffer of complete lines in fields. Returns the starts and the
+    ends of each field as two ``(n_rows, n_columns)`` arrays"""
+
+    newlines = np.flatnonzero(buffer == ord("\n"))
+
+    starts = np.concatenate([[0], newlines[:-1]+1]).astype(np.int64)
+    ends = newlines.copy()
+
+    # ignore carriage returns and empty lines
+    ends[buffer[ends-1] == ord("\r")] -= 1
+    not_empty = ends > starts
+    starts, ends = starts[not_empty], ends[not_empty]
+
+    delimiters = np.flatnonzero(buffer == delimiter)
+
+    # each row need to have n_columns fields
+    if len(delimiters) != len(starts) * (n_columns-1):
+        raise IlluSNPException("Rows with a different number of columns")
+
+    delimiters = delimiters.reshape(len(starts), n_columns-1)
+
+    if len(starts) and (
+            (delimiters[:, 0] < starts).any() or
+            (delimiters[:, -1] >= ends).any()):
+        raise IlluSNPException("Rows with a different number of columns")
+
+    field_starts = np.concatenate(
+        [starts[:, np.newaxis], delimiters+1], axis=1)
+    field_ends = np.concatenate(
+        [delimiters, ends[:, np.newaxis]], axis=1)
+
+    return field_starts, field_ends
+
+
+def read_illuminaSamples(
+        path: str,
+        snp_names: list,
+        columns: tuple = ("allele1_ab", "allele2_ab"),
+        size=2048,
+        chunk_size=2**24) -> Iterator[Tuple[str, np.ndarray]]:
+    """
+    Read an illumina final report one sample at a time. Rows are split with
+    numpy on raw bytes: column positions are determined once from the
+    header and the SNP names of each sample are compared with ``snp_names``
+    as a whole
+
+    Parameters
+    ----------
+    path : str
+        The final report path (could be gzipped).
+    snp_names : list
+        The SNP names in the same order of the final report (as read from
+        the snp file).
+    columns : tuple, optional
+        The single character columns to return. The default is
+        ``("allele1_ab", "allele2_ab")``.
+    size : int, optional
+        The number of bytes read to determine the CSV dialect. The default
+        is 2048.
+    chunk_size : int, optional
+        The number of bytes read at once. The default is 2**24.
+
+    Raises
+    ------
+    IlluSNPException
+        When SNP names don't match ``snp_names``, when a sample doesn't have
+        all the SNPs, when rows have a different number of columns or when
+        a value isn't a single character.
+
+    Yields
+    ------
+    Iterator[Tuple[str, np.ndarray]]
+        The sample id and a ``(len(snp_names), len(columns))`` array with
+        the bytes of each value.
+    """
+
+    n_snps = len(snp_names)
+
+    # the expected snp names as a sequence of bytes
+    encoded = [name.encode() for name in snp_names]
+    expected = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    expected_lengths = np.array([len(name) for name in encoded])
+    expected_offsets = np.concatenate([[0], np.cumsum(expected_lengths)])
+
+    with text_or_gzip_open(path) as handle:
+        # search for [DATA] record
+        position, skipped = skip_until_section(handle, "[Data]")
+
+        # try to determine dialect
+        reader = sniff_file(handle, size, position)
+
+        # get header
+        header = [sanitize(column) for column in next(reader)]
+
+        logger.debug(header)
+
+    snp_idx = header.index("snp_name")
+    sample_idx = header.index("sample_id")
+    value_idxs = [header.index(column) for column in columns]
+
+    delimiter, n_columns = ord(reader.dialect.delimiter), len(header)
+
+    # the number of rows processed and the rest of the last chunk
+    n_rows, rest = 0, b""
+
+    # the sample being read
+    sample_id, sample_bytes, genotypes = None, None, None
+
+    # read data as bytes
+    with text_or_gzip_open(path, mode="rb") as handle:
+        # skip header
+        handle.seek(position)
+        handle.readline()
+
+        while True:
+            data = handle.read(chunk_size)
+
+            if data:
+                data = rest + data
+
+                # process only complete lines
+                last = data.rfind(b"\n") + 1
+                data, rest = data[:last], data[last:]
+
+                if not data:
+                    continue
+
+            elif rest:
+                data, rest = rest + b"\n", b""
+
+            else:
+                break
+
+            buffer = np.frombuffer(data, dtype=np.uint8)
+
+            field_starts, field_ends = _split_illuminaChunk(
+                buffer, delimiter, n_columns)
+
+            # values need to be a single character
+            for idx in value_idxs:
+                if ((field_ends[:, idx] - field_starts[:, idx]) != 1).any():
+                    raise IlluSNPException(
+                        f"Column '{header[idx]}' has not single characters "
+                        f"values in {path}")
+
+            values = buffer[field_starts[:, value_idxs]]
+
+            # the snp names and sample ids of this chunk
+            snp_indexes = (n_rows + np.arange(len(values))) % n_snps
+
+            names = _field_bytes(
+                buffer, field_starts[:, snp_idx], field_ends[:, snp_idx])
+            name_lengths = field_ends[:, snp_idx] - field_starts[:, snp_idx]
+            name_offsets = np.concatenate([[0], np.cumsum(name_lengths)])
+
+            samples = _field_bytes(
+                buffer,
+                field_starts[:, sample_idx],
+                field_ends[:, sample_idx])
+            sample_lengths = (
+                field_ends[:, sample_idx] - field_starts[:, sample_idx])
+            sample_offsets = np.concatenate([[0], np.cumsum(sample_lengths)])
+
+            # split chunk in samples
+            first = 0
+
+            while first < len(values):
+                start = snp_indexes[first]
+                last = min(first + n_snps - start, len(values))
+
+                # a new sample begins
+                if start == 0:
+                    sample_bytes = samples[
+                        sample_offsets[first]:sample_offsets[first+1]]
+                    sample_id = sample_bytes.tobytes().decode()
+                    genotypes = np.zeros(
+                        (n_snps, len(value_idxs)), dtype=np.uint8)
+
+                    logger.debug(f"Reading sample {sample_id}")
+
+                # check snp names consistency
+                block_names = names[name_offsets[first]:name_offsets[last]]
+                block_expected = expected[
+                    expected_offsets[start]:
+                    expected_offsets[start+last-first]]
+
+                if (not np.array_equal(
+                        name_lengths[first:last],
+                        expected_lengths[start:start+last-first]) or
+                        not np.array_equal(block_names, block_expected)):
+                    for row in range(first, last):
+                        snp_name = names[
+                            name_offsets[row]:name_offsets[row+1]]
+                        snp_name = snp_name.tobytes().decode()
+
+                        if snp_name != snp_names[snp_indexes[row]]:
+                            raise IlluSNPException(
+                                f"snp positions doens't match "
+                                f"{snp_names[snp_indexes[row]]}<>{snp_name}")
+
+                # all the rows need to have the same sample id
+                block_samples = samples[
+                    sample_offsets[first]:sample_offsets[last]]
+
+                if ((sample_lengths[first:last] != len(sample_bytes)).any()
+                        or not np.array_equal(
+                            block_samples.reshape(last-first, -1),
+                            np.broadcast_to(
+                                sample_bytes,
+                                (last-first, len(sample_bytes))))):
+                    raise IlluSNPException(
+                        f"Sample '{sample_id}' doesn't have {n_snps} SNPs")
+
+                genotypes[start:start+last-first] = values[first:last]
+
+                if start + last - first == n_snps:
+                    yield sample_id, genotypes
+
+                first = last
+
+            n_rows += len(values)
+
+    if n_rows % n_snps != 0:
+        raise IlluSNPException(
+            f"Sample '{sample_id}' doesn't have {n_snps} SNPs")
+
+
 class IlluSNP():
     def __init__(self, sequence=None, max_iter=10):
         """Define a IlluSNP class"""
@@ -344,11 +667,28 @@ class IlluSNP():
         return t1 != t2
 
     def fromSequence(self, sequence, max_iter=10):
-        """Define a IlluSNP from a sequence"""
+        """Define a IlluSNP from a sequence. Results are cached relying on
+        sequence and max_iter (see :py:func:`decode_sequence`)"""
 
         # mind to lower letters. Transform sequence in capital letters
         sequence = sequence.upper()
 
+        snp, pos, A, B, strand = decode_sequence(sequence, max_iter)
+
+        # assign values
+        self.sequence = sequence
+        self.A = A
+        self.B = B
+        self.strand = strand
+        self.alleles = snp
+        self.illumina = f"{self.A}/{self.B}"
+        self.max_iter = max_iter
+        self.pos = pos
+
+    def _decodeSequence(self, sequence, max_iter=10):
+        """Determine SNP, position, A/B alleles and strand of a capital
+        letters sequence"""
+
         # call findSNP
         snp, pos = self.findSNP(sequence)
 
@@ -375,7 +715,7 @@ class IlluSNP():
                         "sequence length"
                     )
 
-                logger.debug("Step %s: considering pair %s" % (n, pair))
+                logger.debug("Step %s: considering pair %s", n, pair)
 
                 if self.isUnambiguous(pair):
                     self.A, self.B, self.strand = self._setABpair(pair, snp)
@@ -388,12 +728,7 @@ class IlluSNP():
                     "Can't find unambiguous pair in %s "
                     "steps (%s)" % (max_iter, sequence))
 
-        # assign values
-        self.sequence = sequence
-        self.alleles = snp
-        self.illumina = f"{self.A}/{self.B}"
-        self.max_iter = max_iter
-        self.pos = pos
+        return snp, pos, self.A, self.B, self.strand
 
     def _setABsnp(self, snp):
         """Set strand and A/B alleles for unambiguous SNP"""
@@ -421,8 +756,8 @@ class IlluSNP():
                 B, A = alleles
 
             logger.debug(
-                "Found A. Set strand = '%s', A = '%s' B = '%s'" % (
-                    strand, A, B))
+                "Found A. Set strand = '%s', A = '%s' B = '%s'",
+                strand, A, B)
 
         # when one of the possible variations of the SNP is a thymine (T),
         # and the remaining variation is either a C or a G, the
@@ -440,8 +775,8 @@ class IlluSNP():
                 B, A = alleles
 
             logger.debug(
-                "Found T. Set strand = '%s', A = '%s' B = '%s'" % (
-                    strand, A, B))
+                "Found T. Set strand = '%s', A = '%s' B = '%s'",
+                strand, A, B)
 
         return A, B, strand
 
@@ -466,7 +801,7 @@ class IlluSNP():
 
             logger.debug(
                 "Found %s in 5'. Set strand = '%s', A = '%s' "
-                "B = '%s'" % (pair[0], strand, A, B))
+                "B = '%s'", pair[0], strand, A, B)
 
         # When the A or T in the first
         # unambiguous pair is on the 3’ side of the SNP, then the
@@ -480,16 +815,16 @@ class IlluSNP():
 
             logger.debug(
                 "Found %s in 3'. Set strand = '%s', A = '%s' "
-                "B = '%s'" % (pair[1], strand, A, B))
+                "B = '%s'", pair[1], strand, A, B)
 
         return A, B, strand
 
     def findSNP(self, sequence):
         """Find snp (eg [A/G] in sequence (0-based)"""
 
-        logger.debug(f"Got '{sequence}' as sequence")
+        logger.debug("Got '%s' as sequence", sequence)
 
-        match = re.search(SNP_PATTERN, sequence)
+        match = SNP_PATTERN.search(sequence)
 
         if match is None:
             raise IlluSNPException(
@@ -500,7 +835,7 @@ class IlluSNP():
         snp = match.groups()[0].upper()
         position = match.span()
 
-        logger.debug("Found %s in position %s" % (snp, position))
+        logger.debug("Found %s in position %s", snp, position)
 
         return snp, position
 
@@ -519,11 +854,11 @@ class IlluSNP():
         # check for ambigousity. Only two snps considered
         if "A" in alleles or "T" in alleles:
             if "C" in alleles or "G" in alleles:
-                logger.debug("%s is unambiguous" % (snp))
+                logger.debug("%s is unambiguous", snp)
                 return True
 
         # default value
-        logger.debug("%s is ambiguous" % (snp))
+        logger.debug("%s is ambiguous", snp)
         return False
 
     def toTop(self):
@@ -538,22 +873,257 @@ class IlluSNP():
         sequence = self.sequence.replace(f"[{self.alleles}]", '')
 
         # get reverse complement of the sequence
-        reverse = Bio.Seq.MutableSeq(sequence)
-        reverse.reverse_complement(inplace=True)
+        reverse = sequence.translate(COMPLEMENT)[::-1]
 
         # mind to complement the SNP
-        snp = Bio.Seq.MutableSeq(self.illumina)
-        snp.complement(inplace=True)
-        snp = "/".join(str(snp).split("/"))
+        snp = self.illumina.translate(COMPLEMENT)
 
         # insert SNP into sequence
         # mind that where flanking sequences are different in length
         # the position I have is relative to the end
-        tmp = list(f"[{snp}]")
-        tmp.reverse()
+        pos = len(reverse) - self.pos[0]
+
+        # return a IlluSNP object
+        return IlluSNP(
+            f"{reverse[:pos]}[{snp}]{reverse[pos:]}", max_iter=self.max_iter)
+
+
+@functools.lru_cache(maxsize=ILLUSNP_CACHE_SIZE)
+def decode_sequence(sequence: str, max_iter: int = 10) -> tuple:
+    """
+    Determine the illumina coding of a sequence. The same sequences occur
+    in different chips and assemblies, so results are cached
+
+    Parameters
+    ----------
+    sequence : str
+        The illumina sequence (in capital letters), with the SNP in square
+        brackets.
+    max_iter : int, optional
+        The maximum number of steps when searching for an unambiguous pair.
+        The default is 10.
+
+    Raises
+    ------
+    IlluSNPException
+        When the sequence can't be decoded.
+
+    Returns
+    -------
+    tuple
+        A ``(snp, pos, A, B, strand)`` tuple
+    """
+
+    return IlluSNP()._decodeSequence(sequence, max_iter)
+
+
+def _resolve_sequence(sequence: str, max_iter: int, to_top: bool) -> tuple:
+    """Resolve a single sequence using IlluSNP"""
+
+    illusnp = IlluSNP(sequence, max_iter=max_iter)
+
+    if to_top:
+        illusnp = illusnp.toTop()
+
+    return illusnp.illumina, illusnp.strand, illusnp.alleles
+
+
+def _resolve_chunk(
+        sequences: list,
+        max_iter: int,
+        to_top: bool,
+        ignore_errors: bool) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Resolve a list of sequences. See :py:func:`resolve_sequences`"""
+
+    n_rows = len(sequences)
+
+    # the SNP alleles as ASCII codes
+    snps = np.zeros((n_rows, 2), dtype=np.uint8)
+
+    # the flanking bases, starting from the SNP position, as ASCII codes.
+    # Sequences shorter than max_iter are padded with '-'
+    flank5, flank3 = [], []
+
+    # the bases available in the shortest flanking sequence
+    available = np.zeros(n_rows, dtype=np.int64)
+
+    # sequences to be resolved using IlluSNP
+    fallback = np.zeros(n_rows, dtype=bool)
+
+    for idx, sequence in enumerate(sequences):
+        sequence = sequence.upper()
+        match = SNP_PATTERN.search(sequence)
+
+        if match is None:
+            fallback[idx] = True
+            flank5.append("-" * max_iter)
+            flank3.append("-" * max_iter)
+            continue
+
+        start, stop = match.span()
+        snps[idx] = (ord(sequence[start+1]), ord(sequence[start+3]))
+
+        left = sequence[max(start-max_iter, 0):start][::-1]
+        right = sequence[stop:stop+max_iter]
+        available[idx] = min(len(left), len(right))
+
+        flank5.append(left.ljust(max_iter, "-"))
+        flank3.append(right.ljust(max_iter, "-"))
+
+    def as_array(flanks: list) -> np.ndarray:
+        return np.frombuffer(
+            "".join(flanks).encode("ascii", errors="replace"),
+            dtype=np.uint8).reshape(n_rows, max_iter)
+
+    def is_at(codes: np.ndarray) -> np.ndarray:
+        return (codes == ord("A")) | (codes == ord("T"))
+
+    def is_cg(codes: np.ndarray) -> np.ndarray:
+        return (codes == ord("C")) | (codes == ord("G"))
+
+    flank5, flank3 = as_array(flank5), as_array(flank3)
+
+    # A and B alleles
+    allele_a = np.zeros(n_rows, dtype=np.uint8)
+    allele_b = np.zeros(n_rows, dtype=np.uint8)
+    top = np.zeros(n_rows, dtype=bool)
+
+    # unambiguous SNPs: A is the A/T allele, strand is TOP if A is 'A'
+    unambiguous = is_at(snps[:, 0]) != is_at(snps[:, 1])
+    first_at = is_at(snps[:, 0])
+
+    allele_a[unambiguous] = np.where(
+        first_at, snps[:, 0], snps[:, 1])[unambiguous]
+    allele_b[unambiguous] = np.where(
+        first_at, snps[:, 1], snps[:, 0])[unambiguous]
+    top[unambiguous] = (allele_a == ord("A"))[unambiguous]
+
+    # ambiguous SNPs: search the first unambiguous pair. Strand is TOP
+    # if the A/T base is on the 5' side
+    pairs = (
+        (is_at(flank5) & is_cg(flank3)) | (is_cg(flank5) & is_at(flank3)))
+    step = np.argmax(pairs, axis=1)
+    found = pairs[np.arange(n_rows), step] & (step < available)
+
+    ambiguous = ~unambiguous & ~fallback
+    fallback |= ambiguous & ~found
+
+    resolved = ambiguous & found
+    pair_top = is_at(flank5[np.arange(n_rows), step])
+
+    allele_a[resolved] = np.where(
+        pair_top, snps[:, 0], snps[:, 1])[resolved]
+    allele_b[resolved] = np.where(
+        pair_top, snps[:, 1], snps[:, 0])[resolved]
+    top[resolved] = pair_top[resolved]
+
+    alleles = np.char.add(
+        np.char.add(snps[:, 0].view("S1"), b"/"), snps[:, 1].view("S1"))
+    illumina = np.char.add(
+        np.char.add(allele_a.view("S1"), b"/"), allele_b.view("S1"))
+
+    if to_top:
+        # the reverse complement of a BOT sequence has the same pair
+        # in the same step, so the illumina TOP is the complement of BOT
+        # illumina
+        illumina = np.where(
+            top, illumina, np.char.translate(illumina, COMPLEMENT_BYTES))
+        alleles = np.where(top, alleles, illumina)
+        top[:] = True
+
+    illumina = illumina.astype("U3")
+    alleles = alleles.astype("U3")
+    strand = np.where(top, "TOP", "BOT")
+
+    for idx in np.flatnonzero(fallback):
+        try:
+            illumina[idx], strand[idx], alleles[idx] = _resolve_sequence(
+                sequences[idx], max_iter, to_top)
+
+        except IlluSNPException as exc:
+            if not ignore_errors:
+                raise exc
+
+            logger.debug("Can't resolve '%s': %s", sequences[idx], exc)
+            illumina[idx], strand[idx], alleles[idx] = "", "", ""
+
+    return illumina, strand, alleles
+
+
+def resolve_sequences(
+        sequences: Iterable[str],
+        max_iter: int = 10,
+        to_top: bool = False,
+        ignore_errors: bool = False,
+        workers: int = 1,
+        chunk_size: int = 100000) -> Tuple[
+            np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Determine the illumina coding for many sequences at once, with the same
+    results of :py:class:`IlluSNP`. SNPs are searched once in each sequence,
+    then the unambiguous pairs are searched for all the sequences at once.
+    Sequences which can't be resolved in this way (ie. when flanking
+    sequences are shorter than ``max_iter``) are processed using
+    :py:class:`IlluSNP`
+
+    Parameters
+    ----------
+    sequences : Iterable[str]
+        The sequences to process, with the SNP in square brackets.
+    max_iter : int, optional
+        The maximum number of steps when searching for an unambiguous pair.
+        The default is 10.
+    to_top : bool, optional
+        Return the coding of the illumina TOP sequence, like
+        :py:meth:`IlluSNP.toTop` does. The default is False.
+    ignore_errors : bool, optional
+        Return empty strings for the sequences which can't be processed
+        instead of raising the first error. The default is False.
+    workers : int, optional
+        Process chunks of sequences using this number of processes. The
+        default is 1.
+    chunk_size : int, optional
+        The number of sequences processed by each worker. The default is
+        100000.
+
+    Raises
+    ------
+    IlluSNPException
+        When a sequence can't be processed (and ``ignore_errors`` is False).
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray, np.ndarray]
+        The ``illumina``, ``strand`` and ``alleles`` arrays, with the same
+        values of the :py:class:`IlluSNP` attributes
+    """
+
+    sequences = list(sequences)
+
+    chunks = [
+        sequences[start:start+chunk_size]
+        for start in range(0, len(sequences), chunk_size)]
+
+    resolve_chunk = functools.partial(
+        _resolve_chunk,
+        max_iter=max_iter,
+        to_top=to_top,
+        ignore_errors=ignore_errors)
+
+    if workers > 1 and len(chunks) > 1:
+        with multiprocessing.Pool(workers) as pool:
+            results = pool.map(resolve_chunk, chunks)
+
+    else:
+        results = [resolve_chunk(chunk) for chunk in chunks]
+
+    if not results:
+        empty = np.array([], dtype="U3")
+        return empty, empty.copy(), empty.copy()
 
-        for i, char in enumerate(tmp):
-            reverse.insert(-self.pos[0]-i, char)
+    illumina, strand, alleles = zip(*results)
 
-        # convert into string, return a IlluSNP object
-        return IlluSNP(str(reverse), max_iter=self.max_iter)
+    return (
+        np.concatenate(illumina),
+        np.concatenate(strand),
+        np.concatenate(alleles))
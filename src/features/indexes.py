@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 15:20:11 2026
+
+@author: Paolo Cozzi <paolo.cozzi@ibba.cnr.it>
+
+Create and verify the indexes of SMARTER variant collections and check the
+query plans of the queries used while converting genotypes
+"""
+
+import logging
+
+from typing import Union
+
+from mongoengine.queryset import Q
+
+from .smarterdb import VariantSheep, VariantGoat, SmarterDBException
+
+# Get an instance of a logger
+logger = logging.getLogger(__name__)
+
+
+def ensure_variant_indexes(
+        VariantSpecies: Union[VariantSheep, VariantGoat],
+        drop_stale: bool = False) -> dict:
+    """
+    Create the indexes defined in ``VariantSpecies.meta`` and check them
+    against the indexes of the collection
+
+    Parameters
+    ----------
+    VariantSpecies : Union[VariantSheep, VariantGoat]
+        The variant class to check.
+    drop_stale : bool, optional
+        Drop the indexes not defined in ``VariantSpecies.meta``. The
+        default is False.
+
+    Raises
+    ------
+    SmarterDBException
+        When an index can't be created.
+
+    Returns
+    -------
+    dict
+        A dictionary with the ``missing`` and the ``extra`` indexes (as
+        returned by ``Document.compare_indexes``) after the creation
+    """
+
+    collection = VariantSpecies._get_collection()
+
+    logger.info(f"Ensure indexes for '{collection.name}'")
+    VariantSpecies.ensure_indexes()
+
+    indexes = VariantSpecies.compare_indexes()
+
+    if indexes["missing"]:
+        raise SmarterDBException(
+            f"Indexes {indexes['missing']} are missing in "
+            f"'{collection.name}'")
+
+    if indexes["extra"]:
+        if not drop_stale:
+            logger.warning(
+                f"Indexes {indexes['extra']} are not defined for "
+                f"'{collection.name}'")
+
+        else:
+            index_information = collection.index_information()
+
+            for name, info in index_information.items():
+                if info["key"] in indexes["extra"]:
+                    logger.warning(
+                        f"Dropping index '{name}' from '{collection.name}'")
+                    collection.drop_index(name)
+
+            indexes = VariantSpecies.compare_indexes()
+
+    for name, info in collection.index_information().items():
+        logger.info(f"Found index '{name}': {info['key']}")
+
+    return indexes
+
+
+def get_hot_queries(
+        VariantSpecies: Union[VariantSheep, VariantGoat],
+        src_assembly,
+        dst_assembly=None,
+        chip_name: str = None,
+        names: list = None) -> dict:
+    """
+    Return the querysets used while searching variants in SMARTER database
+
+    Parameters
+    ----------
+    VariantSpecies : Union[VariantSheep, VariantGoat]
+        The variant class to query.
+    src_assembly : AssemblyConf
+        The source assembly (with ``version`` and ``imported_from``
+        attributes).
+    dst_assembly : AssemblyConf, optional
+        The destination assembly. The default is None.
+    chip_name : str, optional
+        The chip name used by queries. The default is None (use the
+        chip name of the first variant found).
+    names : list, optional
+        The names used by queries. The default is None (use the name of
+        the first variant found).
+
+    Returns
+    -------
+    dict
+        A ``{description: queryset}`` dictionary
+    """
+
+    variant = VariantSpecies.objects.first()
+
+    if not chip_name:
+        chip_name = variant.chip_name[0] if variant else "IlluminaOvineSNP50"
+
+    if not names:
+        names = [variant.name] if variant else ["rs1"]
+
+    # the queries done by SmarterMixin.make_query_args,
+    # SmarterMixin._index_variants_by_positions and
+    # SmarterMixin.make_batch_query_kwargs
+    assembly = Q(locations__match=src_assembly._asdict())
+
+    if dst_assembly:
+        assembly &= Q(locations__match=dst_assembly._asdict())
+
+    location = src_assembly._asdict()
+    location["chrom"] = "1"
+
+    position = location.copy()
+    position["position"] = 1
+
+    return {
+        "by assembly": VariantSpecies.objects(assembly),
+        "by chromosome": VariantSpecies.objects(locations__match=location),
+        "by position": VariantSpecies.objects(locations__match=position),
+        "by name": VariantSpecies.objects(
+            name__in=names, chip_name=chip_name),
+        "by rs_id": VariantSpecies.objects(
+            rs_id__in=names, chip_name=chip_name),
+        "by probeset_id": VariantSpecies.objects(
+            probesets__probeset_id__in=names,
+            probesets__chip_name=chip_name),
+    }
+
+
+def get_plan_stages(plan: dict) -> list:
+    """
+    Return all the ``(stage, indexName)`` tuples of a query plan
+
+    Parameters
+    ----------
+    plan : dict
+        A ``winningPlan`` of an ``explain()`` output.
+
+    Returns
+    -------
+    list
+        A list of ``(stage, indexName)`` tuples (``indexName`` is None
+        when the stage doesn't use an index)
+    """
+
+    stages = [(plan.get("stage"), plan.get("indexName"))]
+
+    # MongoDB with slot based execution engine nest the plan
+    if "queryPlan" in plan:
+        stages += get_plan_stages(plan["queryPlan"])
+
+    if "inputStage" in plan:
+        stages += get_plan_stages(plan["inputStage"])
+
+    for stage in plan.get("inputStages", []):
+        stages += get_plan_stages(stage)
+
+    return [stage for stage in stages if stage[0]]
+
+
+def explain_queries(queries: dict) -> dict:
+    """
+    Call ``explain()`` for each query and return their winning plans
+
+    Parameters
+    ----------
+    queries : dict
+        A ``{description: queryset}`` dictionary, like the one returned by
+        :py:func:`get_hot_queries`.
+
+    Raises
+    ------
+    SmarterDBException
+        When a query does a collection scan (COLLSCAN).
+
+    Returns
+    -------
+    dict
+        A ``{description: [(stage, indexName), ...]}`` dictionary
+    """
+
+    plans, collscans = dict(), []
+
+    for description, queryset in queries.items():
+        explain = queryset.explain()
+        stages = get_plan_stages(explain["queryPlanner"]["winningPlan"])
+
+        plans[description] = stages
+
+        logger.info(
+            f"Query {description}: " +
+            " <- ".join(
+                f"{stage}({index})" if index else stage
+                for stage, index in stages))
+
+        if "COLLSCAN" in [stage for stage, _ in stages]:
+            logger.error(
+                f"Query {description} does a COLLSCAN: "
+                f"{queryset._query}")
+            collscans.append(description)
+
+    if collscans:
+        raise SmarterDBException(
+            f"Queries {collscans} don't use indexes")
+
+    return plans
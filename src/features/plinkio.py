@@ -11,23 +11,31 @@ Try to model data operations on plink files
 import re
 import csv
 import logging
+import tempfile
+
+import numpy as np
 
 from pathlib import Path
 from typing import Union
 from collections import namedtuple
 from dataclasses import dataclass
 
-from tqdm import tqdm
-from mongoengine.errors import DoesNotExist, MultipleObjectsReturned
+import mongoengine
+from mongoengine.errors import DoesNotExist
 from mongoengine.queryset import Q
-from plinkio import plinkfile
 
 from .snpchimp import clean_chrom
 from .smarterdb import (
     VariantSheep, SampleSheep, Breed, Dataset, SmarterDBException, SEX,
-    VariantGoat, SampleGoat, Location, get_sample_type)
-from .utils import TqdmToLogger, skip_comments, text_or_gzip_open
-from .illumina import read_snpList, read_illuminaRow
+    VariantGoat, SampleGoat, get_sample_type, bulk_create_samples,
+    reserveSequenceValues, releaseSequenceValues, getSmarterIdPrefix,
+    DB_ALIAS)
+from .snapshot import VariantSnapshot
+from .utils import (
+    TqdmToLogger, skip_comments, text_or_gzip_open, plink_chrom,
+    plink_chrom_key)
+from .illumina import (
+    read_snpList, read_illuminaRow, read_illuminaSamples, IlluSNPException)
 from .affymetrix import read_affymetrixRow
 
 # Get an instance of a logger
@@ -36,6 +44,27 @@ logger = logging.getLogger(__name__)
 # a generic class to deal with assemblies
 AssemblyConf = namedtuple('AssemblyConf', ['version', 'imported_from'])
 
+# the Location attribute and the description of each coding
+CODINGS = {
+    'top': ('illumina_top', 'illumina top'),
+    'forward': ('illumina_forward', 'illumina forward'),
+    'ab': (None, 'illumina ab'),
+    'affymetrix': ('affymetrix_ab', 'affymetrix'),
+    'illumina': ('illumina', 'illumina'),
+}
+
+# the source codings which can be converted in a destination coding
+SUPPORTED_CODINGS = {
+    'top': ['top', 'forward', 'ab', 'affymetrix', 'illumina'],
+    'forward': ['forward', 'top'],
+}
+
+MISSING_ALLELES = ["0", "-"]
+AB_ALLELES = ["A", "B"]
+
+# a code for alleles not in the source coding
+INVALID_ALLELE = 255
+
 
 class CodingException(Exception):
     pass
@@ -71,6 +100,107 @@ class MapRecord():
                 self.cm = float(self.cm)
 
 
+class SampleCache():
+    """Load all the samples and breeds of a dataset once, in order to
+    resolve PED lines without querying the database for each line. Samples
+    are indexed by field on demand"""
+
+    def __init__(
+            self,
+            SampleSpecies: Union[SampleSheep, SampleGoat],
+            dataset: Dataset,
+            species: str):
+
+        self.SampleSpecies = SampleSpecies
+        self.dataset = dataset
+
+        self.samples = list(SampleSpecies.objects(dataset=dataset))
+
+        # a {field: {value: [sample, ...]}} dictionary
+        self.indexes = dict()
+
+        # breeds with an alias in this dataset or of the same species
+        breeds = {
+            breed.id: breed for breed in Breed.objects(
+                aliases__match={'dataset': dataset})}
+
+        for breed in Breed.objects(species=species):
+            breeds.setdefault(breed.id, breed)
+
+        self.breeds_by_alias = dict()
+        self.breeds_by_code = dict()
+
+        for breed in breeds.values():
+            if breed.species == species:
+                self.breeds_by_code.setdefault(breed.code, []).append(breed)
+
+            # read the dataset id without dereferencing it
+            for alias in breed.aliases:
+                if alias.to_mongo().get("dataset_id") == dataset.id:
+                    self.breeds_by_alias.setdefault(
+                        alias.fid, []).append(breed)
+
+        logger.debug(
+            f"Cached {len(self.samples)} samples and {len(breeds)} breeds "
+            f"for {dataset}")
+
+    def _get_index(self, field: str) -> dict:
+        if field not in self.indexes:
+            index = dict()
+
+            for sample in self.samples:
+                index.setdefault(getattr(sample, field), []).append(sample)
+
+            self.indexes[field] = index
+
+        return self.indexes[field]
+
+    def _get_one(self, items: list, document, query: dict):
+        """Return the only item in list as :py:meth:`QuerySet.get` does"""
+
+        if not items:
+            raise document.DoesNotExist(
+                f"{document.__name__} matching query does not exist "
+                f"({query})")
+
+        if len(items) > 1:
+            raise document.MultipleObjectsReturned(
+                f"{len(items)} items returned instead of 1 ({query})")
+
+        return items[0]
+
+    def filter_samples(self, **kwargs) -> list:
+        """Return samples having all the requested attributes"""
+
+        fields = list(kwargs)
+        samples = self._get_index(fields[0]).get(kwargs[fields[0]], [])
+
+        return [
+            sample for sample in samples
+            if all(getattr(sample, field) == kwargs[field]
+                   for field in fields[1:])]
+
+    def get_sample(self, **kwargs) -> Union[SampleSheep, SampleGoat]:
+        return self._get_one(
+            self.filter_samples(**kwargs), self.SampleSpecies, kwargs)
+
+    def get_breed_by_alias(self, fid: str) -> Breed:
+        return self._get_one(
+            self.breeds_by_alias.get(fid, []), Breed, {'fid': fid})
+
+    def get_breed_by_code(self, code: str) -> Breed:
+        return self._get_one(
+            self.breeds_by_code.get(code, []), Breed, {'code': code})
+
+    def add_sample(self, sample: Union[SampleSheep, SampleGoat]):
+        """Track a new sample in cache"""
+
+        self.samples.append(sample)
+
+        for field, index in self.indexes.items():
+            index.setdefault(getattr(sample, field), []).append(sample)
+
+
 class SmarterMixin():
     """Common features of a Smarter related dataset file"""
 
@@ -84,6 +214,24 @@ class SmarterMixin():
     SampleSpecies = None
     chip_name = None
 
+    # how many variants names are searched with a single query
+    fetch_batch_size = 10000
+
+    # translation tables by coding, built after fetching coordinates
+    _coding_tables = None
+
+    # samples and breeds of the processed dataset
+    _sample_cache = None
+
+    # how many new samples are inserted with a single query
+    sample_batch_size = 1000
+
+    # new samples not yet inserted, the reserved sequence values not yet
+    # used and the SMARTER ID prefixes by (country, breed)
+    _new_samples = None
+    _sequence_values = None
+    _smarter_id_prefixes = None
+
     # this need to be set to the proper read genotype method
     read_genotype_method = None
 
@@ -113,12 +261,95 @@ class SmarterMixin():
 
         self._species = species
 
+    def prefetch_samples(self, dataset: Dataset):
+        """Load samples and breeds of dataset in memory. Samples and breeds
+        will be searched in cache until :py:meth:`clear_sample_cache` is
+        called"""
+
+        self._sample_cache = SampleCache(
+            self.SampleSpecies, dataset, self.species)
+
+        self._new_samples = []
+        self._sequence_values = range(0)
+        self._smarter_id_prefixes = dict()
+
+    def clear_sample_cache(self):
+        """Insert the new samples and forget the cached samples"""
+
+        try:
+            self._insert_new_samples()
+
+        finally:
+            self._release_sequence_values()
+            self._sample_cache = None
+
+    def _insert_new_samples(self):
+        """Insert the new samples with a single query"""
+
+        if self._new_samples:
+            bulk_create_samples(self.SampleSpecies, self._new_samples)
+            self._new_samples = []
+
+    def _release_sequence_values(self):
+        """Give back the reserved and not used sequence values"""
+
+        if self._sequence_values:
+            database = mongoengine.connection.get_db(alias=DB_ALIAS)
+            sequence_name = f"sample{self.SampleSpecies.species_class}"
+
+            if not releaseSequenceValues(
+                    sequence_name, database, self._sequence_values):
+                logger.warning(
+                    f"Can't release {len(self._sequence_values)} unused "
+                    f"'{sequence_name}' values: SMARTER IDs will have a gap")
+
+        self._sequence_values = None
+
+    def _set_smarter_id(self, sample: Union[SampleSheep, SampleGoat]):
+        """Set a SMARTER ID to a new sample. Sequence values are reserved
+        in blocks of :py:attr:`sample_batch_size` values"""
+
+        species_class = self.SampleSpecies.species_class
+
+        if not self._sequence_values:
+            database = mongoengine.connection.get_db(alias=DB_ALIAS)
+            self._sequence_values = reserveSequenceValues(
+                f"sample{species_class}", database, self.sample_batch_size)
+
+        sequence_value = self._sequence_values[0]
+        self._sequence_values = self._sequence_values[1:]
+
+        key = (sample.country, sample.breed)
+
+        if key not in self._smarter_id_prefixes:
+            self._smarter_id_prefixes[key] = getSmarterIdPrefix(
+                species_class, *key)
+
+        sample.smarter_id = (
+            f"{self._smarter_id_prefixes[key]}-"
+            f"{str(sequence_value).zfill(9)}")
+
+    def get_sample_cache(self, dataset: Dataset) -> SampleCache:
+        """Return the sample cache for dataset (if any)"""
+
+        if (self._sample_cache and dataset and
+                self._sample_cache.dataset.id == dataset.id):
+            return self._sample_cache
+
+        return None
+
     def search_breed(self, fid, dataset, *args, **kwargs):
         """Get breed relying aliases and dataset"""
 
-        # this is a $elemMatch query
-        breed = Breed.objects(
-            aliases__match={'fid': fid, 'dataset': dataset}).get()
+        cache = self.get_sample_cache(dataset)
+
+        if cache:
+            breed = cache.get_breed_by_alias(fid)
+
+        else:
+            # this is a $elemMatch query
+            breed = Breed.objects(
+                aliases__match={'fid': fid, 'dataset': dataset}).get()
 
         logger.debug(f"Found breed {breed}")
 
@@ -139,7 +370,10 @@ class SmarterMixin():
 
         return country
 
-    def update_mapfile(self, outputfile: str):
+    def _get_map_rows(self):
+        """Yields the [chrom, name, cM, position] map records of the SNPs
+        which are not filtered out, using the destination coordinates"""
+
         # helper function to get default value for cM
         def get_cM(record):
             """Returns distance in cM or '0' (default for map file)"""
@@ -149,29 +383,32 @@ class SmarterMixin():
 
             return '0'
 
-        with open(outputfile, 'w') as handle:
-            writer = csv.writer(handle, delimiter=' ', lineterminator="\n")
-            counter = 0
+        for idx, record in enumerate(self.mapdata):
+            if idx in self.filtered:
+                logger.warning(f"Skipping {record}: not in database")
+                continue
 
-            for idx, record in enumerate(self.mapdata):
-                if idx in self.filtered:
-                    logger.warning(f"Skipping {record}: not in database")
-                    continue
+            # get a location relying on indexes
+            location = self.dst_locations[idx]
 
-                # get a location relying on indexes
-                location = self.dst_locations[idx]
+            # get the tracked variant name relying on indexes
+            variant_name = self.variants_name[idx]
 
-                # get the tracked variant name relying on indexes
-                variant_name = self.variants_name[idx]
+            # a new record in mapfile
+            yield [
+                clean_chrom(location.chrom),
+                variant_name,
+                get_cM(record),
+                location.position
+            ]
 
-                # a new record in mapfile
-                writer.writerow([
-                    clean_chrom(location.chrom),
-                    variant_name,
-                    get_cM(record),
-                    location.position
-                ])
+    def update_mapfile(self, outputfile: str):
+        with open(outputfile, 'w') as handle:
+            writer = csv.writer(handle, delimiter=' ', lineterminator="\n")
+            counter = 0
 
+            for row in self._get_map_rows():
+                writer.writerow(row)
                 counter += 1
 
         logger.info(f"Wrote {counter} SNPs in mapfile")
@@ -182,25 +419,32 @@ class SmarterMixin():
         father_id = None
         mother_id = None
 
+        cache = self.get_sample_cache(dataset)
+
+        def search_parent(original_id):
+            if cache:
+                parents = cache.filter_samples(original_id=original_id)
+
+            else:
+                parents = list(self.SampleSpecies.objects(
+                    original_id=original_id, dataset=dataset))
+
+            if len(parents) == 1:
+                return parents[0]
+
+            return None
+
         # test with sex column
         if int(line[4]) in [1, 2]:
             sex = SEX(int(line[4]))
 
         # test with father id
         if str(line[2]) != '0':
-            qs = self.SampleSpecies.objects(
-                original_id=line[2], dataset=dataset)
-
-            if qs.count() == 1:
-                father_id = qs.get()
+            father_id = search_parent(line[2])
 
         # test with mother id
         if str(line[3]) != '0':
-            qs = self.SampleSpecies.objects(
-                original_id=line[3], dataset=dataset)
-
-            if qs.count() == 1:
-                mother_id = qs.get()
+            mother_id = search_parent(line[3])
 
         return sex, father_id, mother_id
 
@@ -214,7 +458,10 @@ class SmarterMixin():
             mother_id: Union[SampleSheep, SampleGoat]) -> Union[
                 SampleSheep, SampleGoat]:
         """
-        Helper method to create a new sample from a PED line
+        Helper method to create a new sample from a PED line. When samples
+        are cached, the new sample is inserted with other new samples in
+        blocks of :py:attr:`sample_batch_size` samples or when the cache is
+        cleared, otherwise it is inserted immediately
 
         Parameters
         ----------
@@ -258,12 +505,28 @@ class SmarterMixin():
             father_id=father_id,
             mother_id=mother_id
         )
-        sample.save()
 
-        logger.debug(f"Increment '{breed}' n_individuals counter")
+        cache = self.get_sample_cache(dataset)
+
+        if not cache:
+            # reserve the SMARTER ID, insert the sample and increment the
+            # breed counter
+            bulk_create_samples(self.SampleSpecies, [sample])
+
+            return sample
+
+        # parents need to be inserted before referencing them
+        if any(parent and not parent.id for parent in [father_id, mother_id]):
+            self._insert_new_samples()
+
+        self._set_smarter_id(sample)
+        self._new_samples.append(sample)
+
+        # track the new sample in cache
+        cache.add_sample(sample)
 
-        breed.n_individuals += 1
-        breed.save()
+        if len(self._new_samples) >= self.sample_batch_size:
+            self._insert_new_samples()
 
         return sample
 
@@ -303,12 +566,19 @@ class SmarterMixin():
             created. None if no sample is found and create_sample if False.
         """
 
-        # search for sample in database
-        qs = self.SampleSpecies.objects(
-            dataset=dataset,
-            breed_code=breed.code,
-            **{sample_field: line[1]}
-        )
+        # search for sample in database (or in cache)
+        cache = self.get_sample_cache(dataset)
+
+        if cache:
+            samples = cache.filter_samples(
+                breed_code=breed.code, **{sample_field: line[1]})
+
+        else:
+            samples = list(self.SampleSpecies.objects(
+                dataset=dataset,
+                breed_code=breed.code,
+                **{sample_field: line[1]}
+            ))
 
         sex, father_id, mother_id = self._deal_with_relationship(
             line, dataset)
@@ -316,18 +586,21 @@ class SmarterMixin():
         # the sample I want to return
         sample = None
 
-        if qs.count() == 1:
+        if len(samples) == 1:
             logger.debug(f"Sample '{line[1]}' found in database")
-            sample = qs.get()
+            sample = samples[0]
 
             # update records if necessary
             if sample.father_id != father_id or sample.mother_id != mother_id:
                 logger.warning(f"Update relationships for sample '{line[1]}'")
                 sample.father_id = father_id
                 sample.mother_id = mother_id
-                sample.save()
 
-        elif qs.count() == 0:
+                # new samples will be inserted with their relationships
+                if sample.id:
+                    sample.save()
+
+        elif len(samples) == 0:
             if not create_sample:
                 logger.warning(f"Sample '{line[1]}' not found in database")
 
@@ -337,7 +610,7 @@ class SmarterMixin():
 
         else:
             raise SmarterDBException(
-                f"Got {qs.count()} results for '{line[1]}'")
+                f"Got {len(samples)} results for '{line[1]}'")
 
         return sample
 
@@ -388,20 +661,119 @@ class SmarterMixin():
                 "chip_name": chip_name
             }
 
+    def make_batch_query_kwargs(
+            self, search_field: str, names: list, chip_name: str):
+        """Generate kwargs to select a batch of variants from database"""
+
+        if search_field == 'probeset_id':
+            # probeset_id and chip_name are checked for the same probeset
+            # when matching variants with map records
+            return {
+                "probesets__probeset_id__in": names,
+                "probesets__chip_name": chip_name
+            }
+
+        else:
+            return {
+                f"{search_field}__in": names,
+                "chip_name": chip_name
+            }
+
+    def _get_variant_keys(
+            self, variant, search_field: str, chip_name: str) -> set:
+        """Return the values used to match a variant with map records"""
+
+        if search_field == 'probeset_id':
+            keys = set()
+
+            for probeset in variant.probesets or []:
+                if probeset.chip_name == chip_name:
+                    keys.update(probeset.probeset_id)
+
+            return keys
+
+        value = getattr(variant, search_field)
+
+        # list fields (ex. rs_id) match if any of their values match
+        if isinstance(value, (list, tuple)):
+            return set(value)
+
+        return {value}
+
+    def _get_variant_fields(self, search_field: str) -> list:
+        """Return the variant fields required to resolve coordinates"""
+
+        if search_field == 'probeset_id':
+            search_field = 'probesets'
+
+        return list({"name", "locations", search_field.split("__")[0]})
+
+    def _search_variants(
+            self,
+            query: list,
+            names: list,
+            search_field: str,
+            chip_name: str) -> dict:
+        """
+        Search variants by names in smarter database, using a single query
+        for each batch of :py:attr:`fetch_batch_size` names
+
+        Returns
+        -------
+        dict
+            A ``{name: {variant.id: variant}}`` dictionary
+        """
+
+        # track all variants matching a name
+        matches = {name: dict() for name in names}
+
+        from tqdm import tqdm
+
+        tqdm_out = TqdmToLogger(logger, level=logging.INFO)
+
+        for start in tqdm(
+                range(0, len(names), self.fetch_batch_size),
+                file=tqdm_out, mininterval=1):
+            batch = names[start:start+self.fetch_batch_size]
+
+            # additional arguments used in query
+            additional_arguments = self.make_batch_query_kwargs(
+                search_field, batch, chip_name)
+
+            # remove empty additional arguments if any
+            variants = self.VariantSpecies.objects(
+                *query,
+                **{k: v for k, v in additional_arguments.items() if v}
+            ).only(*self._get_variant_fields(search_field))
+
+            for variant in variants:
+                for key in self._get_variant_keys(
+                        variant, search_field, chip_name):
+                    if key in matches:
+                        matches[key][variant.id] = variant
+
+        return matches
+
     def fetch_coordinates(
             self,
             src_assembly: AssemblyConf,
             dst_assembly: AssemblyConf = None,
             search_field: str = "name",
             chip_name: str = None,
-            *args, **kwargs):
-        """Search for variants in smarter database
+            *args,
+            snapshot: VariantSnapshot = None,
+            **kwargs):
+        """Search for variants in smarter database. Variants are retrieved
+        in batches of :py:attr:`fetch_batch_size` names using a single `$in`
+        query for each batch
 
         Args:
             src_assembly (AssemblyConf): the source data assembly version
             dst_assembly (AssemblyConf): the destination data assembly version
             search_field (str): search variant by field (def. "name")
             chip_name (str): limit search to this chip_name
+            snapshot (VariantSnapshot): search variants in this snapshot
+                instead of smarter database
         """
 
         # reset meta informations
@@ -409,45 +781,52 @@ class SmarterMixin():
         self.dst_locations = list()
         self.filtered = set()
         self.variants_name = list()
+        self._coding_tables = None
 
         # get the query arguments relying on assemblies
         query = self.make_query_args(src_assembly, dst_assembly)
 
-        tqdm_out = TqdmToLogger(logger, level=logging.INFO)
+        # all the names I need to search for
+        names = list(dict.fromkeys(record.name for record in self.mapdata))
 
-        for idx, record in enumerate(tqdm(
-                self.mapdata, file=tqdm_out, mininterval=1)):
-            try:
-                # additional arguments used in query
-                additional_arguments = self.make_query_kwargs(
-                    search_field, record, chip_name)
+        if snapshot:
+            matches = snapshot.search_variants(
+                names,
+                search_field,
+                chip_name,
+                [assembly for assembly in [src_assembly, dst_assembly]
+                 if assembly])
+
+        else:
+            matches = self._search_variants(
+                query, names, search_field, chip_name)
 
-                # remove empty additional arguments if any
-                variant = self.VariantSpecies.objects(
-                    *query,
-                    **{k: v for k, v in additional_arguments.items() if v}
-                ).get()
+        for idx, record in enumerate(self.mapdata):
+            variants = list(matches[record.name].values())
 
-            except DoesNotExist as e:
+            if len(variants) == 0:
                 logger.debug(
-                    f"Couldn't find '{record.name}' with '{query}'"
-                    f"using '{additional_arguments}': {e}")
+                    f"Couldn't find '{record.name}' with '{query}' "
+                    f"using '{search_field}' and '{chip_name}'")
 
                 self.skip_index(idx)
 
                 # don't check location for missing SNP
                 continue
 
-            except MultipleObjectsReturned as e:
+            elif len(variants) > 1:
                 logger.warning(
-                    f"Got multiple {record.name} with '{query}'"
-                    f"using '{additional_arguments}': {e}")
+                    f"Got multiple {record.name} with '{query}' "
+                    f"using '{search_field}' and '{chip_name}': "
+                    f"{len(variants)} variants found")
 
                 self.skip_index(idx)
 
                 # don't check location for missing SNP
                 continue
 
+            variant = variants[0]
+
             # get the proper locations and track it
             src_location = variant.get_location(**src_assembly._asdict())
             self.src_locations.append(src_location)
@@ -466,14 +845,16 @@ class SmarterMixin():
 
         logger.debug(
             f"collected {len(self.dst_locations)} with '{query}' "
-            f"using '{additional_arguments}'")
+            f"using '{search_field}' and '{chip_name}'")
 
-    def fetch_coordinates_by_positions(
+    def _index_variants_by_positions(
             self,
             src_assembly: AssemblyConf,
-            dst_assembly: AssemblyConf = None):
+            dst_assembly: AssemblyConf = None) -> dict:
         """
-        Search for variant in smarter database relying on positions
+        Read all the variants having a location in the source assembly (and
+        in the destination assembly, if provided) for each chromosome in
+        mapdata and index them by position
 
         Parameters
         ----------
@@ -484,25 +865,22 @@ class SmarterMixin():
 
         Returns
         -------
-        None.
+        dict
+            A ``{(chrom, position): {variant.id: variant}}`` dictionary
         """
 
-        # reset meta informations
-        self.src_locations = list()
-        self.dst_locations = list()
-        self.filtered = set()
-        self.variants_name = list()
+        index = dict()
 
-        tqdm_out = TqdmToLogger(logger, level=logging.INFO)
+        chroms = list(dict.fromkeys(record.chrom for record in self.mapdata))
 
-        for idx, record in enumerate(tqdm(
-                self.mapdata, file=tqdm_out, mininterval=1)):
+        from tqdm import tqdm
+
+        tqdm_out = TqdmToLogger(logger, level=logging.INFO)
 
+        for chrom in tqdm(chroms, file=tqdm_out, mininterval=1):
             location = src_assembly._asdict()
-            location["chrom"] = record.chrom
-            location["position"] = record.position
+            location["chrom"] = chrom
 
-            # construct the final query
             # construct the query arguments to search into database
             if dst_assembly:
                 query = [Q(locations__match=location) &
@@ -510,34 +888,96 @@ class SmarterMixin():
             else:
                 query = [Q(locations__match=location)]
 
-            try:
-                variant = self.VariantSpecies.objects(
-                    *query
-                ).get()
+            variants = self.VariantSpecies.objects(
+                *query).only("name", "locations")
+
+            for variant in variants:
+                for location in variant.locations:
+                    if (location.version != src_assembly.version or
+                            location.imported_from !=
+                            src_assembly.imported_from or
+                            location.chrom != chrom):
+                        continue
+
+                    key = (chrom, location.position)
+                    index.setdefault(key, dict())[variant.id] = variant
+
+        logger.debug(
+            f"Indexed {len(index)} positions in '{src_assembly}' assembly")
+
+        return index
+
+    def fetch_coordinates_by_positions(
+            self,
+            src_assembly: AssemblyConf,
+            dst_assembly: AssemblyConf = None,
+            snapshot: VariantSnapshot = None):
+        """
+        Search for variant in smarter database relying on positions. All
+        the variants of the required chromosomes are read once and indexed
+        in memory by position
+
+        Parameters
+        ----------
+        src_assembly : AssemblyConf
+            the source data assembly version.
+        dst_assembly : AssemblyConf, optional
+            the destination data assembly version. The default is None.
+        snapshot : VariantSnapshot, optional
+            search variants in this snapshot instead of smarter database.
+            The default is None.
+
+        Returns
+        -------
+        None.
+        """
+
+        # reset meta informations
+        self.src_locations = list()
+        self.dst_locations = list()
+        self.filtered = set()
+        self.variants_name = list()
+        self._coding_tables = None
+
+        if snapshot:
+            index = snapshot.index_by_positions(
+                list(dict.fromkeys(record.chrom for record in self.mapdata)),
+                [assembly for assembly in [src_assembly, dst_assembly]
+                 if assembly])
+
+        else:
+            index = self._index_variants_by_positions(
+                src_assembly, dst_assembly)
 
-            except DoesNotExist as e:
+        for idx, record in enumerate(self.mapdata):
+            variants = list(
+                index.get((record.chrom, record.position), {}).values())
+
+            if len(variants) == 0:
                 logger.debug(
                     f"Couldn't find '{record.chrom}:{record.position}' in "
-                    f"'{src_assembly}' assembly: {e}")
+                    f"'{src_assembly}' assembly")
 
                 self.skip_index(idx)
 
                 # don't check location for missing SNP
                 continue
 
-            except MultipleObjectsReturned as e:
+            elif len(variants) > 1:
                 # tecnically, I could return the first item I found in
                 # my database. Skip, for the moment
                 logger.debug(
                     f"Got multiple records for position '{record.chrom}:"
                     f"{record.position}' in '{src_assembly}'"
-                    f" assembly: {e}")
+                    f" assembly: {len(variants)} variants found")
 
                 self.skip_index(idx)
 
                 # don't check location for missing SNP
                 continue
 
+            variant = variants[0]
+
             # get the proper locations and track it
             src_location = variant.get_location(**src_assembly._asdict())
             self.src_locations.append(src_location)
@@ -558,214 +998,121 @@ class SmarterMixin():
             f"collected {len(self.dst_locations)} using positions "
             f"in '{src_assembly}' assembly")
 
-    def _to_top(
-            self, index: int, genotype: list, coding: str,
-            location: Location) -> list:
+    def _get_coding_table(self, src_coding: str, dst_coding: str) -> tuple:
         """
-        Check genotype with coding and returns illumina_top alleles
+        Build a per-SNP translation table (once for each coding couple)
+        which maps each known allele into the destination coding
 
         Parameters
         ----------
-        index: int
-            The i-th SNP received
-        genotype : list
-            The genotype as a list (ex: ['T', 'C'])
-        coding : str
+        src_coding : str
             The coding input type ('top', 'forward', ...)
-        location : Location
-            A smarterdb location used to check input genotype and coding and
-            to return the corresponding illumina top genotype (ex ['A', 'G'])
+        dst_coding : str
+            The coding output type ('top' or 'forward')
 
         Raises
         ------
-        CodingException
-            Raised when input genotype hasn't a match in the smarter database
-            with the provided coding
         NotImplementedError
             A coding format not yet supported (implemented)
 
         Returns
         -------
-        list
-            The illumina top genotype as a list (ex ['A', 'G'])
+        alleles : numpy.ndarray
+            The sorted alleles used to encode genotypes. An allele not in
+            this array is encoded with ``len(alleles)``
+        table : numpy.ndarray
+            A ``(n_snps, len(alleles)+1)`` uint8 array with the destination
+            allele code for each SNP and source allele code, or
+            ``INVALID_ALLELE`` if source allele is not in source coding
+        src_errors : dict
+            A ``{index: exception}`` dictionary of SNPs which can't be
+            checked for missing informations in database
+        dst_errors : dict
+            A ``{index: exception}`` dictionary of SNPs which can't be
+            converted for missing informations in database
         """
 
-        # for simplicity
-        a1, a2 = genotype
-
-        # the returned value
-        top_genotype = []
-
-        # define a dictionary with useful data
-        config = {
-            'forward': {
-                'check': 'is_forward',
-                'convert': 'forward2top',
-                'message': (
-                    f"Error for SNP {index}: '{self.mapdata[index].name}': "
-                    f"{a1}/{a2} <> {location.illumina_forward}"
-                ),
-                'exception': (
-                    f"SNP '{self.mapdata[index].name}' is "
-                    "not in illumina forward format"
-                )
-            },
-            'ab': {
-                'check': 'is_ab',
-                'convert': 'ab2top',
-                'message': (
-                    f"Error for SNP {index}: '{self.mapdata[index].name}': "
-                    f"{a1}/{a2} <> A/B"
-                ),
-                'exception': (
-                    f"SNP '{self.mapdata[index].name}' is "
-                    "not in illumina ab format"
-                )
-            },
-            'affymetrix': {
-                'check': 'is_affymetrix',
-                'convert': 'affy2top',
-                'message': (
-                    f"Error for SNP {index}: '{self.mapdata[index].name}': "
-                    f"{a1}/{a2} <> {location.affymetrix_ab}"
-                ),
-                'exception': (
-                    f"SNP '{self.mapdata[index].name}' is "
-                    "not in affymetrix format"
-                )
-            },
-            'illumina': {
-                'check': 'is_illumina',
-                'convert': 'illumina2top',
-                'message': (
-                    f"Error for SNP {index}: '{self.mapdata[index].name}': "
-                    f"{a1}/{a2} <> {location.illumina}"
-                ),
-                'exception': (
-                    f"SNP '{self.mapdata[index].name}' is "
-                    "not in illumina format"
-                )
-            }
-        }
+        if self._coding_tables is None:
+            self._coding_tables = dict()
 
-        if coding == 'top':
-            if not location.is_top(genotype):
-                logger.debug(
-                    f"Error for SNP {index}: '{self.mapdata[index].name}': "
-                    f"{a1}/{a2} <> {location.illumina_top}"
-                )
-                raise CodingException(
-                    f"SNP '{self.mapdata[index].name}' is "
-                    "not in illumina top format")
+        if (src_coding, dst_coding) in self._coding_tables:
+            return self._coding_tables[(src_coding, dst_coding)]
 
-            # allele coding is the same received as input
-            top_genotype = genotype
+        if dst_coding not in SUPPORTED_CODINGS:
+            raise NotImplementedError(
+                f"Destination coding '{dst_coding}' not supported")
 
-        elif coding in config:
-            # get the proper method to check genotype
-            check = getattr(location, config[coding]['check'])
+        if src_coding not in SUPPORTED_CODINGS[dst_coding]:
+            raise NotImplementedError(f"Coding '{src_coding}' not supported")
 
-            if not check(genotype):
-                logger.debug(config[coding]['message'])
-                raise CodingException(config[coding]['exception'])
+        src_attr, _ = CODINGS[src_coding]
+        dst_attr, _ = CODINGS[dst_coding]
 
-            # get the proper method to convert genotype
-            convert = getattr(location, config[coding]['convert'])
+        # get source and destination alleles for each SNP
+        src_alleles, dst_alleles = [], []
+        src_errors, dst_errors = dict(), dict()
 
-            # change the allele coding
-            top_genotype = convert(genotype)
+        for idx, location in enumerate(self.src_locations):
+            src, dst = [], []
 
-        else:
-            raise NotImplementedError(f"Coding '{coding}' not supported")
+            if location is not None:
+                try:
+                    if src_attr:
+                        if not getattr(location, src_attr):
+                            raise SmarterDBException(
+                                f"There's no information for '{src_attr}' "
+                                f"in '{location}'")
 
-        return top_genotype
+                        src = getattr(location, src_attr).split("/")
 
-    def _to_forward(
-            self, index: int, genotype: list, coding: str,
-            location: Location) -> list:
-        """
-        Check genotype with coding and returns illumina_forward alleles
+                    else:
+                        src = AB_ALLELES
 
-        Parameters
-        ----------
-        index: int
-            The i-th SNP received
-        genotype : list
-            The genotype as a list (ex: ['A', 'G'])
-        coding : str
-            The coding input type ('top', 'forward', ...)
-        location : Location
-            A smarterdb location used to check input genotype and coding and
-            to return the corresponding illumina forward genotype (ex
-            ['T', 'C'])
+                except SmarterDBException as exc:
+                    src_errors[idx] = exc
 
-        Raises
-        ------
-        CodingException
-            Raised when input genotype hasn't a match in the smarter database
-            with the provided coding
-        NotImplementedError
-            A coding format not yet supported (implemented)
+                try:
+                    dst = getattr(location, dst_attr).split("/")
 
-        Returns
-        -------
-        list
-            The illumina forward genotype as a list (ex ['T', 'C'])
-        """
+                except (SmarterDBException, AttributeError) as exc:
+                    # genotypes can be checked but not converted
+                    dst_errors[idx] = exc
+                    dst = ["0"] * len(src)
 
-        # for simplicity
-        a1, a2 = genotype
-
-        # the returned value
-        forward_genotype = []
-
-        # define a dictionary with useful data
-        config = {
-            'top': {
-                'check': 'is_top',
-                'convert': 'top2forward',
-                'message': (
-                    f"Error for SNP {index}: '{self.mapdata[index].name}': "
-                    f"{a1}/{a2} <> {location.illumina_top}"
-                ),
-                'exception': (
-                    f"SNP '{self.mapdata[index].name}' is "
-                    "not in illumina top format"
-                )
-            }
-        }
+            src_alleles.append(src)
+            dst_alleles.append(dst)
 
-        if coding == 'forward':
-            if not location.is_forward(genotype):
-                logger.debug(
-                    f"Error for SNP {index}: '{self.mapdata[index].name}': "
-                    f"{a1}/{a2} <> {location.illumina_forward}"
-                )
-                raise CodingException(
-                    f"SNP '{self.mapdata[index].name}' is "
-                    "not in illumina forward format")
+        alleles = set(MISSING_ALLELES + AB_ALLELES)
 
-            # allele coding is the same received as input
-            forward_genotype = genotype
+        for item in src_alleles + dst_alleles:
+            alleles.update(item)
 
-        elif coding in config:
-            # get the proper method to check genotype
-            check = getattr(location, config[coding]['check'])
+        alleles = np.array(sorted(alleles))
+        codes = {allele: code for code, allele in enumerate(alleles.tolist())}
 
-            if not check(genotype):
-                logger.debug(config[coding]['message'])
-                raise CodingException(config[coding]['exception'])
+        # with the same coding, missing alleles are returned as they are
+        # otherwise, they are converted into '0'
+        missing = {
+            allele: allele if src_coding == dst_coding else "0"
+            for allele in MISSING_ALLELES}
 
-            # get the proper method to convert genotype
-            convert = getattr(location, config[coding]['convert'])
+        table = np.full(
+            (len(self.src_locations), len(alleles) + 1),
+            INVALID_ALLELE,
+            dtype=np.uint8)
 
-            # change the allele coding
-            forward_genotype = convert(genotype)
+        for idx, (src, dst) in enumerate(zip(src_alleles, dst_alleles)):
+            for allele, value in missing.items():
+                table[idx, codes[allele]] = codes[value]
 
-        else:
-            raise NotImplementedError(f"Coding '{coding}' not supported")
+            # the first match wins (as list.index does)
+            for allele, value in reversed(list(zip(src, dst))):
+                table[idx, codes[allele]] = codes[value]
 
-        return forward_genotype
+        self._coding_tables[(src_coding, dst_coding)] = (
+            alleles, table, src_errors, dst_errors)
+
+        return alleles, table, src_errors, dst_errors
 
     def _process_genotypes(
             self,
@@ -773,73 +1120,94 @@ class SmarterMixin():
             src_coding: str,
             ignore_errors=False,
             dst_coding: str = "top"):
-        """Process a single genotype record"""
+        """Process a single genotype record. Genotypes of the whole sample
+        are converted using the table returned by
+        :py:meth:`_get_coding_table`"""
 
         new_line = line.copy()
 
-        # ok now is time to update genotypes
-        for i in range(len(self.mapdata)):
-            # replacing the i-th genotypes. Skip 6 columns
-            a1 = new_line[6+i*2]
-            a2 = new_line[6+i*2+1]
+        alleles, table, src_errors, dst_errors = self._get_coding_table(
+            src_coding, dst_coding)
 
-            genotype = [a1, a2]
+        n_snps = len(self.mapdata)
 
-            # is this snp filtered out
-            if i in self.filtered:
-                logger.debug(
-                    f"Skipping {self.mapdata[i].name}:[{a1}/{a2}] "
-                    "not in database!"
-                )
+        # get genotypes as a (n_snps, 2) array
+        genotypes = np.array(
+            line[6:6+n_snps*2], dtype=str).reshape(n_snps, 2)
 
-                continue
+        # encode alleles. Unknown alleles get len(alleles) as code
+        codes = np.searchsorted(alleles, genotypes)
+        codes[codes == len(alleles)] = 0
+        codes[alleles[codes] != genotypes] = len(alleles)
 
-            # xor condition: https://stackoverflow.com/a/433161/4385116
-            if (a1 in ["0", "-"]) != (a2 in ["0", "-"]):
-                logger.warning(
-                    f"Found half-missing SNP in {new_line[1]}: {i}: "
-                    f"[{a1}/{a2}]. Forcing SNP to be MISSING")
+        converted = table[np.arange(n_snps)[:, np.newaxis], codes]
 
-                new_line[6+i*2], new_line[6+i*2+1] = ["0", "0"]
+        # is this snp filtered out
+        filtered = np.zeros(n_snps, dtype=bool)
+        filtered[list(self.filtered)] = True
 
-                continue
+        # xor condition: https://stackoverflow.com/a/433161/4385116
+        missing = np.isin(genotypes, MISSING_ALLELES)
+        half_missing = (missing[:, 0] != missing[:, 1]) & ~filtered
 
-            # get the proper position
-            location = self.src_locations[i]
+        for i in np.flatnonzero(half_missing):
+            logger.warning(
+                f"Found half-missing SNP in {new_line[1]}: {i}: "
+                f"[{genotypes[i, 0]}/{genotypes[i, 1]}]. "
+                "Forcing SNP to be MISSING")
 
-            # check and return illumina top genotype
-            try:
-                if dst_coding == 'top':
-                    top_genotype = self._to_top(
-                        i, genotype, src_coding, location)
+        # the SNPs which need to be converted
+        processed = ~filtered & ~half_missing
 
-                    # replace alleles in ped line with top genotype
-                    new_line[6+i*2], new_line[6+i*2+1] = top_genotype
+        mismatches = (converted == INVALID_ALLELE).any(axis=1) & processed
 
-                elif dst_coding == 'forward':
-                    forward_genotype = self._to_forward(
-                        i, genotype, src_coding, location)
+        # SNPs which can't be checked or converted for missing data
+        errors = {**dst_errors, **src_errors}
 
-                    # replace alleles in ped line with forward genotype
-                    new_line[6+i*2], new_line[6+i*2+1] = forward_genotype
+        # a SNP can't be converted only if its genotype is checked
+        broken = np.zeros(n_snps, dtype=bool)
+        broken[list(dst_errors)] = True
+        broken &= ~mismatches
+        broken[list(src_errors)] = True
+        broken &= processed
 
-                else:
-                    raise NotImplementedError(
-                        f"Destination coding '{dst_coding}' not supported")
+        mismatches &= ~broken
 
-            except CodingException as e:
-                if ignore_errors:
-                    # ok, replace with a missing genotype
-                    logger.debug(
-                        f"Ignoring code check in {new_line[1]}: {i*2}: "
-                        f"[{a1}/{a2}]. Forcing SNP to be MISSING")
+        # raise the first error found, as a SNP by SNP check does
+        if not ignore_errors and (mismatches.any() or broken.any()):
+            i = np.flatnonzero(mismatches | broken)[0]
 
-                    new_line[6+i*2], new_line[6+i*2+1] = ["0", "0"]
-                    continue
+            if broken[i]:
+                raise errors[i]
 
-                else:
-                    # this is the normal case
-                    raise e
+            src_attr, label = CODINGS[src_coding]
+            expected = (
+                getattr(self.src_locations[i], src_attr) if src_attr
+                else "/".join(AB_ALLELES))
+
+            logger.debug(
+                f"Error for SNP {i}: '{self.mapdata[i].name}': "
+                f"{genotypes[i, 0]}/{genotypes[i, 1]} <> {expected}")
+
+            raise CodingException(
+                f"SNP '{self.mapdata[i].name}' is not in {label} format")
+
+        if broken.any():
+            raise errors[np.flatnonzero(broken)[0]]
+
+        if mismatches.any():
+            # ok, replace with a missing genotype
+            logger.debug(
+                f"Ignoring code check in {new_line[1]} for "
+                f"{mismatches.sum()} SNPs. Forcing SNPs to be MISSING")
+
+        # replace alleles in ped line with converted genotypes
+        processed &= ~mismatches
+
+        genotypes[processed] = alleles[converted[processed]]
+        genotypes[half_missing | mismatches] = "0"
+
+        new_line[6:6+n_snps*2] = genotypes.ravel().tolist()
 
         return new_line
 
@@ -948,9 +1316,8 @@ class SmarterMixin():
 
         return new_line
 
-    def update_pedfile(
+    def _convert_pedlines(
             self,
-            outputfile: str,
             dataset: Dataset,
             src_coding: str,
             create_samples: bool = False,
@@ -959,36 +1326,22 @@ class SmarterMixin():
             dst_coding: str = "top",
             *args,
             **kwargs):
-        """
-        Write a new pedfile relying on illumina_top genotypes and coordinates
-        stored in smarter database
-
-        Args:
-            outputfile (str): write ped to this path (overwrite if exists)
-            dataset (Dataset): the dataset we are converting
-            src_coding (str): the source coding (could be 'top', 'ab',
-                'forward')
-            create_samples (bool): create samples if not exist (useful to
-                create samples directly from ped file)
-            sample_field (str): search samples using this attribute (def.
-                'original_id')
-            ignore_coding_errors (bool): ignore coding related errors (no
-                more exceptions when genotypes don't match)
-            dst_coding (str): the destination coding (could be 'top' or
-                'forward')
-        """
+        """Read genotypes with :py:attr:`read_genotype_method` and yields
+        the converted ped lines. Lines which can't be converted are
+        skipped"""
 
         if ignore_coding_errors:
             logger.warning(
                 "Coding check is disabled! wrong genotypes will not "
                 "throw errors!")
 
-        with open(outputfile, "w") as target:
-            writer = csv.writer(
-                target, delimiter=' ', lineterminator="\n")
+        processed = 0
 
-            processed = 0
+        # resolve samples and breeds from memory
+        if dataset:
+            self.prefetch_samples(dataset)
 
+        try:
             for line in self.read_genotype_method(
                     dataset=dataset,
                     sample_field=sample_field,
@@ -1005,11 +1358,11 @@ class SmarterMixin():
                     dst_coding)
 
                 if new_line:
-                    # write updated line into updated ped file
                     logger.debug(
                         f"Writing: {new_line[:10] + ['...']} "
                         f"({int((len(new_line)-6)/2)} SNPs)")
-                    writer.writerow(new_line)
+
+                    yield new_line
 
                     processed += 1
 
@@ -1019,11 +1372,245 @@ class SmarterMixin():
                         f"({int((len(line)-6)/2)} SNPs)"
                     )
 
-            logger.info(f"Processed {processed} individuals")
+        finally:
+            self.clear_sample_cache()
+
+        logger.info(f"Processed {processed} individuals")
+
+    def update_pedfile(
+            self,
+            outputfile: str,
+            dataset: Dataset,
+            src_coding: str,
+            create_samples: bool = False,
+            sample_field: str = "original_id",
+            ignore_coding_errors: bool = False,
+            dst_coding: str = "top",
+            *args,
+            **kwargs):
+        """
+        Write a new pedfile relying on illumina_top genotypes and coordinates
+        stored in smarter database
+
+        Args:
+            outputfile (str): write ped to this path (overwrite if exists)
+            dataset (Dataset): the dataset we are converting
+            src_coding (str): the source coding (could be 'top', 'ab',
+                'forward')
+            create_samples (bool): create samples if not exist (useful to
+                create samples directly from ped file)
+            sample_field (str): search samples using this attribute (def.
+                'original_id')
+            ignore_coding_errors (bool): ignore coding related errors (no
+                more exceptions when genotypes don't match)
+            dst_coding (str): the destination coding (could be 'top' or
+                'forward')
+        """
+
+        with open(outputfile, "w") as target:
+            writer = csv.writer(
+                target, delimiter=' ', lineterminator="\n")
+
+            for new_line in self._convert_pedlines(
+                    dataset,
+                    src_coding,
+                    create_samples,
+                    sample_field,
+                    ignore_coding_errors,
+                    dst_coding,
+                    *args,
+                    **kwargs):
+
+                # write updated line into updated ped file
+                writer.writerow(new_line)
+
+    def update_bedfile(
+            self,
+            outputprefix: Union[str, Path],
+            dataset: Dataset,
+            src_coding: str,
+            create_samples: bool = False,
+            sample_field: str = "original_id",
+            ignore_coding_errors: bool = False,
+            dst_coding: str = "top",
+            *args,
+            **kwargs):
+        """
+        Write a new binary plink fileset (.bed, .bim and .fam) relying on
+        illumina_top genotypes and coordinates stored in smarter database,
+        without writing the intermediate text files and without calling
+        plink. Samples are converted one by one as in
+        :py:meth:`update_pedfile`, then genotypes are written in SNP-major
+        mode, with the minor allele as A1
+
+        Args:
+            outputprefix (Union[str, Path]): write files with this prefix
+                (overwrite if exists)
+            dataset (Dataset): the dataset we are converting
+            src_coding (str): the source coding (could be 'top', 'ab',
+                'forward')
+            create_samples (bool): create samples if not exist (useful to
+                create samples directly from ped file)
+            sample_field (str): search samples using this attribute (def.
+                'original_id')
+            ignore_coding_errors (bool): ignore coding related errors (no
+                more exceptions when genotypes don't match)
+            dst_coding (str): the destination coding (could be 'top' or
+                'forward')
+        """
+
+        outputprefix = Path(outputprefix)
+
+        def get_path(suffix):
+            return outputprefix.parent / (outputprefix.name + suffix)
+
+        map_rows = list(self._get_map_rows())
+        n_snps = len(map_rows)
+
+        # the first two alleles seen for each SNP ('' if not yet seen)
+        alleles = np.full((n_snps, 2), "", dtype=object)
+        counts = np.zeros((n_snps, 2), dtype=np.int64)
+        n_samples = 0
+
+        # genotypes are converted sample by sample, so they are written
+        # in a sample-major temporary file as the number of the second
+        # alleles (3 is MISSING) and then transposed in SNP-major order
+        with tempfile.TemporaryFile(dir=outputprefix.parent) as tmp, \
+                open(get_path(".fam"), "w") as fam:
+            writer = csv.writer(fam, delimiter=' ', lineterminator="\n")
+
+            for new_line in self._convert_pedlines(
+                    dataset,
+                    src_coding,
+                    create_samples,
+                    sample_field,
+                    ignore_coding_errors,
+                    dst_coding,
+                    *args,
+                    **kwargs):
+
+                writer.writerow(new_line[:6])
+
+                genotypes = np.array(
+                    new_line[6:], dtype=object).reshape(n_snps, 2)
+                missing = np.isin(genotypes, MISSING_ALLELES).any(axis=1)
+
+                for column in genotypes.T:
+                    new = ~missing & (alleles[:, 0] == "")
+                    alleles[new, 0] = column[new]
+
+                    new = (
+                        ~missing & (column != alleles[:, 0]) &
+                        (alleles[:, 1] == ""))
+                    alleles[new, 1] = column[new]
+
+                    wrong = (
+                        ~missing & (column != alleles[:, 0]) &
+                        (column != alleles[:, 1]))
+
+                    if wrong.any():
+                        idx = np.flatnonzero(wrong)[0]
+                        raise PlinkIOException(
+                            f"Found more than 2 alleles for SNP "
+                            f"'{map_rows[idx][1]}' in {new_line[1]}")
+
+                second = (genotypes == alleles[:, [1]]).sum(axis=1)
+                second[missing] = 3
 
-            # output file block
+                counts[~missing, 1] += second[~missing]
+                counts[~missing, 0] += 2 - second[~missing]
 
-        # input file block
+                tmp.write(second.astype(np.uint8).tobytes())
+                n_samples += 1
+
+            tmp.flush()
+
+            # A1 is the minor allele
+            a1_is_first = counts[:, 0] < counts[:, 1]
+
+            # chromosomes are written with the numeric codes of plink, and
+            # SNPs are sorted by chromosome and position like the .bim files
+            # created by plink with '--chr-set'
+            chroms = [plink_chrom(row[0], self.species) for row in map_rows]
+            order = np.array(sorted(
+                range(n_snps),
+                key=lambda idx: (
+                    plink_chrom_key(chroms[idx]), int(map_rows[idx][3]))),
+                dtype=np.int64)
+
+            self._write_bedfile(
+                get_path(".bed"), tmp, n_samples, n_snps, a1_is_first, order)
+
+        with open(get_path(".bim"), "w") as bim:
+            writer = csv.writer(bim, delimiter='\t', lineterminator="\n")
+
+            for idx in order.tolist():
+                _, name, cm, position = map_rows[idx]
+                first, second = alleles[idx]
+                a1, a2 = (
+                    (first, second) if a1_is_first[idx] else (second, first))
+
+                writer.writerow([
+                    chroms[idx], name, f"{float(cm):g}", position,
+                    a1 or "0", a2 or "0"])
+
+        logger.info(
+            f"Wrote {n_samples} individuals and {n_snps} SNPs in "
+            f"'{outputprefix}' binary fileset")
+
+    def _write_bedfile(
+            self,
+            outputfile: Path,
+            tmp,
+            n_samples: int,
+            n_snps: int,
+            a1_is_first: np.ndarray,
+            order: np.ndarray = None,
+            block_size: int = 10000):
+        """Transpose the sample-major genotypes written in ``tmp`` by
+        :py:meth:`update_bedfile` into a SNP-major .bed file. SNPs are
+        written in ``order`` (the same order of ``tmp`` if None)"""
+
+        # plink codes by number of second alleles (0, 1, 2, MISSING) when
+        # A1 is the second allele or the first allele
+        codes = np.array([
+            [0b11, 0b10, 0b00, 0b01],
+            [0b00, 0b10, 0b11, 0b01]], dtype=np.uint8)
+
+        # each byte holds 4 samples, padded with zeros
+        n_bytes = (n_samples + 3) // 4
+
+        with open(outputfile, "wb") as handle:
+            # magic numbers and SNP-major mode
+            handle.write(bytes([0x6c, 0x1b, 0x01]))
+
+            if n_samples == 0 or n_snps == 0:
+                return
+
+            genotypes = np.memmap(
+                tmp, dtype=np.uint8, mode="r", shape=(n_samples, n_snps))
+
+            if order is None:
+                order = np.arange(n_snps)
+
+            for start in range(0, n_snps, block_size):
+                stop = min(start + block_size, n_snps)
+                snps = order[start:stop]
+
+                block = np.zeros((stop - start, n_bytes * 4), dtype=np.uint8)
+                block[:, :n_samples] = codes[
+                    a1_is_first[snps, np.newaxis].astype(np.int64),
+                    genotypes[:, snps].T]
+
+                # the first sample is in the lowest bits
+                block = block.reshape(stop - start, n_bytes, 4)
+                packed = (
+                    block[:, :, 0] | (block[:, :, 1] << 2) |
+                    (block[:, :, 2] << 4) | (block[:, :, 3] << 6))
+
+                handle.write(packed.astype(np.uint8).tobytes())
+
+            del genotypes
 
 
 class FakePedMixin():
@@ -1034,7 +1621,13 @@ class FakePedMixin():
     def search_breed(self, fid, *args, **kwargs):
         """Get breed relying on provided FID and species class attribute"""
 
-        breed = Breed.objects(code=fid, species=self.species).get()
+        cache = self.get_sample_cache(kwargs.get("dataset"))
+
+        if cache:
+            breed = cache.get_breed_by_code(fid)
+
+        else:
+            breed = Breed.objects(code=fid, species=self.species).get()
 
         logger.debug(f"Found breed {breed}")
 
@@ -1068,12 +1661,19 @@ class FakePedMixin():
             f"Searching fid for sample using {sample_field}: '{sample_name}, "
             "{dataset}'")
 
+        cache = self.get_sample_cache(dataset)
+
         # determine fid from sample, if not received as argument
         try:
-            sample = self.SampleSpecies.objects.get(
-                dataset=dataset,
-                **{sample_field: sample_name}
-            )
+            if cache:
+                sample = cache.get_sample(**{sample_field: sample_name})
+
+            else:
+                sample = self.SampleSpecies.objects.get(
+                    dataset=dataset,
+                    **{sample_field: sample_name}
+                )
+
         except DoesNotExist as e:
             logger.debug(e)
             raise SmarterDBException(
@@ -1241,6 +1841,9 @@ class BinaryPlinkIO(SmarterMixin):
     plink_file = None
     _prefix = None
 
+    # the number of samples decoded at once from .bed file
+    sample_block_size = 1000
+
     def __init__(
             self,
             prefix: str = None,
@@ -1261,6 +1864,8 @@ class BinaryPlinkIO(SmarterMixin):
     @prefix.setter
     def prefix(self, prefix: str):
         if prefix:
+            from plinkio import plinkfile
+
             self._prefix = prefix
             self.plink_file = plinkfile.open(self._prefix)
 
@@ -1279,12 +1884,91 @@ class BinaryPlinkIO(SmarterMixin):
             )
             self.mapdata.append(record)
 
-    def read_pedfile(self, *args, **kwargs):
-        """Open pedfile for reading return iterator"""
+    def read_genotypes(self, block_size: int = None):
+        """
+        Read genotypes from the memory-mapped .bed file. Samples are
+        decoded in blocks, so only ``block_size`` samples are kept in
+        memory
+
+        Parameters
+        ----------
+        block_size : int, optional
+            The number of samples decoded at once. The default is
+            :py:attr:`sample_block_size`.
+
+        Raises
+        ------
+        PlinkIOException
+            The .bed file is not in SNP-major mode
+
+        Yields
+        ------
+        sample : plinkio.plinkfile.Sample
+            The sample object read from .fam file
+        genotypes : numpy.ndarray
+            A ``n_snps`` uint8 array with the number of allele2 (0, 1, 2)
+            or 3 (MISSING), as returned by :py:mod:`plinkio`
+        """
+
+        if not block_size:
+            block_size = self.sample_block_size
 
         sample_list = self.plink_file.get_samples()
+        n_samples = len(sample_list)
+        n_snps = len(self.plink_file.get_loci())
+
+        # each SNP is stored in ceil(n_samples/4) bytes
+        n_bytes = (n_samples + 3) // 4
+
+        bedfile = f"{self.prefix}.bed"
+
+        with open(bedfile, "rb") as handle:
+            magic = handle.read(3)
+
+        if magic != bytes([0x6c, 0x1b, 0x01]):
+            raise PlinkIOException(
+                f"'{bedfile}' is not a SNP-major PLINK binary file")
+
+        if n_samples == 0:
+            return
+
+        if n_snps == 0:
+            for sample in sample_list:
+                yield sample, np.empty(0, dtype=np.uint8)
+
+            return
+
+        data = np.memmap(
+            bedfile, dtype=np.uint8, mode="r", offset=3,
+            shape=(n_snps, n_bytes))
+
+        # from bed codes (00, 01, 10, 11) to plinkio values
+        codes = np.array([0, 3, 1, 2], dtype=np.uint8)
+        shifts = np.array([0, 2, 4, 6], dtype=np.uint8)
+
+        # read a multiple of 4 samples for each block
+        block_bytes = max(1, block_size // 4)
+
+        for start in range(0, n_bytes, block_bytes):
+            stop = min(start + block_bytes, n_bytes)
+
+            # the first sample is in the lowest bits
+            block = (data[:, start:stop, np.newaxis] >> shifts) & 0b11
+            block = codes[block.reshape(n_snps, -1)].T
+
+            first = start * 4
+
+            for idx, genotypes in enumerate(
+                    block[:n_samples - first], start=first):
+                yield sample_list[idx], genotypes
+
+        del data
+
+    def read_pedfile(self, block_size: int = None, *args, **kwargs):
+        """Open pedfile for reading return iterator. Genotypes are read
+        with :py:meth:`read_genotypes` and returned as ped lines"""
+
         locus_list = self.plink_file.get_loci()
-        snp_arrays = list(self.plink_file)
 
         def format_sex(value):
             if value in [1, 2]:
@@ -1292,29 +1976,27 @@ class BinaryPlinkIO(SmarterMixin):
             else:
                 return "0"
 
-        def convert(genotype, locus):
-            # in binary format, allele2 is REF allele1 ALT
-            if genotype == 0:
-                return locus.allele1, locus.allele1
-            elif genotype == 1:
-                return locus.allele2, locus.allele1
-            elif genotype == 2:
-                return locus.allele2, locus.allele2
-            elif genotype == 3:
-                return "0", "0"
-            else:
-                raise CodingException("Genotype %s Not supported" % genotype)
+        # in binary format, allele2 is REF allele1 ALT. Get the alleles of
+        # each genotype (0, 1, 2, 3) for each SNP
+        allele1 = np.array(
+            [locus.allele1 for locus in locus_list], dtype=object)
+        allele2 = np.array(
+            [locus.allele2 for locus in locus_list], dtype=object)
+        missing = np.full(len(locus_list), "0", dtype=object)
 
-        # determine genotype length
-        size = 6 + 2*len(self.mapdata)
+        table = np.stack([
+            np.stack([allele1, allele1], axis=1),
+            np.stack([allele2, allele1], axis=1),
+            np.stack([allele2, allele2], axis=1),
+            np.stack([missing, missing], axis=1),
+        ], axis=1)
 
-        for sample_idx, sample in enumerate(sample_list):
-            # this will be the returned row
-            line = ["0"] * size
+        snp_idx = np.arange(len(locus_list))
 
+        for sample, genotypes in self.read_genotypes(block_size):
             # set values. I need to set a breed code in order to get a
             # proper ped line
-            line[0:6] = [
+            line = [
                 sample.fid,
                 sample.iid,
                 sample.father_iid,
@@ -1323,9 +2005,7 @@ class BinaryPlinkIO(SmarterMixin):
                 str(int(sample.phenotype))
             ]
 
-            for idx, locus in enumerate(locus_list):
-                genotype = snp_arrays[idx][sample_idx]
-                line[6+idx*2], line[6+idx*2+1] = convert(genotype, locus)
+            line += table[snp_idx, genotypes].ravel().tolist()
 
             yield line
 
@@ -1395,64 +2075,37 @@ class IlluminaReportIO(FakePedMixin, SmarterMixin):
             A ped line read as a list.
         """
 
-        # determine genotype length
-        size = 6 + 2*len(self.mapdata)
-
-        # track sample
-        last_sample = None
-
         # need to have snp indexes
         indexes = [record.name for record in self.mapdata]
 
-        # this will be the returned row
-        line = list()
+        # a lookup table to convert allele bytes into strings
+        alleles = np.array([chr(code) for code in range(256)])
 
-        # this is the snp position index
-        idx = 0
+        samples = read_illuminaSamples(self.report, indexes)
 
         # try to returns something like a ped row
-        for row in read_illuminaRow(self.report):
-            if row.sample_id != last_sample:
-                logger.debug(f"Reading sample {row.sample_id}")
-
-                # this is not returned if I'm processing the first sample
-                if last_sample:
-                    yield line
-
-                # initialize an empty array
-                line = ["0"] * size
-
-                if not breed:
-                    fid = self.search_fid(row.sample_id, dataset)
-
-                else:
-                    fid = breed
+        while True:
+            try:
+                sample_id, genotypes = next(samples)
 
-                # set values. I need to set a breed code in order to get a
-                # proper ped line
-                line[0], line[1], line[5] = fid, row.sample_id, "-9"
+            except StopIteration:
+                break
 
-                # track last sample
-                last_sample = row.sample_id
+            except IlluSNPException as exc:
+                raise IlluminaReportException(exc.value) from exc
 
-                # reset index
-                idx = 0
-
-            # check snp name consistency
-            if indexes[idx] != row.snp_name:
-                raise IlluminaReportException(
-                    f"snp positions doens't match "
-                    f"{indexes[idx]}<>{row.snp_name}"
-                )
+            if not breed:
+                fid = self.search_fid(sample_id, dataset)
 
-            # update line relying on records
-            line[6+idx*2], line[6+idx*2+1] = row.allele1_ab, row.allele2_ab
+            else:
+                fid = breed
 
-            # updating indexes
-            idx += 1
+            # set values. I need to set a breed code in order to get a
+            # proper ped line
+            line = [fid, sample_id, "0", "0", "0", "-9"]
+            line += alleles[genotypes.ravel()].tolist()
 
-        # after completing rows, I need to return last one
-        yield line
+            yield line
 
     def get_samples(self) -> list:
         """
@@ -1480,12 +2133,25 @@ class AffyReportIO(FakePedMixin, SmarterMixin):
     genotypes are *transposed*, traking SNP for all samples in a simple line"""
 
     report = None
-    peddata = []
     delimiter = "\t"
     warn_missing_cols = True
     header = []
     n_samples = None
 
+    # sample names and a (n_samples, n_snps) memory-mapped matrix of call
+    # codes, written by read_reportfile
+    sample_names = []
+    calls = None
+
+    # the alleles of each call code. The first code is for MISSING calls
+    call_alleles = []
+
+    # where temporary matrices are stored (def. system temporary directory)
+    tmpdir = None
+
+    # the number of SNPs transposed at once
+    transpose_block_size = 10000
+
     def __init__(
             self,
             report: str = None,
@@ -1548,26 +2214,60 @@ class AffyReportIO(FakePedMixin, SmarterMixin):
             # track a missing genotype
             self.genotypes.append("-/-")
 
-        # track genotypes in the proper column (skip the first 6 columns)
-        for i in range(self.n_samples):
-            call = row[i+1]
+        # encode calls using the call code dictionary. Mind to missing
+        # values, which are encoded as 0
+        codes = []
+
+        for i, call in enumerate(row[1:self.n_samples+1]):
+            if call not in self.__call_codes:
+                if len(self.__call_codes) > np.iinfo(np.uint8).max:
+                    raise AffyReportException(
+                        f"Too many different calls in {self.report}")
+
+                self.__call_codes[call] = len(self.__call_codes)
 
-            # mind to missing values
             if call == "NoCall":
                 logger.debug(
                     f"Skipping SNP {snp_idx}: "
                     f"'{self.mapdata[snp_idx].name}' for sample "
                     f"'{self.header[i+1]}' ({call})")
-                continue
 
-            genotype = list(call)
-            self.peddata[i][6+snp_idx*2] = genotype[0]
-            self.peddata[i][6+snp_idx*2+1] = genotype[1]
+            codes.append(self.__call_codes[call])
+
+        return np.array(codes, dtype=np.uint8)
+
+    def __transpose_calls(self, handle, n_snps: int):
+        """Transpose the (n_snps, n_samples) call codes written in handle
+        into the (n_samples, n_snps) :py:attr:`calls` matrix"""
+
+        self.__calls_file = tempfile.TemporaryFile(dir=self.tmpdir)
+
+        if n_snps == 0 or self.n_samples == 0:
+            self.calls = np.zeros((self.n_samples, n_snps), dtype=np.uint8)
+            return
+
+        src = np.memmap(
+            handle, dtype=np.uint8, mode="r",
+            shape=(n_snps, self.n_samples))
+
+        self.calls = np.memmap(
+            self.__calls_file, dtype=np.uint8, mode="w+",
+            shape=(self.n_samples, n_snps))
+
+        for start in range(0, n_snps, self.transpose_block_size):
+            stop = min(start + self.transpose_block_size, n_snps)
+            self.calls[:, start:stop] = src[start:stop].T
+
+        self.calls.flush()
+
+        del src
 
     def read_reportfile(self, n_samples: int = None, *args, **kwargs):
         """
-        Read reportfile once and generate mapdata and pedata, with genotype
-        informations by sample.
+        Read reportfile once and generate mapdata and genotype calls. Calls
+        are written SNP by SNP in a temporary file, then transposed in the
+        memory-mapped :py:attr:`calls` matrix, in order to read genotypes
+        sample by sample without keeping them in memory.
 
         Parameters
         ----------
@@ -1582,7 +2282,9 @@ class AffyReportIO(FakePedMixin, SmarterMixin):
         """
 
         self.mapdata = []
-        self.peddata = []
+        self.sample_names = []
+        self.calls = None
+        self.__call_codes = {"NoCall": 0}
 
         if n_samples:
             logger.warning(f"Limiting import to first {n_samples} samples")
@@ -1594,68 +2296,69 @@ class AffyReportIO(FakePedMixin, SmarterMixin):
         # coordinates
         self.genotypes = []
 
-        # those informations are required to define the pedfile
+        # those informations are required to define the calls matrix
         n_snps = None
-        size = None
         initialized = False
 
-        # an index to track SNP accross peddata
+        # an index to track SNP accross calls
         snp_idx = 0
 
         # warning user once
         self.warn_missing_cols = True
 
-        # try to returns something like a ped row and derive map data in the
-        # same time
-        for row in read_affymetrixRow(self.report, delimiter=self.delimiter):
-            # first determine how many SNPs and samples I have
-            if not initialized:
-                if not self.n_samples:
-                    self.n_samples = row.n_samples
+        # write calls SNP by SNP and derive map data in the same time
+        with tempfile.TemporaryFile(dir=self.tmpdir) as handle:
+            for row in read_affymetrixRow(
+                    self.report, delimiter=self.delimiter):
+                # first determine how many SNPs and samples I have
+                if not initialized:
+                    if not self.n_samples:
+                        self.n_samples = row.n_samples
 
-                n_snps = row.n_snps
+                    n_snps = row.n_snps
 
-                # read the original header from report file
-                self.__get_header()
+                    # read the original header from report file
+                    self.__get_header()
 
-                # ok create a ped data object with the required dimensions
-                size = 6 + 2 * n_snps
-                self.peddata = [["0"] * size for i in range(self.n_samples)]
+                    # track sample names in row. First column is probeset
+                    # id read them from the original header row
+                    self.sample_names = self.header[1:self.n_samples+1]
 
-                # track sample names in row. First column is probeset id
-                # read them from the original header row
-                for i in range(self.n_samples):
-                    self.peddata[i][1] = self.header[i+1]
+                    # change flag value
+                    initialized = True
 
-                # change flag value
-                initialized = True
+                # deal with a single probeset_id
+                handle.write(self.__process_probeset(row, snp_idx).tobytes())
 
-            # deal with a single probeset_id
-            self.__process_probeset(row, snp_idx)
+                # update SNP column
+                snp_idx += 1
 
-            # update SNP column
-            snp_idx += 1
+                # no more reporting warnings after first row
+                self.warn_missing_cols = False
 
-            # no more reporting warnings after first row
-            self.warn_missing_cols = False
+            # check for n of snp after processing reportfile
+            if snp_idx != n_snps:
+                logger.warning(
+                    f"Got a different number of SNPs {snp_idx}<>{n_snps}.")
 
-        # check for n of snp after processing reportfile
-        if snp_idx != n_snps:
-            logger.warning(
-                f"Got a different number of SNPs {snp_idx}<>{n_snps}.")
+                if snp_idx < n_snps:
+                    logger.warning("Dropping unused SNPs")
 
-            if snp_idx < n_snps:
-                logger.warning("Dropping unused SNPs")
+                else:
+                    raise AffyReportException(
+                        f"Got a different number of SNPs {snp_idx}<>{n_snps}")
 
-                # determining the proper size
-                size = 6 + 2 * snp_idx
+            handle.flush()
 
-                for i, line in enumerate(self.peddata):
-                    self.peddata[i] = line[:size]
+            self.__transpose_calls(handle, snp_idx)
 
-            else:
-                raise AffyReportException(
-                    f"Got a different number of SNPs {snp_idx}<>{n_snps}")
+        # the alleles of each call. Missing values are "0"
+        self.call_alleles = [["0", "0"]] * len(self.__call_codes)
+
+        for call, code in self.__call_codes.items():
+            if code:
+                genotype = list(call)
+                self.call_alleles[code] = [genotype[0], genotype[1]]
 
     def fetch_coordinates(
             self,
@@ -1715,9 +2418,12 @@ class AffyReportIO(FakePedMixin, SmarterMixin):
             A ped line read as a list.
         """
 
-        for line in self.peddata:
-            # instantiate a new object in order to be modified
-            line = line.copy()
+        table = np.array(self.call_alleles, dtype=object)
+
+        for name, codes in zip(self.sample_names, self.calls):
+            # decode a line from calls matrix
+            line = ["0", name, "0", "0", "0", "0"]
+            line += table[codes].ravel().tolist()
 
             logger.debug(f"Prepare {line[:10] + ['...']} to add FID")
 
@@ -1753,12 +2459,7 @@ class AffyReportIO(FakePedMixin, SmarterMixin):
             The sample list.
         """
 
-        sample_list = []
-
-        for line in self.peddata:
-            sample_list.append(line[1])
-
-        return sample_list
+        return list(self.sample_names)
 
 
 def plink_binary_exists(prefix: Path):
@@ -0,0 +1,654 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 19:02:14 2026
+
+@author: Paolo Cozzi <paolo.cozzi@ibba.cnr.it>
+
+Merge PLINK binary files in process. SNPs of all the datasets are collected
+in a unique index sorted by chromosome and position, then the SNP-major
+``.bed`` files are copied into the merged file one block of SNPs at a time
+"""
+
+import json
+import hashlib
+import logging
+import os
+
+from pathlib import Path
+from typing import Union
+
+import numpy as np
+import pandas as pd
+
+from src.features.utils import plink_chrom, plink_chrom_key
+
+# Get an instance of a logger
+logger = logging.getLogger(__name__)
+
+# the magic numbers of a SNP-major bed file
+BED_MAGIC = bytes([0x6c, 0x1b, 0x01])
+
+# the 2 bit genotype codes of a bed file
+HOM_A1, MISSING, HET, HOM_A2 = 0, 1, 2, 3
+
+# convert genotype codes when A1 and A2 alleles are swapped
+FLIP_CODES = np.array([HOM_A2, MISSING, HET, HOM_A1], dtype=np.uint8)
+
+# the missing allele code in bim files
+MISSING_ALLELE = "0"
+
+BIM_COLUMNS = ["chrom", "name", "cm", "position", "allele1", "allele2"]
+FAM_COLUMNS = ["fid", "iid", "father_id", "mother_id", "sex", "phenotype"]
+
+PLINK_SUFFIXES = [".bed", ".bim", ".fam"]
+
+
+class PlinkMergeException(Exception):
+    pass
+
+
+def read_bim(prefix: Union[str, Path]) -> pd.DataFrame:
+    """Read a PLINK ``.bim`` file as a dataframe"""
+
+    return pd.read_csv(
+        f"{prefix}.bim",
+        sep=r"\s+",
+        header=None,
+        names=BIM_COLUMNS,
+        dtype={
+            "chrom": str, "name": str, "cm": str, "position": np.int64,
+            "allele1": str, "allele2": str},
+        keep_default_na=False)
+
+
+def read_fam(prefix: Union[str, Path]) -> pd.DataFrame:
+    """Read a PLINK ``.fam`` file as a dataframe"""
+
+    return pd.read_csv(
+        f"{prefix}.fam",
+        sep=r"\s+",
+        header=None,
+        names=FAM_COLUMNS,
+        dtype=str,
+        keep_default_na=False)
+
+
+# the genotype codes of each byte of a bed file
+UNPACK_TABLE = (
+    np.arange(256, dtype=np.uint8)[:, np.newaxis] >>
+    np.array([0, 2, 4, 6], dtype=np.uint8)) & 3
+
+
+def unpack_genotypes(data: np.ndarray, n_samples: int) -> np.ndarray:
+    """Convert ``(n_snps, bytes_per_snp)`` bed rows into a
+    ``(n_snps, n_samples)`` array of genotype codes"""
+
+    codes = UNPACK_TABLE[data]
+
+    return codes.reshape(len(data), -1)[:, :n_samples]
+
+
+def pack_genotypes(codes: np.ndarray) -> np.ndarray:
+    """Convert a ``(n_snps, n_samples)`` array of genotype codes into bed
+    rows. Samples are padded with zeros as PLINK does"""
+
+    n_snps, n_samples = codes.shape
+    padded = np.zeros((n_snps, -(-n_samples // 4), 4), dtype=np.uint8)
+    padded.reshape(n_snps, -1)[:, :n_samples] = codes
+
+    return (
+        padded[:, :, 0] | (padded[:, :, 1] << 2) |
+        (padded[:, :, 2] << 4) | (padded[:, :, 3] << 6))
+
+
+def as_slice(indexes: np.ndarray) -> Union[slice, np.ndarray]:
+    """Return a slice if indexes are contiguous, in order to assign values
+    without fancy indexing"""
+
+    if len(indexes) and indexes[-1] - indexes[0] + 1 == len(indexes) and (
+            np.diff(indexes) == 1).all():
+        return slice(indexes[0], indexes[-1] + 1)
+
+    return indexes
+
+
+def chrom_key(chrom: pd.Series) -> np.ndarray:
+    """Return the rank of each chromosome, sorting them like plink does:
+    numeric chromosomes in numeric order, then the other chromosomes by
+    name. Each chromosome gets its own rank, so SNPs sorted by rank and
+    position are grouped by chromosome"""
+
+    chroms = sorted(
+        chrom.unique(), key=lambda value: (plink_chrom_key(value), value))
+    ranks = {value: rank for rank, value in enumerate(chroms)}
+
+    return chrom.map(ranks).to_numpy()
+
+
+class BinaryPlinkMerger():
+    """
+    Merge PLINK binary files in process. Samples with the same FID and IID
+    are merged like ``plink --merge-list`` does: missing genotypes are
+    filled with the genotypes of other files, while discordant genotypes
+    are set to missing. SNPs are identified by name, and genotypes are
+    converted when A1 and A2 alleles are swapped in a file::
+
+        merger = BinaryPlinkMerger(["dataset1", "dataset2"])
+        merger.merge("merged")
+
+    Parameters
+    ----------
+    prefixes : list
+        The PLINK binary prefixes to merge.
+    max_block_bytes : int, optional
+        The maximum size of the genotype codes processed at once. The
+        default is 2**26.
+    exclude_samples : dict, optional
+        A ``{prefix: [(fid, iid), ...]}`` dictionary of samples which will
+        not be merged. The default is None.
+    species : str, optional
+        Write chromosome codes like plink does with the ``--chr-set`` of
+        this species (ex. X is 27 for sheep). The default is None.
+    """
+
+    def __init__(
+            self,
+            prefixes: list,
+            max_block_bytes: int = 2**26,
+            exclude_samples: dict = None,
+            species: str = None):
+
+        self.prefixes = [str(prefix) for prefix in prefixes]
+        self.max_block_bytes = max_block_bytes
+        self.species = species
+
+        self.exclude_samples = {
+            str(prefix): set(map(tuple, samples))
+            for prefix, samples in (exclude_samples or {}).items()}
+
+        self.bims = []
+        self.fams = []
+
+        # the merged SNPs and samples
+        self.bim = None
+        self.fam = None
+
+        # the merged SNP and sample indexes of each file
+        self.snp_indexes = []
+        self.sample_indexes = []
+
+        # the merged samples of each file (None means all samples)
+        self.sample_masks = []
+
+        # SNPs with swapped alleles for each file
+        self.flips = []
+
+    def read_files(self):
+        """Read ``.bim`` and ``.fam`` files and define the merged SNPs and
+        samples"""
+
+        for prefix in self.prefixes:
+            logger.info(f"Reading '{prefix}'")
+            self.bims.append(read_bim(prefix))
+            self.fams.append(read_fam(prefix))
+
+        self._merge_samples()
+        self._merge_snps()
+
+    def _merge_samples(self):
+        for prefix, fam in zip(self.prefixes, self.fams):
+            mask = None
+
+            if self.exclude_samples.get(prefix):
+                keys = pd.MultiIndex.from_frame(fam[["fid", "iid"]])
+                mask = ~keys.isin(list(self.exclude_samples[prefix]))
+
+                logger.info(
+                    f"Excluding {(~mask).sum()} samples from '{prefix}'")
+
+            self.sample_masks.append(mask)
+
+        fam = pd.concat(
+            [fam if mask is None else fam[mask]
+             for fam, mask in zip(self.fams, self.sample_masks)],
+            ignore_index=True)
+
+        # samples are identified by FID and IID, the first one wins
+        keys = pd.MultiIndex.from_frame(fam[["fid", "iid"]])
+        self.fam = fam[~keys.duplicated()].reset_index(drop=True)
+
+        index = pd.MultiIndex.from_frame(self.fam[["fid", "iid"]])
+
+        for fam, mask in zip(self.fams, self.sample_masks):
+            if mask is not None:
+                fam = fam[mask]
+
+            keys = pd.MultiIndex.from_frame(fam[["fid", "iid"]])
+            self.sample_indexes.append(index.get_indexer(keys))
+
+        logger.info(f"Got {len(self.fam)} samples")
+
+    def _merge_snps(self):
+        bim = pd.concat(self.bims, ignore_index=True)
+
+        # SNPs are identified by name, the first one wins
+        bim = bim[~bim["name"].duplicated()].copy()
+
+        if self.species:
+            chroms = {
+                chrom: plink_chrom(chrom, self.species)
+                for chrom in bim["chrom"].unique()}
+            bim["chrom"] = bim["chrom"].map(chroms)
+
+        # sort SNPs by chromosome and position
+        order = np.lexsort(
+            (bim["position"].to_numpy(), chrom_key(bim["chrom"])))
+        self.bim = bim.iloc[order].reset_index(drop=True)
+
+        for bim in self.bims:
+            self.snp_indexes.append(
+                pd.Index(self.bim["name"]).get_indexer(bim["name"]))
+
+        logger.info(f"Got {len(self.bim)} SNPs")
+
+        self._merge_alleles()
+
+    def _merge_alleles(self):
+        """Determine the merged alleles and the SNPs which need to be
+        flipped for each file"""
+
+        allele1 = np.full(len(self.bim), MISSING_ALLELE, dtype=object)
+        allele2 = np.full(len(self.bim), MISSING_ALLELE, dtype=object)
+
+        for prefix, bim, indexes in zip(
+                self.prefixes, self.bims, self.snp_indexes):
+            current1, current2 = allele1[indexes], allele2[indexes]
+            new1 = bim["allele1"].to_numpy(dtype=object)
+            new2 = bim["allele2"].to_numpy(dtype=object)
+
+            # which alleles support an orientation
+            known1, known2 = new1 != MISSING_ALLELE, new2 != MISSING_ALLELE
+
+            same = (known1 & (new1 == current1)) | (
+                known2 & (new2 == current2))
+            swapped = (known1 & (new1 == current2)) | (
+                known2 & (new2 == current1))
+
+            same_alleles = self._merge_allele_pairs(
+                current1, current2, new1, new2)
+            swapped_alleles = self._merge_allele_pairs(
+                current1, current2, new2, new1)
+
+            # without evidences, swap only if required
+            flip = (swapped & ~same) | (
+                ~swapped & ~same & ~same_alleles[2] & swapped_alleles[2])
+
+            merged1 = np.where(flip, swapped_alleles[0], same_alleles[0])
+            merged2 = np.where(flip, swapped_alleles[1], same_alleles[1])
+            valid = np.where(flip, swapped_alleles[2], same_alleles[2])
+
+            if not valid.all():
+                names = bim["name"][~valid].tolist()
+                raise PlinkMergeException(
+                    f"{len(names)} SNPs with more than two alleles in "
+                    f"'{prefix}': {names[:10]}")
+
+            allele1[indexes], allele2[indexes] = merged1, merged2
+
+            logger.debug(f"{flip.sum()} SNPs with swapped alleles in {prefix}")
+
+            self.flips.append(flip)
+
+        self.bim["allele1"], self.bim["allele2"] = allele1, allele2
+
+    @staticmethod
+    def _merge_allele_pairs(current1, current2, new1, new2) -> tuple:
+        """Fill missing alleles. Returns the merged alleles and a mask of
+        the compatible pairs"""
+
+        merged1 = np.where(current1 == MISSING_ALLELE, new1, current1)
+        merged2 = np.where(current2 == MISSING_ALLELE, new2, current2)
+
+        valid = (
+            ((new1 == MISSING_ALLELE) | (new1 == merged1)) &
+            ((new2 == MISSING_ALLELE) | (new2 == merged2)) &
+            ((merged1 != merged2) | (merged1 == MISSING_ALLELE)))
+
+        return merged1, merged2, valid
+
+    def _open_bed(self, prefix: str, n_snps: int, n_samples: int):
+        path = f"{prefix}.bed"
+
+        with open(path, "rb") as handle:
+            if handle.read(3) != BED_MAGIC:
+                raise PlinkMergeException(
+                    f"'{path}' is not a SNP-major bed file")
+
+        bytes_per_snp = -(-n_samples // 4)
+
+        if n_snps == 0 or bytes_per_snp == 0:
+            return np.zeros((n_snps, bytes_per_snp), dtype=np.uint8)
+
+        return np.memmap(
+            path,
+            dtype=np.uint8,
+            mode="r",
+            offset=len(BED_MAGIC),
+            shape=(n_snps, bytes_per_snp))
+
+    def merge(self, out_prefix: Union[str, Path]):
+        """
+        Write the merged ``.bed``, ``.bim`` and ``.fam`` files
+
+        Parameters
+        ----------
+        out_prefix : Union[str, Path]
+            The merged files prefix.
+        """
+
+        if self.bim is None:
+            self.read_files()
+
+        n_snps, n_samples = len(self.bim), len(self.fam)
+
+        beds = [
+            self._open_bed(prefix, len(bim), len(fam))
+            for prefix, bim, fam in zip(self.prefixes, self.bims, self.fams)]
+
+        # track which merged samples were already written
+        seen = np.zeros(n_samples, dtype=bool)
+        overlaps = []
+
+        for indexes in self.sample_indexes:
+            overlaps.append(seen[indexes].any())
+            seen[indexes] = True
+
+        # sort SNPs of each file by the merged index
+        orders = [np.argsort(indexes) for indexes in self.snp_indexes]
+        sorted_indexes = [
+            indexes[order] for indexes, order in zip(
+                self.snp_indexes, orders)]
+
+        # samples of a file are usually contiguous in the merged file
+        sample_slices = [
+            as_slice(indexes) for indexes in self.sample_indexes]
+
+        block_size = max(1, self.max_block_bytes // max(1, n_samples))
+
+        logger.info(f"Writing merged genotypes into '{out_prefix}.bed'")
+
+        with open(f"{out_prefix}.bed", "wb") as handle:
+            handle.write(BED_MAGIC)
+
+            for start in range(0, n_snps, block_size):
+                stop = min(start + block_size, n_snps)
+
+                codes = np.full(
+                    (stop - start, n_samples), MISSING, dtype=np.uint8)
+
+                for (bed, fam, indexes, order, samples, mask, flip,
+                     overlap) in zip(
+                        beds, self.fams, sorted_indexes, orders,
+                        sample_slices, self.sample_masks, self.flips,
+                        overlaps):
+
+                    # the SNPs of this file in this block
+                    lo, hi = np.searchsorted(indexes, [start, stop])
+
+                    if lo == hi:
+                        continue
+
+                    rows = order[lo:hi]
+
+                    genotypes = unpack_genotypes(
+                        bed[as_slice(rows)], len(fam))
+
+                    if mask is not None:
+                        genotypes = genotypes[:, mask]
+
+                    # convert genotypes of SNPs with swapped alleles
+                    flipped = flip[rows]
+
+                    if flipped.any():
+                        genotypes[flipped] = FLIP_CODES[genotypes[flipped]]
+
+                    snps = as_slice(indexes[lo:hi] - start)
+
+                    if isinstance(snps, slice) or isinstance(samples, slice):
+                        positions = (snps, samples)
+
+                    else:
+                        positions = np.ix_(snps, samples)
+
+                    if overlap:
+                        genotypes = self._merge_genotypes(
+                            codes[positions], genotypes)
+
+                    codes[positions] = genotypes
+
+                pack_genotypes(codes).tofile(handle)
+
+                logger.debug(f"{stop} SNPs written")
+
+        self.bim.to_csv(
+            f"{out_prefix}.bim", sep="\t", header=False, index=False)
+        self.fam.to_csv(
+            f"{out_prefix}.fam", sep=" ", header=False, index=False)
+
+        logger.info(
+            f"Merged {n_snps} SNPs and {n_samples} samples from "
+            f"{len(self.prefixes)} files")
+
+    @staticmethod
+    def _merge_genotypes(
+            current: np.ndarray, genotypes: np.ndarray) -> np.ndarray:
+        """Merge genotypes of the same samples: missing values are filled
+        and discordant genotypes are set to missing"""
+
+        merged = np.where(current == MISSING, genotypes, current)
+        discordant = (
+            (current != MISSING) & (genotypes != MISSING) &
+            (current != genotypes))
+        merged[discordant] = MISSING
+
+        return merged
+
+
+def plink_checksum(prefix: Union[str, Path], chunk_size: int = 2**20) -> str:
+    """Return the sha256 checksum of the ``.bed``, ``.bim`` and ``.fam``
+    files of a PLINK binary prefix"""
+
+    checksum = hashlib.sha256()
+
+    for suffix in PLINK_SUFFIXES:
+        with open(f"{prefix}{suffix}", "rb") as handle:
+            for chunk in iter(lambda: handle.read(chunk_size), b""):
+                checksum.update(chunk)
+
+    return checksum.hexdigest()
+
+
+def plink_stat(prefix: Union[str, Path]) -> list:
+    """Return the ``[size, mtime]`` of the ``.bed``, ``.bim`` and ``.fam``
+    files of a PLINK binary prefix. Used to detect changed files without
+    reading them"""
+
+    stats = [os.stat(f"{prefix}{suffix}") for suffix in PLINK_SUFFIXES]
+
+    return [[stat.st_size, stat.st_mtime_ns] for stat in stats]
+
+
+def read_merge_manifest(out_prefix: Union[str, Path]) -> list:
+    """Return the files already merged in ``out_prefix``, as tracked in
+    its ``.manifest.json`` file. Returns an empty list if there is no
+    manifest or no merged files"""
+
+    path = Path(f"{out_prefix}.manifest.json")
+
+    if not path.exists() or not all(
+            Path(f"{out_prefix}{suffix}").exists()
+            for suffix in PLINK_SUFFIXES):
+        return []
+
+    with path.open() as handle:
+        return json.load(handle)["files"]
+
+
+def write_merge_manifest(out_prefix: Union[str, Path], files: list):
+    """Write the ``.manifest.json`` file of ``out_prefix``"""
+
+    path = Path(f"{out_prefix}.manifest.json")
+
+    with path.open("w") as handle:
+        json.dump({"files": files}, handle, indent=2)
+
+
+def merge_binary_plink(
+        prefixes: list,
+        out_prefix: Union[str, Path],
+        datasets: list = None,
+        incremental: bool = False,
+        max_block_bytes: int = 2**26,
+        species: str = None) -> bool:
+    """
+    Merge PLINK binary files with :py:class:`BinaryPlinkMerger` and track
+    the merged files, their dataset ids, sizes and modification times in
+    the ``{out_prefix}.manifest.json`` file. With ``incremental``, only the
+    samples of new or changed files are merged with the existing
+    ``out_prefix`` files, while samples of changed or removed files are
+    dropped. A full merge is done when there are no merged files or when
+    the SNPs to merge differ from the SNPs already merged. Files with the
+    same size and modification time are considered unchanged, otherwise
+    their checksums are compared, so checksums are computed only in
+    ``incremental`` mode for new or touched files
+
+    Parameters
+    ----------
+    prefixes : list
+        The PLINK binary prefixes to merge.
+    out_prefix : Union[str, Path]
+        The merged files prefix.
+    datasets : list, optional
+        The dataset ids of each prefix, tracked in manifest. The default is
+        None.
+    incremental : bool, optional
+        Merge only new or changed files. The default is False.
+    max_block_bytes : int, optional
+        The maximum size of the genotype codes processed at once. The
+        default is 2**26.
+    species : str, optional
+        Write chromosome codes like plink does with the ``--chr-set`` of
+        this species. The default is None.
+
+    Returns
+    -------
+    bool
+        True if files were merged (False if merged files are up to date)
+    """
+
+    prefixes = [str(prefix) for prefix in prefixes]
+
+    if datasets is None:
+        datasets = [None] * len(prefixes)
+
+    files = [
+        {
+            "prefix": prefix,
+            "dataset": dataset,
+            "stat": plink_stat(prefix),
+            "checksum": None
+        } for prefix, dataset in zip(prefixes, datasets)
+    ]
+
+    merged = read_merge_manifest(out_prefix) if incremental else []
+    to_merge, exclude_samples = prefixes, None
+
+    # the merged files with the same contents
+    unchanged_prefixes = set()
+
+    if incremental:
+        previous = {item["prefix"]: item for item in merged}
+
+        for item in files:
+            old = previous.get(item["prefix"], {})
+
+            # read files only when size or modification time differ
+            if old and old.get("stat") == item["stat"]:
+                item["checksum"] = old.get("checksum")
+                unchanged_prefixes.add(item["prefix"])
+                continue
+
+            item["checksum"] = plink_checksum(item["prefix"])
+
+            if old and old.get("checksum") == item["checksum"]:
+                unchanged_prefixes.add(item["prefix"])
+
+    if merged:
+        unchanged = [
+            item for item in merged if item["prefix"] in unchanged_prefixes]
+
+        new_files = [
+            item for item in files
+            if item["prefix"] not in unchanged_prefixes]
+        dropped = [item for item in merged if item not in unchanged]
+
+        if not new_files and not dropped:
+            logger.info(f"'{out_prefix}' is up to date")
+
+            # track the new modification times of touched files
+            for item in files:
+                item["samples"] = previous[item["prefix"]]["samples"]
+
+            write_merge_manifest(out_prefix, files)
+
+            return False
+
+        # the SNPs to merge need to be the same already merged
+        snps = set()
+
+        for prefix in prefixes:
+            snps.update(read_bim(prefix)["name"])
+
+        if snps == set(read_bim(out_prefix)["name"]):
+            logger.info(
+                f"Appending {len(new_files)} files to '{out_prefix}' and "
+                f"dropping {len(dropped)} files")
+
+            to_merge = [str(out_prefix)] + [
+                item["prefix"] for item in new_files]
+
+            # samples shared with unchanged files are kept
+            kept = set(
+                tuple(sample) for item in unchanged
+                for sample in item["samples"])
+            exclude_samples = {
+                str(out_prefix): [
+                    sample for item in dropped
+                    for sample in map(tuple, item["samples"])
+                    if sample not in kept]
+            }
+
+        else:
+            logger.warning(
+                f"SNPs differ from '{out_prefix}': doing a full merge")
+
+    # write to a temporary file, since out_prefix could be merged
+    tmp_prefix = f"{out_prefix}.tmp"
+
+    merger = BinaryPlinkMerger(
+        to_merge, max_block_bytes, exclude_samples=exclude_samples,
+        species=species)
+    merger.merge(tmp_prefix)
+
+    for suffix in PLINK_SUFFIXES:
+        os.replace(f"{tmp_prefix}{suffix}", f"{out_prefix}{suffix}")
+
+    # track the samples of each file, required to drop them
+    for item in files:
+        fam = read_fam(item["prefix"])
+        item["samples"] = fam[["fid", "iid"]].to_numpy().tolist()
+
+    write_merge_manifest(out_prefix, files)
+
+    return True
@@ -17,7 +17,7 @@ from typing import List, Tuple, Union
 from pymongo import database, ReturnDocument, MongoClient
 from dotenv import find_dotenv, load_dotenv
 
-from .utils import get_project_dir, UnknownCountry, countries
+from .utils import get_project_dir, UnknownCountry, get_countries
 
 SPECIES2CODE = {
     "Sheep": "OA",
@@ -59,7 +59,9 @@ def global_connection(database_name: str = SMARTERDB) -> MongoClient:
         # then load up the .env entries as environment variables
         load_dotenv(find_dotenv())
 
-        # track connection somewhere
+        # track connection somewhere. Connect on the first operation: a
+        # connected client makes every script (even --help) wait for its
+        # monitor threads on exit
         CLIENT = mongoengine.connect(
             database_name,
             username=os.getenv("MONGODB_SMARTER_USER"),
@@ -68,7 +70,8 @@ def global_connection(database_name: str = SMARTERDB) -> MongoClient:
             port=os.getenv("MONGODB_SMARTER_PORT", default=27017),
             authentication_source='admin',
             alias=DB_ALIAS,
-            uuidRepresentation="standard")
+            uuidRepresentation="standard",
+            connect=False)
 
     return CLIENT
 
@@ -191,7 +194,7 @@ class Country(mongoengine.Document):
             if name.lower() == "unknown":
                 country = UnknownCountry()
             else:
-                country = countries.get(name=name)
+                country = get_countries().get(name=name)
 
             if country:
                 self.alpha_2 = country.alpha_2
@@ -465,28 +468,57 @@ class Dataset(mongoengine.Document):
 
 
 def getNextSequenceValue(
-        sequence_name: str, mongodb: database.Database):
+        sequence_name: str, mongodb: database.Database, count: int = 1):
     """Read from :py:class:`Counter` collection and determine the next sequence
-    number to be used for the SMARTER ID"""
+    number to be used for the SMARTER ID. When reserving more than one value,
+    the last reserved value is returned"""
 
     # this method is something similar to findAndModify,
     # update a document and after get the UPDATED document
     # https://docs.mongodb.com/manual/reference/method/db.collection.findAndModify/index.html#db.collection.findAndModify
     sequenceDocument = mongodb.counters.find_one_and_update(
         {"_id": sequence_name},
-        {"$inc": {"sequence_value": 1}},
+        {"$inc": {"sequence_value": count}},
         return_document=ReturnDocument.AFTER
     )
 
     return sequenceDocument['sequence_value']
 
 
-def getSmarterId(
+def reserveSequenceValues(
+        sequence_name: str, mongodb: database.Database, count: int) -> range:
+    """Atomically reserve ``count`` sequence numbers with a single update
+    and return them as a range"""
+
+    last = getNextSequenceValue(sequence_name, mongodb, count)
+
+    return range(last - count + 1, last + 1)
+
+
+def releaseSequenceValues(
+        sequence_name: str, mongodb: database.Database,
+        values: range) -> bool:
+    """Give back the last reserved sequence ``values`` which weren't used.
+    Values are released only if they are still the last reserved ones (no
+    other values were reserved in the meantime). Returns True if values are
+    released"""
+
+    if not values:
+        return True
+
+    result = mongodb.counters.update_one(
+        {"_id": sequence_name, "sequence_value": values[-1]},
+        {"$inc": {"sequence_value": -len(values)}})
+
+    return result.modified_count == 1
+
+
+def getSmarterIdPrefix(
         species_class: str,
         country: str,
         breed: str) -> str:
     """
-    Generate a new SMARTER ID object using the internal counter collections
+    Determine the SMARTER ID prefix (country, species and breed codes)
 
     Parameters
     ----------
@@ -505,7 +537,7 @@ def getSmarterId(
     Returns
     -------
     str
-        A new smarter_id.
+        The SMARTER ID prefix (ex. 'ITOA-TEX').
     """
 
     # this should be the connection I made
@@ -529,7 +561,7 @@ def getSmarterId(
     if country.lower() == "unknown":
         country = UnknownCountry()
     else:
-        country = countries.get(name=country)
+        country = get_countries().get(name=country)
 
     # get two letter code for country
     country_code = country.alpha_2
@@ -539,19 +571,83 @@ def getSmarterId(
     breed_code = database.breeds.find_one(
         {"species": species_class, "name": breed})["code"]
 
+    return f"{country_code}{species_code}-{breed_code}"
+
+
+def getSmarterId(
+        species_class: str,
+        country: str,
+        breed: str) -> str:
+    """
+    Generate a new SMARTER ID object using the internal counter collections
+
+    Parameters
+    ----------
+    species_class : str
+        The class of the species (should be 'Goat' or 'Sheep').
+    country : str
+        The country name of the sample.
+    breed : str
+        The breed name of the sample.
+
+    Raises
+    ------
+    SmarterDBException
+        Raised when passing a wrong species or no one.
+
+    Returns
+    -------
+    str
+        A new smarter_id.
+    """
+
+    return getSmarterIds(species_class, country, breed, 1)[0]
+
+
+def getSmarterIds(
+        species_class: str,
+        country: str,
+        breed: str,
+        count: int) -> List[str]:
+    """
+    Generate ``count`` new SMARTER IDs reserving sequence values with a
+    single update of the internal counter collections
+
+    Parameters
+    ----------
+    species_class : str
+        The class of the species (should be 'Goat' or 'Sheep').
+    country : str
+        The country name of the samples.
+    breed : str
+        The breed name of the samples.
+    count : int
+        How many SMARTER IDs are required.
+
+    Raises
+    ------
+    SmarterDBException
+        Raised when passing a wrong species or no one.
+
+    Returns
+    -------
+    List[str]
+        A list of new smarter_id.
+    """
+
+    prefix = getSmarterIdPrefix(species_class, country, breed)
+
     # derive sequence_name from species_class
     sequence_name = f"sample{species_class}"
 
-    # get the sequence number and define smarter id
-    sequence_id = getNextSequenceValue(
-        sequence_name, database)
+    # get the sequence numbers
+    database = mongoengine.connection.get_db(alias=DB_ALIAS)
+    sequence_ids = reserveSequenceValues(sequence_name, database, count)
 
     # padding numbers
-    sequence_id = str(sequence_id).zfill(9)
-
-    smarter_id = f"{country_code}{species_code}-{breed_code}-{sequence_id}"
-
-    return smarter_id
+    return [
+        f"{prefix}-{str(sequence_id).zfill(9)}"
+        for sequence_id in sequence_ids]
 
 
 class SEX(bytes, Enum):
@@ -892,6 +988,91 @@ def get_or_create_sample(
     return sample, created
 
 
+def bulk_create_samples(
+        SampleSpecies: Union[SampleGoat, SampleSheep],
+        samples: List[Union[SampleGoat, SampleSheep]]) -> List[
+            Union[SampleGoat, SampleSheep]]:
+    """
+    Insert new samples with a single ``insert_many``. SMARTER IDs are
+    reserved with a single counter update and breed ``n_individuals``
+    counters are updated with one ``$inc`` for each breed
+
+    Parameters
+    ----------
+    SampleSpecies : Union[SampleGoat, SampleSheep]
+        the class required for insert.
+    samples : List[Union[SampleGoat, SampleSheep]]
+        A list of new (not saved) samples.
+
+    Raises
+    ------
+    SmarterDBException
+        Raised when trying to insert an already saved sample.
+
+    Returns
+    -------
+    List[Union[SampleGoat, SampleSheep]]
+        The inserted samples.
+    """
+
+    if not samples:
+        return samples
+
+    for sample in samples:
+        if sample.id:
+            raise SmarterDBException(f"Sample '{sample}' is already saved")
+
+    # reserve all the smarter ids at once. Prefixes are determined once for
+    # each country and breed
+    new_ids = [sample for sample in samples if not sample.smarter_id]
+
+    if new_ids:
+        species_class = SampleSpecies.species_class
+
+        database = mongoengine.connection.get_db(alias=DB_ALIAS)
+        sequence_ids = iter(reserveSequenceValues(
+            f"sample{species_class}", database, len(new_ids)))
+
+        prefixes = dict()
+
+        for sample in new_ids:
+            key = (sample.country, sample.breed)
+
+            if key not in prefixes:
+                prefixes[key] = getSmarterIdPrefix(species_class, *key)
+
+            sample.smarter_id = (
+                f"{prefixes[key]}-{str(next(sequence_ids)).zfill(9)}")
+
+    for sample in samples:
+        sample.validate()
+
+    result = SampleSpecies._get_collection().insert_many(
+        [sample.to_mongo() for sample in samples])
+
+    for sample, inserted_id in zip(samples, result.inserted_ids):
+        sample.id = inserted_id
+
+        # mark sample as saved
+        sample._created = False
+        sample._clear_changed_fields()
+
+    logger.info(f"Inserted {len(samples)} samples in database")
+
+    # incrementing breed n_individuals counters
+    counts = dict()
+
+    for sample in samples:
+        counts[sample.breed] = counts.get(sample.breed, 0) + 1
+
+    for breed, count in counts.items():
+        Breed.objects(
+            species=SampleSpecies.species_class, name=breed).update_one(
+                inc__n_individuals=count)
+
+    return samples
+
+
 def get_sample_type(dataset: Dataset):
     """
     test if foreground or background dataset
@@ -979,6 +1160,16 @@ class Location(mongoengine.EmbeddedDocument):
         if illumina_top:
             self.illumina_top = illumina_top
 
+    def _mark_as_changed(self, key):
+        # invalidate the locations index of the parent variant, if any
+        if key in ["version", "imported_from"]:
+            instance = getattr(self, "_instance", None)
+
+            if hasattr(instance, "_locations_index"):
+                instance._locations_index = None
+
+        super(Location, self)._mark_as_changed(key)
+
     @property
     def illumina_top(self):
         """Return genotype in illumina top format"""
@@ -1334,17 +1525,33 @@ class VariantSpecies(mongoengine.Document):
     cust_id = mongoengine.StringField()
     """The affymetrix customer id (which is the illumina name)"""
 
-    # abstract class with custom indexes
-    # TODO: need a index for position (chrom, position, version)
+    # a (version, imported_from) -> [index, ...] cache, see
+    # get_location_index
+    _locations_index = None
+
+    # abstract class with custom indexes. Location fields are indexed in
+    # the same order of the $elemMatch queries used to select variants by
+    # assembly and position
     meta = {
         'abstract': True,
         'indexes': [
             {
                 'fields': [
+                    "locations.version",
+                    "locations.imported_from",
                     "locations.chrom",
                     "locations.position"
                 ],
             },
+            {
+                'fields': ["name", "chip_name"],
+            },
+            {
+                'fields': [
+                    "probesets.chip_name",
+                    "probesets.probeset_id"
+                ],
+            },
             {
                 'fields': ["affy_snp_id"],
                 'partialFilterExpression': {
@@ -1378,6 +1585,44 @@ class VariantSpecies(mongoengine.Document):
         # default save method
         super(VariantSpecies, self).save(*args, **kwargs)
 
+    def _mark_as_changed(self, key):
+        """Invalidate the locations index when locations are modified"""
+
+        if key and key.split(".")[0] == "locations":
+            self._locations_index = None
+
+        super(VariantSpecies, self)._mark_as_changed(key)
+
+    def _get_locations_index(
+            self, version: str, imported_from: str) -> list:
+        """Returns the indexes of all the locations for assembly version
+        and imported source. A ``(version, imported_from) -> [index, ...]``
+        dictionary is built the first time and then reused until
+        ``locations`` is modified"""
+
+        key = (version, imported_from)
+
+        if self._locations_index is not None:
+            indexes = self._locations_index.get(key, [])
+
+            # check that locations were not modified in place
+            if all(self._location_key(idx) == key for idx in indexes):
+                return indexes
+
+        locations_index = dict()
+
+        for idx in range(len(self.locations)):
+            locations_index.setdefault(self._location_key(idx), []).append(
+                idx)
+
+        self._locations_index = locations_index
+
+        return locations_index.get(key, [])
+
+    def _location_key(self, idx: int) -> tuple:
+        location = self.locations[idx]
+        return (location.version, location.imported_from)
+
     def get_location_index(self, version: str, imported_from='SNPchiMp v.3'):
         """Returns location index for assembly version and imported source
 
@@ -1389,14 +1634,14 @@ class VariantSpecies(mongoengine.Document):
             int: the index of the location requested
         """
 
-        for index, location in enumerate(self.locations):
-            if (location.version == version and
-                    location.imported_from == imported_from):
-                return index
+        indexes = self._get_locations_index(version, imported_from)
 
-        raise SmarterDBException(
+        if not indexes:
+            raise SmarterDBException(
                 f"Location '{version}' '{imported_from}' is not in locations"
-        )
+            )
+
+        return indexes[0]
 
     def get_location(self, version: str, imported_from='SNPchiMp v.3'):
         """Returns location for assembly version and imported source
@@ -1409,21 +1654,14 @@ class VariantSpecies(mongoengine.Document):
             Location: the genomic coordinates
         """
 
-        def custom_filter(location: Location):
-            if (location.version == version and
-                    location.imported_from == imported_from):
-                return True
-
-            return False
-
-        locations = list(filter(custom_filter, self.locations))
+        indexes = self._get_locations_index(version, imported_from)
 
-        if len(locations) != 1:
+        if len(indexes) != 1:
             raise SmarterDBException(
                 "Couldn't determine a unique location for "
                 f"'{self.name}' '{version}' '{imported_from}'")
 
-        return locations[0]
+        return self.locations[indexes[0]]
 
 
 class VariantSheep(VariantSpecies):
@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 10:12:25 2026
+
+@author: Paolo Cozzi <paolo.cozzi@ibba.cnr.it>
+
+Dump a slice of SMARTER variants into a local NumPy archive and use it to
+resolve SNP coordinates without a database connection
+"""
+
+import logging
+
+from pathlib import Path
+from typing import Union
+
+import numpy as np
+
+from mongoengine.queryset import Q
+
+from .smarterdb import (
+    VariantSheep, VariantGoat, Location, SmarterDBException)
+
+# Get an instance of a logger
+logger = logging.getLogger(__name__)
+
+# the Location attributes stored in a snapshot
+LOCATION_FIELDS = [
+    "chrom", "illumina", "illumina_forward", "illumina_strand",
+    "affymetrix_ab", "strand"]
+
+# a separator used to store list of values in a single string
+SEPARATOR = ","
+
+
+def export_snapshot(
+        path: Union[str, Path],
+        VariantSpecies: Union[VariantSheep, VariantGoat],
+        assemblies: list,
+        chip_name: str = None) -> int:
+    """
+    Write variants having a location in all the provided assemblies in an
+    uncompressed NumPy ``.npz`` archive
+
+    Parameters
+    ----------
+    path : Union[str, Path]
+        The output file path.
+    VariantSpecies : Union[VariantSheep, VariantGoat]
+        The variant class to export.
+    assemblies : list
+        A list of AssemblyConf objects (with ``version`` and ``imported_from``
+        attributes).
+    chip_name : str, optional
+        Export only variants of this chip. The default is None (all chips).
+
+    Returns
+    -------
+    int
+        The number of exported variants.
+    """
+
+    query = Q()
+
+    for assembly in assemblies:
+        query &= Q(locations__match=assembly._asdict())
+
+    if chip_name:
+        query &= (Q(chip_name=chip_name) | Q(probesets__chip_name=chip_name))
+
+    variants = VariantSpecies.objects(query).only(
+        "name", "chip_name", "rs_id", "probesets", "locations")
+
+    names, chips = [], []
+    rs_ids, rs_variants = [], []
+    probesets, probeset_chips, probeset_variants = [], [], []
+
+    # location attributes by assembly
+    counts = [[] for assembly in assemblies]
+    positions = [[] for assembly in assemblies]
+    fields = {
+        field: [[] for assembly in assemblies] for field in LOCATION_FIELDS}
+
+    for row, variant in enumerate(variants):
+        names.append(variant.name)
+        chips.append(SEPARATOR.join(variant.chip_name))
+
+        for rs_id in variant.rs_id or []:
+            rs_ids.append(rs_id)
+            rs_variants.append(row)
+
+        for probeset in variant.probesets or []:
+            for probeset_id in probeset.probeset_id:
+                probesets.append(probeset_id)
+                probeset_chips.append(probeset.chip_name)
+                probeset_variants.append(row)
+
+        for i, assembly in enumerate(assemblies):
+            locations = [
+                location for location in variant.locations
+                if location.version == assembly.version and
+                location.imported_from == assembly.imported_from]
+
+            # only unique locations are returned by a snapshot
+            counts[i].append(len(locations))
+            location = locations[0]
+
+            positions[i].append(location.position)
+
+            for field in LOCATION_FIELDS:
+                fields[field][i].append(getattr(location, field) or "")
+
+    # sort variants by name and all the other keys in order to do a
+    # binary search. Track the new variant indexes
+    order = np.argsort(np.array(names, dtype=str), kind="stable")
+    rows = np.empty_like(order)
+    rows[order] = np.arange(len(order))
+
+    rs_order = np.argsort(np.array(rs_ids, dtype=str), kind="stable")
+    probeset_order = np.argsort(np.array(probesets, dtype=str), kind="stable")
+
+    def sort_variants(values, dtype):
+        return np.array(values, dtype=dtype).reshape(
+            len(assemblies), len(names))[:, order]
+
+    data = {
+        "species": np.array(VariantSpecies.__name__.replace("Variant", "")),
+        "versions": np.array([assembly.version for assembly in assemblies]),
+        "imported_from": np.array(
+            [assembly.imported_from for assembly in assemblies]),
+        "name": np.array(names, dtype=str)[order],
+        "chip_name": np.array(chips, dtype=str)[order],
+        "rs_id": np.array(rs_ids, dtype=str)[rs_order],
+        "rs_id_variant": rows[
+            np.array(rs_variants, dtype=np.int64)[rs_order]],
+        "probeset_id": np.array(probesets, dtype=str)[probeset_order],
+        "probeset_chip": np.array(
+            probeset_chips, dtype=str)[probeset_order],
+        "probeset_variant": rows[
+            np.array(probeset_variants, dtype=np.int64)[probeset_order]],
+        "count": sort_variants(counts, np.int64),
+        "position": sort_variants(positions, np.int64),
+    }
+
+    for field in LOCATION_FIELDS:
+        data[field] = sort_variants(fields[field], str)
+
+    with open(path, "wb") as handle:
+        np.savez(handle, **data)
+
+    logger.info(f"Exported {len(names)} variants in '{path}'")
+
+    return len(names)
+
+
+class SnapshotVariant():
+    """A variant read from a :py:class:`VariantSnapshot`. Models the
+    attributes used when fetching coordinates from a
+    :py:class:`VariantSheep` or :py:class:`VariantGoat` object"""
+
+    def __init__(self, snapshot, row: int):
+        self.snapshot = snapshot
+        self.id = row
+
+    @property
+    def name(self):
+        return str(self.snapshot.data["name"][self.id])
+
+    def __str__(self):
+        return f"name='{self.name}'"
+
+    def get_location(self, version: str, imported_from='SNPchiMp v.3'):
+        """Returns location for assembly version and imported source
+
+        Args:
+            version (str): assembly version (ex: 'Oar_v3.1')
+            imported_from (str): coordinates source (ex: 'SNPchiMp v.3')
+
+        Returns:
+            Location: the genomic coordinates
+        """
+
+        return self.snapshot.get_location(self.id, version, imported_from)
+
+
+class VariantSnapshot():
+    """Read variants from a file written by :py:func:`export_snapshot`.
+    Variants names, rs_id and probeset_id are sorted, so variants are
+    searched using a binary search on the loaded arrays"""
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = path
+
+        # archive is not compressed: read all the arrays once
+        with np.load(path, allow_pickle=False) as archive:
+            self.data = {key: archive[key] for key in archive.files}
+
+        self.species = str(self.data["species"])
+        self.assemblies = list(zip(
+            self.data["versions"].tolist(),
+            self.data["imported_from"].tolist()))
+
+        logger.info(
+            f"Read {len(self)} {self.species} variants from '{path}' "
+            f"({self.assemblies})")
+
+    def __len__(self):
+        return len(self.data["name"])
+
+    def _get_assembly_index(self, version: str, imported_from: str) -> int:
+        try:
+            return self.assemblies.index((version, imported_from))
+
+        except ValueError:
+            raise SmarterDBException(
+                f"Location '{version}' '{imported_from}' is not in snapshot "
+                f"'{self.path}'")
+
+    def _search_sorted(self, keys: np.ndarray, names: list) -> dict:
+        """Return a {name: [idx, ...]} dictionary of the positions of names
+        in the sorted keys array"""
+
+        results = dict()
+        names = np.array(names, dtype=str)
+
+        left = np.searchsorted(keys, names, side="left")
+        right = np.searchsorted(keys, names, side="right")
+
+        for name, start, stop in zip(names.tolist(), left, right):
+            results[name] = list(range(start, stop))
+
+        return results
+
+    def _has_locations(self, rows: np.ndarray, assemblies: list):
+        """Filter rows having a location in all assemblies"""
+
+        mask = np.ones(len(rows), dtype=bool)
+
+        for assembly in assemblies:
+            i = self._get_assembly_index(*assembly)
+            mask &= self.data["count"][i][rows] > 0
+
+        return rows[mask]
+
+    def search_variants(
+            self,
+            names: list,
+            search_field: str,
+            chip_name: str,
+            assemblies: list) -> dict:
+        """
+        Search variants by name, rs_id or probeset_id
+
+        Parameters
+        ----------
+        names : list
+            The names to search for.
+        search_field : str
+            Search variant by field ('name', 'rs_id' or 'probeset_id').
+        chip_name : str
+            Limit search to this chip_name.
+        assemblies : list
+            Return only variants having a location in all of these
+            assemblies.
+
+        Returns
+        -------
+        dict
+            A ``{name: {variant.id: variant}}`` dictionary
+        """
+
+        if search_field == 'name':
+            found = self._search_sorted(self.data["name"], names)
+
+        elif search_field == 'rs_id':
+            found = self._search_sorted(self.data["rs_id"], names)
+            found = {
+                name: self.data["rs_id_variant"][idxs].tolist()
+                for name, idxs in found.items()}
+
+        elif search_field == 'probeset_id':
+            found = self._search_sorted(self.data["probeset_id"], names)
+            found = {
+                name: [
+                    self.data["probeset_variant"][idx] for idx in idxs
+                    if self.data["probeset_chip"][idx] == chip_name]
+                for name, idxs in found.items()}
+
+        else:
+            raise NotImplementedError(
+                f"Search field '{search_field}' not supported by snapshot")
+
+        matches = dict()
+
+        for name, rows in found.items():
+            rows = np.array(rows, dtype=np.int64)
+
+            # probesets are already filtered by chip
+            if chip_name and search_field != 'probeset_id':
+                rows = np.array([
+                    row for row in rows
+                    if chip_name in self.data["chip_name"][row].split(
+                        SEPARATOR)], dtype=np.int64)
+
+            rows = self._has_locations(rows, assemblies)
+
+            matches[name] = {
+                int(row): SnapshotVariant(self, int(row)) for row in rows}
+
+        return matches
+
+    def index_by_positions(self, chroms: list, assemblies: list) -> dict:
+        """
+        Index variants by position in the first assembly
+
+        Parameters
+        ----------
+        chroms : list
+            Index only variants in those chromosomes.
+        assemblies : list
+            Return only variants having a location in all of these
+            assemblies. Variants are indexed using the first one.
+
+        Returns
+        -------
+        dict
+            A ``{(chrom, position): {variant.id: variant}}`` dictionary
+        """
+
+        index = dict()
+
+        i = self._get_assembly_index(*assemblies[0])
+
+        rows = np.flatnonzero(np.isin(
+            self.data["chrom"][i], np.array(chroms, dtype=str)))
+        rows = self._has_locations(rows, assemblies)
+
+        for row, chrom, position in zip(
+                rows.tolist(),
+                self.data["chrom"][i][rows].tolist(),
+                self.data["position"][i][rows].tolist()):
+            key = (chrom, position)
+            index.setdefault(key, dict())[row] = SnapshotVariant(self, row)
+
+        return index
+
+    def get_location(
+            self, row: int, version: str, imported_from: str) -> Location:
+        """Returns location for variant, assembly version and imported
+        source
+
+        Args:
+            row (int): the variant index in snapshot
+            version (str): assembly version (ex: 'Oar_v3.1')
+            imported_from (str): coordinates source (ex: 'SNPchiMp v.3')
+
+        Returns:
+            Location: the genomic coordinates
+        """
+
+        i = self._get_assembly_index(version, imported_from)
+
+        if self.data["count"][i][row] != 1:
+            raise SmarterDBException(
+                "Couldn't determine a unique location for "
+                f"'{self.data['name'][row]}' '{version}' '{imported_from}'")
+
+        kwargs = {
+            field: str(self.data[field][i][row]) or None
+            for field in LOCATION_FIELDS}
+
+        return Location(
+            version=version,
+            imported_from=imported_from,
+            position=int(self.data["position"][i][row]),
+            **kwargs)
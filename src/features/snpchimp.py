@@ -10,6 +10,8 @@ import csv
 import logging
 import collections
 
+from typing import Iterator
+
 from src.features.utils import text_or_gzip_open
 
 # Get an instance of a logger
@@ -53,19 +55,71 @@ def read_snpChimp(path: str, size=2048):
         # define a datatype for my data
         SnpChimp = collections.namedtuple("SnpChimp", header)
 
+        # get column indexes once
+        position_idx = header.index('position')
+        chromosome_idx = header.index('chromosome')
+
         # add records to data
         for record in reader:
             # forcing data types
-            record[header.index('position')] = int(
-                record[header.index('position')])
+            record[position_idx] = int(record[position_idx])
 
             # transform NULL valies in None
             record = [None if col == 'NULL' else col for col in record]
 
             # clean chromosome
-            record[header.index('chromosome')] = clean_chrom(
-                record[header.index('chromosome')])
+            record[chromosome_idx] = clean_chrom(record[chromosome_idx])
 
             # convert into collection
             record = SnpChimp._make(record)
             yield record
+
+
+def read_snpChimp_columns(
+        path: str, chunksize: int = 50000, size=2048) -> Iterator[dict]:
+    """Read a SNPchiMp dump like :py:func:`read_snpChimp` does, but return
+    records in chunks of columns. Data are read with :py:func:`pandas.read_csv`
+    and cleaned one chunk at a time
+
+    Args:
+        path (str): the SNPchiMp dump path (could be gzipped)
+        chunksize (int): the maximum number of records in each chunk
+        size (int): the number of bytes read to determine the CSV dialect
+
+    Yields:
+        dict: a ``{column: [value, ...]}`` dictionary with lowercase column
+        names as keys. ``NULL`` values are returned as None
+    """
+
+    # pandas is required only here: don't slow down the import of this module
+    import pandas as pd
+
+    sniffer = csv.Sniffer()
+
+    with text_or_gzip_open(path) as handle:
+        dialect = sniffer.sniff(handle.read(size))
+        handle.seek(0)
+
+        reader = pd.read_csv(
+            handle,
+            sep=dialect.delimiter,
+            dtype=str,
+            na_values=['NULL'],
+            keep_default_na=False,
+            chunksize=chunksize)
+
+        for chunk in reader:
+            # sanitize column names
+            chunk.columns = [column.lower() for column in chunk.columns]
+
+            # forcing data types
+            chunk['position'] = chunk['position'].astype(int)
+
+            # clean chromosome (like clean_chrom does)
+            chunk['chromosome'] = chunk['chromosome'].mask(
+                chunk['chromosome'] == "99", "0")
+
+            # transform NULL values in None
+            chunk = chunk.astype(object).where(chunk.notna(), None)
+
+            yield {column: chunk[column].tolist() for column in chunk.columns}
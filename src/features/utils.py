@@ -10,20 +10,51 @@ import io
 import re
 import gzip
 import logging
+import functools
 import pathlib
 import collections
 from typing import Tuple, List
 
-from pycountry import countries
-
 # Get an instance of a logger
 logger = logging.getLogger(__name__)
 
-# manage custom countries
-# english name for turkey
-countries.add_entry(
-    alpha_2="TR", alpha_3="TUR", name="Turkey", numeric="792",
-    official_name='Republic of Türkiye')
+# the number of autosomes of each species, as the plink '--chr-set' option
+PLINK_CHR_SET = {
+    'Sheep': 26,
+    'Goat': 29
+}
+
+# the offsets of non-autosomal chromosomes after the last autosome, as plink
+# does with '--chr-set'
+PLINK_CHR_OFFSETS = {
+    'X': 1,
+    'Y': 2,
+    'XY': 3,
+    'MT': 4,
+    'M': 4,
+}
+
+
+@functools.lru_cache(maxsize=None)
+def get_countries():
+    """Return the :py:mod:`pycountry` countries database. pycountry is
+    imported on the first call, since loading its database slows down the
+    startup of every script
+
+    Returns:
+        pycountry.db.Database: the countries database with SMARTER custom
+        countries
+    """
+
+    from pycountry import countries
+
+    # manage custom countries
+    # english name for turkey
+    countries.add_entry(
+        alpha_2="TR", alpha_3="TUR", name="Turkey", numeric="792",
+        official_name='Republic of Türkiye')
+
+    return countries
 
 
 def sanitize(
@@ -218,6 +249,56 @@ def skip_comments(
     return position, skipped
 
 
+def plink_chrom(chrom: str, species: str) -> str:
+    """Return the chromosome code written by plink in a .bim file, as it
+    does with the '--chr-set' option of the species: X, Y, XY and MT
+    become numeric codes after the last autosome (ex. X is 27 for sheep and
+    30 for goat), while contigs are returned as they are
+
+    Args:
+        chrom (str): the chromosome as stored in SMARTER database
+        species (str): the species (Sheep or Goat)
+
+    Returns:
+        str: the plink chromosome code
+    """
+
+    chrom = str(chrom)
+    code = chrom.upper()
+
+    if code.startswith("CHR"):
+        code = code[3:]
+
+    if code.isdigit():
+        return str(int(code))
+
+    if code in PLINK_CHR_OFFSETS:
+        return str(
+            PLINK_CHR_SET[species.capitalize()] + PLINK_CHR_OFFSETS[code])
+
+    return chrom
+
+
+def plink_chrom_key(chrom: str) -> tuple:
+    """Return a key to sort plink chromosome codes like plink does: numeric
+    codes in numeric order, then contigs by name
+
+    Args:
+        chrom (str): a plink chromosome code, as returned by
+            :py:func:`plink_chrom`
+
+    Returns:
+        tuple: the sort key
+    """
+
+    chrom = str(chrom)
+
+    if chrom.isdigit():
+        return (0, int(chrom), "")
+
+    return (1, 0, chrom)
+
+
 class UnknownCountry():
     """Deal with unknown country"""
 
@@ -9,10 +9,14 @@ Created on Fri Apr  9 17:44:00 2021
 import json
 import pathlib
 import logging
+import functools
+
+from unittest.mock import patch
 
 from dateutil.parser import parse as parse_date
 
 import mongomock
+from mongomock.collection import BulkOperationBuilder
 from mongoengine import connect, disconnect, connection
 
 import src.features.smarterdb
@@ -26,9 +30,27 @@ FIXTURES_DIR = pathlib.Path(__file__).parent / "fixtures"
 logger = logging.getLogger(__name__)
 
 
+def ignore_sort(method):
+    """pymongo>=4.11 bulk operations pass a 'sort' argument which is not
+    supported by mongomock"""
+
+    @functools.wraps(method)
+    def wrapper(self, *args, sort=None, **kwargs):
+        return method(self, *args, **kwargs)
+
+    return wrapper
+
+
 class MongoMockMixin():
     @classmethod
     def setUpClass(cls):
+        # let mongomock run bulk_write with recent pymongo versions
+        cls.bulk_patcher = patch.multiple(
+            BulkOperationBuilder,
+            add_update=ignore_sort(BulkOperationBuilder.add_update),
+            add_replace=ignore_sort(BulkOperationBuilder.add_replace))
+        cls.bulk_patcher.start()
+
         src.features.smarterdb.CLIENT = connect(
             'mongoenginetest',
             host='mongodb://localhost',
@@ -41,6 +63,8 @@ class MongoMockMixin():
     def tearDownClass(cls):
         disconnect()
 
+        cls.bulk_patcher.stop()
+
 
 class SmarterIDMixin():
     """Common set up for classes which require a smarter id to work properly"""
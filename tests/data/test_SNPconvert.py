@@ -14,7 +14,9 @@ from click.testing import CliRunner
 from plinkio import plinkfile
 
 from src.data.SNPconvert import main as snp_convert
-from src.features.smarterdb import SmarterDBException
+from src.features.smarterdb import SmarterDBException, VariantSheep
+from src.features.snapshot import export_snapshot
+from src.data.common import WORKING_ASSEMBLIES
 
 from ..common import (
     MongoMockMixin, VariantSheepMixin, SupportedChipMixin)
@@ -211,6 +213,83 @@ class SNPconvertTest(
             plink_path = results_dir / "plinktest_updated"
             self.assertFalse(plink_path.exists())
 
+    def test_import_from_text_plink_snapshot(self):
+        # create a temporary directory using the context manager
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            working_dir = pathlib.Path(tmpdirname)
+            results_dir = working_dir / "results"
+            snapshot = working_dir / "snapshot.npz"
+
+            # copy test data files
+            self.link_files(working_dir)
+
+            export_snapshot(
+                snapshot, VariantSheep, [WORKING_ASSEMBLIES["OAR3"]])
+
+            result = self.runner.invoke(
+                self.main_function,
+                [
+                    "--file",
+                    str(working_dir / "plinktest"),
+                    "--assembly",
+                    "OAR3",
+                    "--species",
+                    "Sheep",
+                    "--results_dir",
+                    results_dir,
+                    "--chip_name",
+                    self.chip_name,
+                    "--snapshot",
+                    str(snapshot),
+                ]
+            )
+
+            self.assertEqual(0, result.exit_code, msg=result.exception)
+
+            plink_path = results_dir / "plinktest_updated"
+            plink_file = plinkfile.open(str(plink_path))
+
+            sample_list = plink_file.get_samples()
+            locus_list = plink_file.get_loci()
+
+            self.assertEqual(len(sample_list), 2)
+            self.assertEqual(len(locus_list), 3)
+
+    def test_import_from_text_plink_snapshot_species(self):
+        # create a temporary directory using the context manager
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            working_dir = pathlib.Path(tmpdirname)
+            results_dir = working_dir / "results"
+            snapshot = working_dir / "snapshot.npz"
+
+            # copy test data files
+            self.link_files(working_dir)
+
+            export_snapshot(
+                snapshot, VariantSheep, [WORKING_ASSEMBLIES["OAR3"]])
+
+            result = self.runner.invoke(
+                self.main_function,
+                [
+                    "--file",
+                    str(working_dir / "plinktest"),
+                    "--assembly",
+                    "OAR3",
+                    "--species",
+                    "Goat",
+                    "--results_dir",
+                    results_dir,
+                    "--snapshot",
+                    str(snapshot),
+                ]
+            )
+
+            self.assertEqual(1, result.exit_code, msg=result.exception)
+            self.assertIsInstance(result.exception, SmarterDBException)
+
+            plink_path = results_dir / "plinktest_updated"
+            self.assertFalse(plink_path.exists())
+
     def test_import_from_binary_plink(self):
         # create a temporary directory using the context manager
         with tempfile.TemporaryDirectory() as tmpdirname:
@@ -12,16 +12,18 @@ import unittest
 import tempfile
 
 import pandas as pd
+from mongoengine.errors import ValidationError
 from unittest.mock import patch, PropertyMock
 from openpyxl import Workbook
 
 from src.data.common import (
     fetch_and_check_dataset, get_variant_species, get_sample_species,
     pandas_open, update_chip_name, update_sequence, update_affymetrix_record,
-    update_location, update_variant, update_rs_id, update_probesets)
+    update_location, update_variant, update_rs_id, update_probesets,
+    VariantBatchLoader, update_phenotype, write_phenotypes)
 from src.features.smarterdb import (
     Dataset, VariantGoat, VariantSheep, SampleSheep, SampleGoat, Location,
-    Probeset)
+    Probeset, Phenotype)
 
 from ..common import MongoMockMixin, SmarterIDMixin, VariantSheepMixin
 
@@ -122,6 +124,92 @@ class CommonScriptTest(SmarterIDMixin, MongoMockMixin, unittest.TestCase):
         )
 
 
+class UpdatePhenotypeTest(SmarterIDMixin, MongoMockMixin, unittest.TestCase):
+    def setUp(self):
+        self.dataset = Dataset.objects.get(file="test.zip")
+
+        self.sample = SampleSheep(
+            original_id="test-1",
+            smarter_id="ITOA-TEX-000000001",
+            country="Italy",
+            breed="Texel",
+            breed_code="TEX",
+            dataset=self.dataset,
+            type_="background",
+            phenotype=Phenotype(purpose="Meat")
+        )
+        self.sample.save()
+
+    def tearDown(self):
+        SampleSheep.objects.delete()
+
+        super().tearDown()
+
+    def test_update_phenotype(self):
+        operation = update_phenotype(
+            SampleSheep,
+            self.dataset,
+            {'breed': "Texel"},
+            {'height': 80, 'coat_color': "White"})
+
+        n_updated = write_phenotypes(SampleSheep, [operation])
+
+        self.assertEqual(n_updated, 1)
+
+        self.sample.reload()
+
+        reference = Phenotype(
+            purpose="Meat", height=80.0, coat_color="White")
+
+        self.assertEqual(reference, self.sample.phenotype)
+        self.assertIsInstance(self.sample.phenotype.height, float)
+
+    def test_update_nothing(self):
+        operation = update_phenotype(
+            SampleSheep, self.dataset, {'breed': "Texel"}, {})
+
+        self.assertIsNone(operation)
+
+        n_updated = write_phenotypes(SampleSheep, [operation])
+
+        self.assertEqual(n_updated, 0)
+
+    def test_write_phenotypes(self):
+        operations = [
+            update_phenotype(
+                SampleSheep, self.dataset, {'breed': "Texel"},
+                {'height': 80}),
+            update_phenotype(
+                SampleSheep, self.dataset, {'original_id': "test-1"},
+                {'coat_color': "White"}),
+        ]
+
+        collection = type(SampleSheep._get_collection())
+
+        with patch.object(
+                collection, "bulk_write", autospec=True,
+                side_effect=collection.bulk_write) as my_bulk_write:
+            write_phenotypes(SampleSheep, operations)
+
+        my_bulk_write.assert_called_once()
+
+        self.sample.reload()
+
+        reference = Phenotype(
+            purpose="Meat", height=80.0, coat_color="White")
+
+        self.assertEqual(reference, self.sample.phenotype)
+
+    def test_update_not_valid(self):
+        self.assertRaises(
+            ValidationError,
+            update_phenotype,
+            SampleSheep,
+            self.dataset,
+            {'breed': "Texel"},
+            {'height': "tall"})
+
+
 class GetVariantSpeciesTest(unittest.TestCase):
     def test_get_variant_sheep(self):
         VariantSpecies = get_variant_species(species="Sheep")
@@ -412,5 +500,149 @@ class VariantUpdateTests(VariantSheepMixin, MongoMockMixin, unittest.TestCase):
         self.assertTrue(updated)
 
 
+class VariantBatchLoaderTests(
+        VariantSheepMixin, MongoMockMixin, unittest.TestCase):
+    def setUp(self):
+        # make a copy, those are all refrences
+        variant_data = self.data[0].copy()
+        location_data = variant_data.pop('locations')[0]
+
+        self.variant = VariantSheep(**variant_data)
+        self.location = Location(**location_data)
+
+    def tearDown(self):
+        # reset record to its original state
+        VariantSheep.objects.filter(name="test").delete()
+        VariantSheep.objects.get(
+            name="250506CS3900065000002_1238.1").update(**self.data[0])
+
+    def get_new_variant(self):
+        location = Location(
+            version="Oar_v3.1",
+            chrom="1",
+            position=10,
+            illumina_top="A/G",
+            imported_from="SNPchiMp v.3")
+
+        variant = VariantSheep(
+            name="test", chip_name=["IlluminaOvineSNP50"])
+
+        return variant, location
+
+    def test_add_variant(self):
+        with VariantBatchLoader(VariantSheep) as loader:
+            # nothing to update here
+            loader.add_variant(
+                self.variant, self.location,
+                search=[("name", self.variant.name)])
+
+            variant, location = self.get_new_variant()
+            loader.add_variant(
+                variant, location, search=[("name", "test")])
+
+        self.assertEqual(loader.n_inserted, 1)
+        self.assertEqual(loader.n_updated, 0)
+
+        record = VariantSheep.objects.get(name="test")
+        self.assertEqual(record.illumina_top, "A/G")
+        self.assertEqual(record.locations, [location])
+
+    def test_add_variant_update(self):
+        self.variant.chip_name = ["test"]
+
+        with VariantBatchLoader(VariantSheep, batch_size=1) as loader:
+            loader.add_variant(
+                self.variant, self.location,
+                search=[("name", self.variant.name)])
+
+            # no changes are required for the second variant
+            loader.add_variant(
+                self.variant, self.location,
+                search=[("name", self.variant.name)])
+
+        self.assertEqual(loader.n_inserted, 0)
+        self.assertEqual(loader.n_updated, 1)
+
+        record = VariantSheep.objects.get(name=self.variant.name)
+        self.assertIn("test", record.chip_name)
+
+    def test_add_variant_same_batch(self):
+        # the second variant update the first one
+        with VariantBatchLoader(VariantSheep) as loader:
+            variant, location = self.get_new_variant()
+            loader.add_variant(
+                variant, location, search=[("name", "test")])
+
+            variant, location = self.get_new_variant()
+            variant.chip_name = ["test"]
+            loader.add_variant(
+                variant, location, search=[("name", "test")])
+
+        self.assertEqual(loader.n_inserted, 1)
+        self.assertEqual(loader.n_updated, 0)
+
+        record = VariantSheep.objects.get(name="test")
+        self.assertEqual(
+            record.chip_name, ["IlluminaOvineSNP50", "test"])
+
+    def test_update_variant(self):
+        def callback(record):
+            record.rs_id = ["test"]
+            return True
+
+        missing = []
+
+        with VariantBatchLoader(VariantSheep) as loader:
+            loader.update_variant(
+                search=[("name", self.variant.name)],
+                callback=callback)
+
+            loader.update_variant(
+                search=[("name", "test")],
+                callback=callback,
+                missing=lambda: missing.append("test"))
+
+        self.assertEqual(loader.n_updated, 1)
+        self.assertEqual(missing, ["test"])
+
+        record = VariantSheep.objects.get(name=self.variant.name)
+        self.assertEqual(record.rs_id, ["test"])
+
+    def test_flush_bulk_write(self):
+        """New and changed variants are written with one bulk_write"""
+
+        self.variant.chip_name = ["test"]
+        collection = VariantSheep._get_collection()
+
+        with patch.object(
+                type(collection), "bulk_write",
+                autospec=True, side_effect=type(collection).bulk_write
+                ) as bulk_write:
+
+            with VariantBatchLoader(VariantSheep) as loader:
+                loader.add_variant(
+                    self.variant, self.location,
+                    search=[("name", self.variant.name)])
+
+                variant, location = self.get_new_variant()
+                loader.add_variant(
+                    variant, location, search=[("name", "test")])
+
+        bulk_write.assert_called_once()
+
+        operations = bulk_write.call_args.args[1]
+        self.assertEqual(
+            [type(operation).__name__ for operation in operations],
+            ["InsertOne", "ReplaceOne"])
+
+        self.assertEqual(loader.n_inserted, 1)
+        self.assertEqual(loader.n_updated, 1)
+
+        self.assertIn(
+            "test",
+            VariantSheep.objects.get(name=self.variant.name).chip_name)
+        self.assertEqual(VariantSheep.objects(name="test").count(), 1)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 11:48:32 2026
+
+@author: Paolo Cozzi <paolo.cozzi@ibba.cnr.it>
+"""
+
+import unittest
+import tempfile
+import pathlib
+
+from click.testing import CliRunner
+
+from src.data.export_snapshot import main as export_snapshot
+from src.features.smarterdb import SmarterDBException
+from src.features.snapshot import VariantSnapshot
+
+from ..common import MongoMockMixin, VariantSheepMixin
+
+
+class ExportSnapshotTest(VariantSheepMixin, MongoMockMixin, unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.main_function = export_snapshot
+        self.runner = CliRunner()
+
+    def test_help(self):
+        result = self.runner.invoke(self.main_function, ["--help"])
+        self.assertEqual(0, result.exit_code)
+        self.assertIn('Usage: main', result.output)
+
+    def test_export_snapshot(self):
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            output = pathlib.Path(tmpdirname) / "snapshot.npz"
+
+            result = self.runner.invoke(
+                self.main_function,
+                [
+                    "--species",
+                    "Sheep",
+                    "--assembly",
+                    "OAR4",
+                    "--src_version",
+                    "Oar_v3.1",
+                    "--src_imported_from",
+                    "SNPchiMp v.3",
+                    "--chip_name",
+                    "IlluminaOvineSNP50",
+                    "--output",
+                    str(output)
+                ]
+            )
+
+            self.assertEqual(0, result.exit_code, msg=result.exception)
+
+            snapshot = VariantSnapshot(output)
+
+            self.assertEqual(snapshot.species, "Sheep")
+            self.assertEqual(
+                snapshot.assemblies,
+                [("Oar_v3.1", "SNPchiMp v.3"), ("Oar_v4.0", "SNPchiMp v.3")])
+            self.assertEqual(len(snapshot), 4)
+
+    def test_export_snapshot_assembly_not_managed(self):
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            output = pathlib.Path(tmpdirname) / "snapshot.npz"
+
+            result = self.runner.invoke(
+                self.main_function,
+                [
+                    "--species",
+                    "Sheep",
+                    "--assembly",
+                    "OAR5",
+                    "--output",
+                    str(output)
+                ]
+            )
+
+            self.assertEqual(1, result.exit_code, msg=result.exception)
+            self.assertIsInstance(result.exception, SmarterDBException)
+            self.assertFalse(output.exists())
+
+
+if __name__ == '__main__':
+    unittest.main()
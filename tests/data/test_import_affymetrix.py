@@ -11,9 +11,10 @@ import pathlib
 import datetime
 
 from click.testing import CliRunner
+from mongoengine.queryset import Q
 
 from src.data.import_affymetrix import (
-    main as import_affymetrix, search_database)
+    main as import_affymetrix, get_search_fields, search_fixed_illumina_name)
 from src.features.affymetrix import read_Manifest
 from src.features.smarterdb import VariantSheep, SupportedChip, Probeset
 
@@ -227,6 +228,23 @@ class UpdateManifestTest(
         self.assertEqual(location.position, 0)
         self.assertEqual(location.illumina_top, "A/G")
 
+    def test_get_search_fields(self):
+        # a record with a cust_id
+        record = self.manifest_data[0]
+
+        self.assertEqual(
+            get_search_fields(record), [
+                ("name", "250506CS3900176800001_906_01"),
+                ("affy_snp_id", "Affx-122835222")])
+
+        # a record without cust_id
+        record = self.manifest_data[1]
+
+        self.assertEqual(
+            get_search_fields(record), [
+                ("name", "Affx-293815543"),
+                ("affy_snp_id", "Affx-293815543")])
+
     def test_search_database(self):
         """Test getting snp while updating manifest"""
 
@@ -234,12 +252,28 @@ class UpdateManifestTest(
 
         # get a snp available only in affymetrix manifest
         record = self.manifest_data[1]
-        qs = search_database(record, VariantSheep)
+
+        query = Q()
+
+        for field, value in get_search_fields(record):
+            query |= Q(**{field: value})
+
+        qs = VariantSheep.objects.filter(query)
 
         self.assertEqual(qs.count(), 1)
         variant = qs.get()
         self.assertEqual(variant.name, record.affy_snp_id)
 
+    def test_search_fixed_illumina_name(self):
+        # cust_id is not an illumina name
+        record = self.manifest_data[0]
+
+        variants = search_fixed_illumina_name(record, VariantSheep)
+
+        self.assertEqual(
+            [variant.name for variant in variants],
+            ["250506CS3900176800001_906.1"])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -12,11 +12,11 @@ import unittest
 import pathlib
 
 from click.testing import CliRunner
-from mongoengine import QuerySet
-from unittest.mock import patch
 
 from src.data.import_dbsnp import (
-    main as import_dbsnp, search_variant, process_variant)
+    main as import_dbsnp, parse_dbsnp_file, update_dbsnp_variant,
+    init_worker, parse_dbsnp_worker, set_illumina)
+from src.data.common import AssemblyConf
 
 from src.features.smarterdb import VariantSheep, Location
 from src.features.dbsnp import read_dbSNP
@@ -53,48 +53,93 @@ class DBSNPTestMixin(VariantSheepMixin, SupportedChipMixin, MongoMockMixin):
 
 class VariantTest(DBSNPTestMixin, unittest.TestCase):
 
-    def test_search_variant(self):
-        # define input parameters
-        sss = self.snp['ss']
-        rs_id = f"rs{self.snp['rsId']}"
-        locSnpIds = set([ss['locSnpId'] for ss in sss])
+    def test_update_dbsnp_variant(self):
+        # get a location from dbSNP file
+        _, rs_id, location, has_strand = parse_dbsnp_file(
+            DATA_DIR / "ds_test.xml",
+            sender="AGR_BS",
+            all_snp_names={"DU170943_581.1"},
+            assembly_conf=AssemblyConf(self.version, self.imported_from))[0]
 
-        # collect variant
-        variants = search_variant(sss, rs_id, locSnpIds, VariantSheep)
-
-        self.assertIsInstance(variants, QuerySet)
-        self.assertEqual(variants.count(), 1)
-
-        test = variants[0]
-        self.assertEqual(test, self.variant)
-
-    @patch('src.data.import_dbsnp.assembly_conf')
-    def test_process_variant(self, my_assembly_conf):
-        my_assembly_conf.version = self.version
-        my_assembly_conf.imported_from = self.imported_from
-
-        location = process_variant(
-            self.snp,
-            self.variant,
-            supported_chips=[self.chip_name]
-        )
-
-        self.assertIsInstance(location, Location)
+        self.assertTrue(
+            update_dbsnp_variant(
+                self.variant, location, rs_id,
+                supported_chips=[self.chip_name],
+                has_strand=has_strand))
 
         reference = {
             'ss_id': 'ss836318739',
-            'version': my_assembly_conf.version,
+            'version': self.version,
             'chrom': '24',
             'position': 33913078,
             'alleles': 'G/T',
             'illumina': 'T/G',
             'illumina_strand': 'bottom',
             'strand': 'forward',
-            'imported_from': my_assembly_conf.imported_from
+            'imported_from': self.imported_from
         }
 
-        test = json.loads(location.to_json())
+        test = self.variant.get_location(
+            version=self.version, imported_from=self.imported_from)
+        test = json.loads(test.to_json())
+        test.pop('illumina_top', None)
+
         self.assertEqual(reference, test)
+        self.assertIn(rs_id, self.variant.rs_id)
+
+        # nothing to update with the same data
+        self.assertFalse(
+            update_dbsnp_variant(
+                self.variant, location, rs_id,
+                supported_chips=[self.chip_name],
+                has_strand=has_strand))
+
+    def test_set_illumina(self):
+        location = Location(ss_id="ss1", illumina_strand=None)
+
+        # keep the strand provided by SS, even if empty
+        location = set_illumina(
+            location, self.variant, [self.chip_name], has_strand=True)
+        self.assertIsNone(location.illumina_strand)
+        self.assertEqual(location.illumina, "T/G")
+
+        # determine strand if not provided by SS
+        location = set_illumina(
+            location, self.variant, [self.chip_name], has_strand=False)
+        self.assertEqual(location.illumina_strand, "BOT")
+
+    def test_parse_dbsnp_file(self):
+        records = parse_dbsnp_file(
+            DATA_DIR / "ds_test.xml",
+            sender="AGR_BS",
+            all_snp_names={"DU170943_581.1"},
+            assembly_conf=AssemblyConf(self.version, self.imported_from))
+
+        self.assertEqual(len(records), 1)
+
+        locSnpId, rs_id, location, has_strand = records[0]
+        self.assertEqual(locSnpId, "DU170943_581.1")
+        self.assertTrue(has_strand)
+        self.assertEqual(location.illumina_strand, "bottom")
+        self.assertEqual(rs_id, f"rs{self.snp['rsId']}")
+        self.assertEqual(location.ss_id, "ss836318739")
+        self.assertEqual(location.chrom, "24")
+        self.assertEqual(location.position, 33913078)
+
+        # illumina attributes are determined using SMARTER variants
+        self.assertIsNone(location.illumina)
+
+    def test_parse_dbsnp_worker(self):
+        init_worker({"DU170943_581.1"})
+
+        records = parse_dbsnp_worker(
+            DATA_DIR / "ds_test.xml",
+            sender="AGR_BS",
+            assembly_conf=AssemblyConf(self.version, self.imported_from))
+
+        self.assertEqual(
+            [(locSnpId, rs_id) for locSnpId, rs_id, *_ in records],
+            [("DU170943_581.1", f"rs{self.snp['rsId']}")])
 
 
 class ImportDBSNPTest(DBSNPTestMixin, unittest.TestCase):
@@ -147,6 +192,90 @@ class ImportDBSNPTest(DBSNPTestMixin, unittest.TestCase):
         self.assertEqual(location.position, 33913078)
         self.assertEqual(location.illumina_top, "A/C")
 
+    def test_import_dbsnp_workers(self):
+        dbsnp_dir = DATA_DIR
+
+        result = self.runner.invoke(
+            self.main_function,
+            [
+                "--species_class",
+                "Sheep",
+                "--input_dir",
+                str(dbsnp_dir),
+                "--pattern",
+                "*.xml",
+                "--sender",
+                self.sender,
+                "--version",
+                self.version,
+                "--imported_from",
+                "dbSNP152_test",
+                "--workers",
+                "2",
+            ]
+        )
+
+        self.assertEqual(0, result.exit_code, msg=result.exc_info)
+
+        self.variant.reload()
+        location = self.variant.get_location(
+            version=self.version,
+            imported_from='dbSNP152_test')
+
+        self.assertEqual(location.chrom, "24")
+        self.assertEqual(location.position, 33913078)
+        self.assertEqual(location.illumina_top, "A/C")
+
+    def test_import_dbsnp_same_name(self):
+        """All the variants with the same name are updated"""
+
+        collection = VariantSheep._get_collection()
+
+        # a database without the unique index on names
+        collection.drop_index("name_1")
+
+        try:
+            record = collection.find_one({"name": "DU170943_581.1"})
+            record.pop("_id")
+            collection.insert_one(record)
+
+            result = self.runner.invoke(
+                self.main_function,
+                [
+                    "--species_class",
+                    "Sheep",
+                    "--input_dir",
+                    str(DATA_DIR),
+                    "--pattern",
+                    "*.xml",
+                    "--sender",
+                    self.sender,
+                    "--version",
+                    self.version,
+                    "--imported_from",
+                    "dbSNP152_same_name",
+                ]
+            )
+
+            self.assertEqual(0, result.exit_code, msg=result.exc_info)
+
+            variants = VariantSheep.objects(name="DU170943_581.1")
+            self.assertEqual(variants.count(), 2)
+
+            for variant in variants:
+                location = variant.get_location(
+                    version=self.version,
+                    imported_from='dbSNP152_same_name')
+
+                self.assertEqual(location.chrom, "24")
+                self.assertEqual(location.position, 33913078)
+                self.assertIn(f"rs{self.snp['rsId']}", variant.rs_id)
+
+        finally:
+            collection.delete_one({
+                "name": "DU170943_581.1", "_id": {"$ne": self.variant.id}})
+            VariantSheep.ensure_indexes()
+
 
 if __name__ == '__main__':
     unittest.main()
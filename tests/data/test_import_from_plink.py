@@ -386,6 +386,69 @@ class TestImportFromPlink(
             self.assertEqual(len(sample_list), 2)
             self.assertEqual(len(locus_list), 3)
 
+    @patch('src.features.smarterdb.Dataset.result_dir',
+           new_callable=PropertyMock)
+    @patch('src.features.smarterdb.Dataset.working_dir',
+           new_callable=PropertyMock)
+    def test_import_from_binary_plink_write_bed(
+            self, my_working_dir, my_result_dir):
+        # create a temporary directory using the context manager
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            working_dir = pathlib.Path(tmpdirname)
+            results_dir = working_dir / "results"
+
+            # assign return value to mocked property
+            my_working_dir.return_value = working_dir
+            my_result_dir.return_value = results_dir
+
+            # copy test data files
+            self.link_files(working_dir)
+
+            result = self.runner.invoke(
+                import_from_plink,
+                [
+                    "--dataset",
+                    "test.zip",
+                    "--bfile",
+                    "plinktest",
+                    "--chip_name",
+                    self.chip_name,
+                    "--assembly",
+                    "OAR3",
+                    "--create_samples",
+                    "--write_bed"
+                ]
+            )
+
+            self.assertEqual(0, result.exit_code, msg=result.exception)
+            self.assertEqual(SampleSheep.objects.count(), 2)
+
+            # no text files are written
+            self.assertFalse(
+                (working_dir / "OAR3" / "plinktest_updated.ped").exists())
+
+            plink_path = results_dir / "OAR3" / "plinktest_updated"
+
+            # the same .bim file written by plink
+            with open(f"{plink_path}.bim") as handle:
+                test = [line.split() for line in handle]
+
+            reference_path = (
+                pathlib.Path(__file__).parent /
+                "data/processed/OAR3/plinktest_updated.bim")
+
+            with open(reference_path) as handle:
+                reference = [line.split() for line in handle]
+
+            self.assertEqual(test, reference)
+            plink_file = plinkfile.open(str(plink_path))
+
+            sample_list = plink_file.get_samples()
+            locus_list = plink_file.get_loci()
+
+            self.assertEqual(len(sample_list), 2)
+            self.assertEqual(len(locus_list), 3)
+
     @patch('src.features.smarterdb.Dataset.result_dir',
            new_callable=PropertyMock)
     @patch('src.features.smarterdb.Dataset.working_dir',
@@ -10,11 +10,15 @@ import unittest
 import pathlib
 import tempfile
 
+import pandas as pd
+
 from openpyxl import Workbook
 from click.testing import CliRunner
 from unittest.mock import patch, PropertyMock
 
-from src.data.import_metadata import main as import_metadata
+from src.data.import_metadata import (
+    main as import_metadata, get_column, get_locations, get_metadata,
+    get_sex)
 from src.features.smarterdb import Dataset, SampleSheep, SEX
 
 from ..common import MongoMockMixin, SmarterIDMixin, SupportedChipMixin
@@ -659,5 +663,129 @@ class TestImportMetadataByAlias(MetaDataMixin, unittest.TestCase):
             self.check_sample2_species()
 
 
+class TestImportMetadataBulkWrite(MetaDataMixin, unittest.TestCase):
+    @patch('src.features.smarterdb.Dataset.working_dir',
+           new_callable=PropertyMock)
+    def test_import_with_metadata(self, my_working_dir):
+        """Metadata are set key by key with a single bulk write"""
+
+        # this key is not in the metadata file
+        self.sample1.metadata = {"col1": "Old", "other": "Keep me"}
+        self.sample1.save()
+
+        collection = type(SampleSheep._get_collection())
+
+        # create a temporary directory using the context manager
+        with tempfile.TemporaryDirectory() as tmpdirname, patch.object(
+                collection, "bulk_write", autospec=True,
+                side_effect=collection.bulk_write) as my_bulk_write:
+            working_dir = pathlib.Path(tmpdirname)
+            my_working_dir.return_value = working_dir
+
+            # save worksheet in temporary folder
+            self.workbook.save(f"{working_dir}/metadata.xlsx")
+
+            result = self.runner.invoke(
+                import_metadata,
+                [
+                    "--src_dataset",
+                    "test2.zip",
+                    "--dst_dataset",
+                    "test.zip",
+                    "--datafile",
+                    "metadata.xlsx",
+                    "--id_column",
+                    "Id",
+                    "--metadata_column",
+                    "Col1",
+                    "--sex_column",
+                    "Sex"
+                ]
+            )
+
+            self.assertEqual(0, result.exit_code, msg=result.exception)
+
+        # one update for each row in a single call
+        my_bulk_write.assert_called_once()
+        self.assertEqual(len(my_bulk_write.call_args.args[1]), 2)
+
+        self.sample1.reload()
+        self.assertEqual(
+            self.sample1.metadata, {"col1": "Val1", "other": "Keep me"})
+
+        self.check_sample1_sex()
+        self.check_sample2_sex()
+
+
+class TestColumnHelpers(unittest.TestCase):
+    def setUp(self):
+        self.data = pd.DataFrame({
+            "Lat": [45.46427, "45.46427/46.46427", None],
+            "Lon": [9.18951, "9.18951/10.18951", None],
+            "Col 1": ["Val1", None, "Val5"],
+            "Note": [None, "A note", None],
+            "Sex": ["M", "F", "unknown"],
+        })
+
+        self.columns = {
+            "latitude_column": "Lat",
+            "longitude_column": "Lon",
+            "metadata_column": ["Col 1"],
+            "notes_column": "Note",
+            "sex_column": "Sex",
+        }
+
+    def test_get_column(self):
+        self.assertEqual(
+            get_column(self.data, "Note").tolist(), [None, "A note", None])
+
+    def test_get_missing_column(self):
+        self.assertEqual(
+            get_column(self.data, "Missing").tolist(), [None, None, None])
+        self.assertEqual(
+            get_column(self.data, None).tolist(), [None, None, None])
+
+    def test_get_locations(self):
+        self.assertEqual(
+            get_locations(self.data, self.columns).tolist(), [
+                [[9.18951, 45.46427]],
+                [[9.18951, 45.46427], [10.18951, 46.46427]],
+                None
+            ])
+
+    def test_get_no_locations(self):
+        self.columns["latitude_column"] = None
+
+        self.assertEqual(
+            get_locations(self.data, self.columns).tolist(),
+            [None, None, None])
+
+    def test_get_metadata(self):
+        self.assertEqual(
+            get_metadata(self.data, self.columns).tolist(), [
+                {"col_1": "Val1"},
+                {"notes": "A note"},
+                {"col_1": "Val5"}
+            ])
+
+    def test_get_no_metadata(self):
+        self.columns["metadata_column"] = None
+        self.columns["notes_column"] = None
+
+        self.assertEqual(
+            get_metadata(self.data, self.columns).tolist(), [{}, {}, {}])
+
+    def test_get_sex(self):
+        self.assertEqual(
+            get_sex(self.data, self.columns).tolist(),
+            [SEX.MALE, SEX.FEMALE, None])
+
+    def test_get_no_sex(self):
+        self.columns["sex_column"] = None
+
+        self.assertEqual(
+            get_sex(self.data, self.columns).tolist(), [None, None, None])
+
+
 if __name__ == '__main__':
     unittest.main()
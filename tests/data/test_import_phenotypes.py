@@ -10,11 +10,14 @@ import unittest
 import pathlib
 import tempfile
 
+import pandas as pd
+
 from openpyxl import Workbook
 from click.testing import CliRunner
 from unittest.mock import patch, PropertyMock
 
-from src.data.import_phenotypes import main as import_phenotypes
+from src.data.import_phenotypes import (
+    main as import_phenotypes, get_phenotypes)
 from src.features.smarterdb import Dataset, SampleSheep, Phenotype
 
 from ..common import MongoMockMixin, SmarterIDMixin, SupportedChipMixin
@@ -462,3 +465,30 @@ class TestImportPhenotypeByAlias(PhenotypeMixin, unittest.TestCase):
             )
 
             self.assertEqual(reference, self.sample.phenotype)
+
+
+class GetPhenotypesTest(unittest.TestCase):
+    def test_get_phenotypes(self):
+        data = pd.DataFrame({
+            "Name": ["Texel", "Merino", "Texel"],
+            "Purpose": ["meat", "wool", None],
+            "Height": [None, 70.0, 80.0],
+            "Coat Color": [None, None, None],
+        })
+
+        columns = {
+            'purpose_column': "Purpose",
+            'chest_girth_column': None,
+            'height_column': "Height",
+            'length_column': "Length",
+            'additional_column': ["Coat Color"],
+        }
+
+        phenotypes = get_phenotypes(data, columns, data["Name"])
+
+        # repeated keys get the last not null values
+        self.assertEqual(
+            phenotypes.to_dict(), {
+                "Texel": {"purpose": "Meat", "height": 80.0},
+                "Merino": {"purpose": "Wool", "height": 70.0},
+            })
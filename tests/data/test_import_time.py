@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 21:05:12 2026
+
+@author: Paolo Cozzi <paolo.cozzi@ibba.cnr.it>
+
+Check that scripts don't import heavy dependencies at startup. The startup
+benchmark is slow and depends on the machine, so it's executed only with
+``make import-time``
+"""
+
+import os
+import sys
+import time
+import pathlib
+import unittest
+import subprocess
+
+PROJECT_DIR = pathlib.Path(__file__).parents[2]
+
+# modules which need to be imported on first use
+HEAVY_MODULES = ["pandas", "plinkio", "tqdm", "pycountry", "Bio"]
+
+# the maximum startup time of 'add_breed.py --help' in seconds
+IMPORT_TIME_LIMIT = float(os.getenv("SMARTER_IMPORT_TIME_LIMIT", 0.3))
+
+
+def run_python(*args) -> subprocess.CompletedProcess:
+    """Call a new python interpreter from project directory"""
+
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        filter(None, [str(PROJECT_DIR), env.get("PYTHONPATH")]))
+
+    return subprocess.run(
+        [sys.executable, *args],
+        cwd=PROJECT_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True)
+
+
+class ImportModulesTest(unittest.TestCase):
+    def assertNotImported(self, module: str, modules: list):
+        result = run_python(
+            "-c",
+            f"import sys, {module}; "
+            f"print(' '.join(name for name in {modules} "
+            "if name in sys.modules))")
+
+        self.assertEqual(
+            result.stdout.split(), [],
+            msg=f"'{module}' imports heavy modules")
+
+    def test_features(self):
+        for module in [
+                "src.features.smarterdb", "src.features.utils",
+                "src.features.snpchimp", "src.features.plinkio"]:
+            with self.subTest(module=module):
+                self.assertNotImported(module, HEAVY_MODULES)
+
+    def test_scripts(self):
+        for module in [
+                "src.data.add_breed", "src.data.import_datasets",
+                "src.data.import_breeds", "src.data.update_db_status",
+                "src.data.import_from_illumina", "src.data.merge_datasets",
+                "src.data.import_samples"]:
+            with self.subTest(module=module):
+                self.assertNotImported(module, HEAVY_MODULES)
+
+
+@unittest.skipUnless(
+    os.getenv("SMARTER_IMPORT_TIME"),
+    "set SMARTER_IMPORT_TIME to run the startup benchmark")
+class ImportTimeTest(unittest.TestCase):
+    def test_add_breed_help(self):
+        timings = []
+
+        # the best of many runs, to ignore a cold cache
+        for i in range(5):
+            start = time.perf_counter()
+            run_python("src/data/add_breed.py", "--help")
+            timings.append(time.perf_counter() - start)
+
+        self.assertLess(
+            min(timings), IMPORT_TIME_LIMIT,
+            msg=f"'add_breed.py --help' took {min(timings):.3f}s")
+
+
+if __name__ == '__main__':
+    unittest.main()
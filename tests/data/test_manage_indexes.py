@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 16:44:19 2026
+
+@author: Paolo Cozzi <paolo.cozzi@ibba.cnr.it>
+"""
+
+import unittest
+from unittest.mock import patch
+
+from click.testing import CliRunner
+
+from src.data.manage_indexes import main as manage_indexes
+from src.features.plinkio import AssemblyConf
+from src.features.smarterdb import VariantSheep, SmarterDBException
+
+from ..common import MongoMockMixin, VariantSheepMixin
+
+
+class ManageIndexesTest(VariantSheepMixin, MongoMockMixin, unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.main_function = manage_indexes
+        self.runner = CliRunner()
+
+    def test_help(self):
+        result = self.runner.invoke(self.main_function, ["--help"])
+        self.assertEqual(0, result.exit_code)
+        self.assertIn('Usage: main', result.output)
+
+    def test_manage_indexes(self):
+        result = self.runner.invoke(
+            self.main_function,
+            [
+                "--species_class",
+                "Sheep",
+            ]
+        )
+
+        self.assertEqual(0, result.exit_code, msg=result.exception)
+        self.assertEqual(
+            VariantSheep.compare_indexes(), {'missing': [], 'extra': []})
+
+    @patch("src.data.manage_indexes.explain_queries")
+    def test_manage_indexes_explain(self, my_explain):
+        result = self.runner.invoke(
+            self.main_function,
+            [
+                "--species_class",
+                "Sheep",
+                "--assembly",
+                "OAR4",
+                "--src_version",
+                "Oar_v3.1",
+                "--src_imported_from",
+                "SNPchiMp v.3",
+                "--chip_name",
+                "IlluminaOvineSNP50",
+            ]
+        )
+
+        self.assertEqual(0, result.exit_code, msg=result.exception)
+        self.assertTrue(my_explain.called)
+
+        queries = my_explain.call_args[0][0]
+        self.assertEqual(
+            queries["by assembly"].count(), 4)
+        self.assertEqual(
+            queries["by chromosome"]._query["locations"]["$elemMatch"],
+            dict(
+                AssemblyConf("Oar_v3.1", "SNPchiMp v.3")._asdict(),
+                chrom="1"))
+
+    def test_assembly_not_managed(self):
+        result = self.runner.invoke(
+            self.main_function,
+            [
+                "--species_class",
+                "Sheep",
+                "--assembly",
+                "OAR5",
+            ]
+        )
+
+        self.assertEqual(1, result.exit_code)
+        self.assertIsInstance(result.exception, SmarterDBException)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -16,6 +16,7 @@ from plinkio import plinkfile
 
 from src import __version__
 from src.features.smarterdb import SampleSheep
+from src.features.plinkmerge import read_merge_manifest
 from src.data.merge_datasets import main as merge_datasets
 
 from ..common import MongoMockMixin, SmarterIDMixin, VariantSheepMixin
@@ -79,6 +80,68 @@ class TestMergeDataset(
             self.assertEqual(len(sample_list), 2)
             self.assertEqual(len(locus_list), 3)
 
+    @patch('src.data.merge_datasets.get_processed_dir')
+    @patch('src.data.merge_datasets.get_interim_dir')
+    @patch('src.features.smarterdb.Dataset.result_dir',
+           new_callable=PropertyMock)
+    def test_merge_incremental(
+            self, my_result_dir, my_interim_dir, my_processed_dir):
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            working_dir = pathlib.Path(tmpdirname)
+            results_dir = DATA_DIR / "processed"
+
+            my_result_dir.return_value = results_dir
+            my_interim_dir.return_value = working_dir
+            my_processed_dir.return_value = working_dir
+
+            smarter_tag = f"SMARTER-OA-OAR3-top-{__version__}"
+            plink_path = working_dir / "OAR3" / smarter_tag
+
+            for i in range(2):
+                result = self.runner.invoke(
+                    merge_datasets,
+                    [
+                        "--species_class",
+                        "sheep",
+                        "--assembly",
+                        "OAR3",
+                        "--incremental"
+                    ]
+                )
+
+                self.assertEqual(0, result.exit_code, msg=result.exception)
+
+                if i == 0:
+                    mtime = pathlib.Path(
+                        f"{plink_path}.bed").stat().st_mtime_ns
+
+            # merged files are up to date
+            self.assertEqual(
+                mtime, pathlib.Path(f"{plink_path}.bed").stat().st_mtime_ns)
+
+            manifest = read_merge_manifest(plink_path)
+            self.assertGreater(len(manifest), 0)
+
+            plink_file = plinkfile.open(str(plink_path))
+            self.assertEqual(len(plink_file.get_samples()), 2)
+            self.assertEqual(len(plink_file.get_loci()), 3)
+
+    def test_merge_incremental_plink(self):
+        result = self.runner.invoke(
+            merge_datasets,
+            [
+                "--species_class",
+                "sheep",
+                "--assembly",
+                "OAR3",
+                "--incremental",
+                "--use_plink"
+            ]
+        )
+
+        self.assertEqual(2, result.exit_code)
+        self.assertIn("can't be used with --use_plink", result.output)
+
 
 if __name__ == '__main__':
     unittest.main()
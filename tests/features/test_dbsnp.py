@@ -11,7 +11,10 @@ import pathlib
 
 from functools import partial
 
-from src.features.dbsnp import search_chip_snps, read_dbSNP
+from lxml import etree as ET
+
+from src.features.dbsnp import (
+    search_chip_snps, read_dbSNP, process_rs_elem)
 
 # set data dir
 DATA_DIR = pathlib.Path(__file__).parent / "data"
@@ -55,3 +58,78 @@ class DBSNPTest(unittest.TestCase):
         }
 
         self.assertDictEqual(reference, test)
+
+    def test_assembly(self):
+        reference = {
+            'chromosome': '24',
+            'accession': 'NW_014639033.1',
+            'orientation': 'fwd'
+        }
+
+        for key, value in reference.items():
+            self.assertEqual(self.snp['assembly']['component'][key], value)
+
+        self.assertEqual(
+            self.snp['assembly']['component']['maploc']['physMapInt'],
+            '33913077')
+        self.assertEqual(
+            self.snp['assembly']['snpstat']['mapWeight'],
+            'unique-in-contig')
+
+
+class ReadDBSNPTest(unittest.TestCase):
+    def setUp(self):
+        self.dbsnp_path = DATA_DIR / "ds_test.xml"
+
+    def test_read_dbSNP(self):
+        """Compare with the element by element decoder"""
+
+        reference = [
+            process_rs_elem(elem) for event, elem in ET.iterparse(
+                str(self.dbsnp_path), events=("end", ), tag="{*}Rs")]
+
+        test = list(read_dbSNP(self.dbsnp_path))
+
+        self.assertEqual(len(test), 3)
+        self.assertEqual(reference, test)
+
+    def test_read_dbSNP_minimal(self):
+        snp = next(read_dbSNP(self.dbsnp_path, minimal=True))
+
+        self.assertEqual(snp['rsId'], "55627891")
+        self.assertNotIn('create', snp)
+        self.assertNotIn('update', snp)
+        self.assertNotIn('exemplar', snp)
+        self.assertIn('assembly', snp)
+
+        ss = snp['ss'][1]
+        self.assertEqual(ss['locSnpId'], 'DU170943_581.1')
+        self.assertEqual(ss['observed'], 'G/T')
+        self.assertNotIn('seq5', ss)
+        self.assertNotIn('seq3', ss)
+
+    def test_read_dbSNP_prefilter(self):
+        test = list(read_dbSNP(self.dbsnp_path, handle='AGR_BS'))
+        reference = list(filter(search_agr_bs, read_dbSNP(self.dbsnp_path)))
+
+        self.assertEqual(reference, test)
+
+        test = list(read_dbSNP(
+            self.dbsnp_path,
+            handle='AGR_BS',
+            locSnpIds={'DU170943_581.1'}))
+
+        self.assertEqual(len(test), 1)
+        self.assertEqual(test[0]['rsId'], "55627891")
+
+        # locSnpId and handle need to be in the same Ss
+        test = list(read_dbSNP(
+            self.dbsnp_path,
+            handle='AGRF',
+            locSnpIds={'DU170943_581.1'}))
+
+        self.assertEqual(test, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
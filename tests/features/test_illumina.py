@@ -15,9 +15,13 @@ import collections
 
 from io import StringIO
 
+import Bio.Seq
+
 from src.features.illumina import (
     read_snpMap, read_Manifest, read_snpList, read_illuminaRow, skip_lines,
-    skip_until_section, search_manifactured_date, IlluSNP, IlluSNPException)
+    skip_until_section, search_manifactured_date, IlluSNP, IlluSNPException,
+    decode_sequence, resolve_sequences, read_Manifest_columns,
+    read_illuminaSamples)
 
 FEATURE_DATA_DIR = pathlib.Path(__file__).parents[1] / "features/data"
 SCRIPTS_DATA_DIR = pathlib.Path(__file__).parents[1] / "data/data"
@@ -114,6 +118,36 @@ class ReadManifest(IlluminaMixin, unittest.TestCase):
         return read_Manifest(*args, **kwargs, size=2026)
 
 
+class ReadManifestColumnsTest(unittest.TestCase):
+    data_path = SCRIPTS_DATA_DIR / "test_manifest.csv"
+
+    def test_read_Manifest_columns(self):
+        records = list(read_Manifest(self.data_path, delimiter=","))
+
+        batches = list(
+            read_Manifest_columns(
+                self.data_path, batch_size=2, delimiter=","))
+
+        # each batch has at most batch_size records
+        for batch in batches:
+            self.assertLessEqual(len(batch["name"]), 2)
+
+        # join batches and compare with records
+        for column in records[0]._fields:
+            values = []
+
+            for batch in batches:
+                values += batch[column]
+
+            self.assertListEqual(
+                values, [getattr(record, column) for record in records])
+
+        # snp are read without brackets
+        for snp in batches[0]["snp"]:
+            self.assertNotIn("[", snp)
+            self.assertNotIn("]", snp)
+
+
 class ReadSnpListTest(IlluminaMixin, unittest.TestCase):
     data_path = FEATURE_DATA_DIR / "snplist.txt"
     snp_name = "250506CS3900140500001_312.1"
@@ -148,6 +182,47 @@ class ReadIlluminaRowTest(unittest.TestCase):
         return read_illuminaRow(*args, **kwargs)
 
 
+class ReadIlluminaSamplesTest(unittest.TestCase):
+    data_path = FEATURE_DATA_DIR / "finalreport.txt"
+    snp_names = [
+        "250506CS3900140500001_312.1", "250506CS3900176800001_906.1"]
+
+    def test_read(self):
+        # read rows one by one
+        reference = collections.defaultdict(list)
+
+        for row in read_illuminaRow(self.data_path):
+            reference[row.sample_id] += [row.allele1_ab, row.allele2_ab]
+
+        # a small chunk_size force to split samples between chunks
+        for chunk_size in [1, 50, 2**24]:
+            test = dict()
+
+            for sample_id, genotypes in read_illuminaSamples(
+                    self.data_path, self.snp_names, chunk_size=chunk_size):
+                self.assertEqual(genotypes.shape, (2, 2))
+                test[sample_id] = [
+                    chr(value) for value in genotypes.ravel()]
+
+            self.assertDictEqual(test, dict(reference))
+
+    def test_snp_mismatch(self):
+        self.assertRaisesRegex(
+            IlluSNPException,
+            "snp positions doens't match",
+            list,
+            read_illuminaSamples(self.data_path, self.snp_names[::-1])
+        )
+
+    def test_missing_snps(self):
+        self.assertRaisesRegex(
+            IlluSNPException,
+            "snp positions doens't match",
+            list,
+            read_illuminaSamples(self.data_path, self.snp_names[:1])
+        )
+
+
 # define namedtuple objects
 SNPrecord = collections.namedtuple("SNPrecord", "snp_name sequence strand A B")
 
@@ -345,5 +420,179 @@ class testIlluSNP(unittest.TestCase):
         self.assertEqual(test, ref)
 
 
+def biopython_toTop(illu_snp):
+    """The Bio.Seq implementation of IlluSNP.toTop"""
+
+    if illu_snp.strand == "TOP":
+        return illu_snp
+
+    sequence = illu_snp.sequence.replace(f"[{illu_snp.alleles}]", '')
+
+    reverse = Bio.Seq.MutableSeq(sequence)
+    reverse.reverse_complement(inplace=True)
+
+    snp = Bio.Seq.MutableSeq(illu_snp.illumina)
+    snp.complement(inplace=True)
+
+    tmp = list(f"[{snp}]")
+    tmp.reverse()
+
+    for i, char in enumerate(tmp):
+        reverse.insert(-illu_snp.pos[0]-i, char)
+
+    return IlluSNP(str(reverse), max_iter=illu_snp.max_iter)
+
+
+class IlluSNPToTopTest(unittest.TestCase):
+    """Compare toTop with the Bio.Seq implementation"""
+
+    def setUp(self):
+        self.sequences = [
+            "AGGAGGCTAG[T/G]CTCGCAGAGC",
+            "GCTCTGCGAG[A/C]CTAGCCTCCT",
+            "ACGGGGACAG[A/T]TATGTTAACT",
+            "GGTTAAATGT[C/G]AAGGTGAGCT",
+            "CCGCGCCCTC[C/T]TTGCGGGTCC",
+            "TCTTGGGGGT[A/T]TCAGGCTACC",
+            "acgtRYSWKMBDHVNtg[T/C]aNNryCG",
+        ]
+
+        # sequences with ambiguity codes
+        manifest = read_Manifest(
+            SCRIPTS_DATA_DIR / "test_manifest.csv", delimiter=",")
+
+        for record in manifest:
+            self.sequences += [record.sourceseq, record.topgenomicseq]
+
+    def test_toTop(self):
+        for sequence in self.sequences:
+            illu_snp = IlluSNP(sequence, max_iter=25)
+
+            test = illu_snp.toTop()
+            reference = biopython_toTop(illu_snp)
+
+            self.assertEqual(test, reference, msg=sequence)
+            self.assertEqual(test.sequence, reference.sequence)
+            self.assertEqual(test.illumina, reference.illumina)
+
+    def test_decode_sequence_cache(self):
+        decode_sequence.cache_clear()
+
+        for i in range(3):
+            test = IlluSNP("AGGAGGCTAG[T/G]CTCGCAGAGC")
+
+        info = decode_sequence.cache_info()
+        self.assertEqual(info.misses, 1)
+        self.assertEqual(info.hits, 2)
+
+        # max_iter is a part of the key
+        IlluSNP("AGGAGGCTAG[T/G]CTCGCAGAGC", max_iter=25)
+        self.assertEqual(decode_sequence.cache_info().misses, 2)
+
+        # every object has its own attributes
+        test.strand = "TOP"
+        other = IlluSNP("AGGAGGCTAG[T/G]CTCGCAGAGC")
+        self.assertEqual(other.strand, "BOT")
+
+    def test_decode_sequence_error(self):
+        # exceptions are not cached
+        for i in range(2):
+            self.assertRaisesRegex(
+                IlluSNPException,
+                "Can't find unambiguous pair in 2 steps",
+                IlluSNP,
+                "ATGAGTGAAT[C/G]AAGCACTATT",
+                max_iter=2)
+
+
+class ResolveSequencesTest(unittest.TestCase):
+    """Compare resolve_sequences with IlluSNP"""
+
+    def setUp(self):
+        self.sequences = [
+            "AGGAGGCTAG[T/G]CTCGCAGAGC",
+            "GCTCTGCGAG[A/C]CTAGCCTCCT",
+            "ACGGGGACAG[A/T]TATGTTAACT",
+            "ATGAGTGAAT[C/G]AAGCACTATT",
+            "GGTTAAATGT[C/G]AAGGTGAGCT",
+            "ccgcgccctc[c/t]ttgcgggtcc",
+            "TCTTGGGGGT[A/T]TCAGGCTACC",
+            # flanking sequences shorter than max_iter
+            "AT[C/G]A",
+            "[A/T]CAGAATCTTT",
+            "AAATTCAGAT[A/T]",
+            "GC[C/G]NNNNA",
+        ]
+
+        # sequences with ambiguity codes
+        manifest = read_Manifest(
+            SCRIPTS_DATA_DIR / "test_manifest.csv", delimiter=",")
+
+        for record in manifest:
+            self.sequences += [record.sourceseq, record.topgenomicseq]
+
+    def get_reference(self, sequence, max_iter, to_top):
+        try:
+            illu_snp = IlluSNP(sequence, max_iter=max_iter)
+
+            if to_top:
+                illu_snp = illu_snp.toTop()
+
+            return illu_snp.illumina, illu_snp.strand, illu_snp.alleles
+
+        except IlluSNPException:
+            return "", "", ""
+
+    def test_resolve_sequences(self):
+        for max_iter in [2, 10, 25]:
+            for to_top in [False, True]:
+                illumina, strand, alleles = resolve_sequences(
+                    self.sequences,
+                    max_iter=max_iter,
+                    to_top=to_top,
+                    ignore_errors=True)
+
+                self.assertEqual(len(illumina), len(self.sequences))
+
+                for i, sequence in enumerate(self.sequences):
+                    reference = self.get_reference(sequence, max_iter, to_top)
+                    self.assertEqual(
+                        reference,
+                        (illumina[i], strand[i], alleles[i]),
+                        msg=f"{sequence}, {max_iter}, {to_top}")
+
+    def test_resolve_sequences_error(self):
+        self.assertRaisesRegex(
+            IlluSNPException,
+            "Can't find unambiguous pair in 2 steps",
+            resolve_sequences,
+            self.sequences,
+            max_iter=2)
+
+        illumina, strand, alleles = resolve_sequences(
+            ["AGGAGGCTAGCTCGCAGAGC"], ignore_errors=True)
+
+        self.assertEqual(illumina.tolist(), [""])
+        self.assertEqual(strand.tolist(), [""])
+        self.assertEqual(alleles.tolist(), [""])
+
+    def test_resolve_sequences_empty(self):
+        illumina, strand, alleles = resolve_sequences([])
+        self.assertEqual(len(illumina), 0)
+
+    def test_resolve_sequences_workers(self):
+        reference = resolve_sequences(
+            self.sequences, max_iter=25, ignore_errors=True)
+        test = resolve_sequences(
+            self.sequences,
+            max_iter=25,
+            ignore_errors=True,
+            workers=2,
+            chunk_size=3)
+
+        for ref, array in zip(reference, test):
+            self.assertEqual(ref.tolist(), array.tolist())
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 16:21:05 2026
+
+@author: Paolo Cozzi <paolo.cozzi@ibba.cnr.it>
+"""
+
+import unittest
+
+from src.features.indexes import (
+    ensure_variant_indexes, get_hot_queries, get_plan_stages,
+    explain_queries)
+from src.features.plinkio import AssemblyConf
+from src.features.smarterdb import VariantSheep, SmarterDBException
+
+from ..common import MongoMockMixin, VariantSheepMixin
+
+IXSCAN_PLAN = {
+    "stage": "FETCH",
+    "filter": {},
+    "inputStage": {
+        "stage": "IXSCAN",
+        "indexName": (
+            "locations.version_1_locations.imported_from_1_"
+            "locations.chrom_1_locations.position_1"),
+        "isMultiKey": True,
+    }
+}
+
+COLLSCAN_PLAN = {
+    "stage": "COLLSCAN",
+    "filter": {},
+    "direction": "forward"
+}
+
+
+class FakeQuerySet():
+    """Simulate the explain() output of a queryset"""
+
+    _query = {}
+
+    def __init__(self, winning_plan):
+        self.winning_plan = winning_plan
+
+    def explain(self):
+        return {"queryPlanner": {"winningPlan": self.winning_plan}}
+
+
+class EnsureIndexesTest(VariantSheepMixin, MongoMockMixin, unittest.TestCase):
+    def tearDown(self):
+        # restore the default indexes
+        VariantSheep._get_collection().drop_indexes()
+        VariantSheep.ensure_indexes()
+
+        super().tearDown()
+
+    def test_ensure_variant_indexes(self):
+        indexes = ensure_variant_indexes(VariantSheep)
+        self.assertEqual(indexes, {'missing': [], 'extra': []})
+
+        index_information = VariantSheep._get_collection().index_information()
+        self.assertIn(
+            "locations.version_1_locations.imported_from_1_"
+            "locations.chrom_1_locations.position_1",
+            index_information)
+        self.assertIn("name_1_chip_name_1", index_information)
+        self.assertIn(
+            "probesets.chip_name_1_probesets.probeset_id_1",
+            index_information)
+
+    def test_drop_stale(self):
+        collection = VariantSheep._get_collection()
+        collection.create_index(
+            [("locations.chrom", 1), ("locations.position", 1)])
+
+        indexes = ensure_variant_indexes(VariantSheep)
+        self.assertEqual(
+            indexes["extra"],
+            [[("locations.chrom", 1), ("locations.position", 1)]])
+
+        indexes = ensure_variant_indexes(VariantSheep, drop_stale=True)
+        self.assertEqual(indexes, {'missing': [], 'extra': []})
+        self.assertNotIn(
+            "locations.chrom_1_locations.position_1",
+            collection.index_information())
+
+
+class HotQueriesTest(VariantSheepMixin, MongoMockMixin, unittest.TestCase):
+    def test_get_hot_queries(self):
+        queries = get_hot_queries(
+            VariantSheep,
+            AssemblyConf("Oar_v3.1", "SNPchiMp v.3"),
+            AssemblyConf("Oar_v4.0", "SNPchiMp v.3"))
+
+        self.assertEqual(len(queries), 6)
+
+        # select variants by assembly
+        self.assertEqual(queries["by assembly"].count(), 4)
+
+        self.assertEqual(
+            queries["by name"].count(), 1)
+        self.assertEqual(
+            queries["by name"].first().name,
+            "250506CS3900065000002_1238.1")
+
+
+class ExplainTest(unittest.TestCase):
+    def test_get_plan_stages(self):
+        self.assertEqual(
+            get_plan_stages(IXSCAN_PLAN),
+            [
+                ("FETCH", None),
+                ("IXSCAN", IXSCAN_PLAN["inputStage"]["indexName"])
+            ]
+        )
+
+    def test_get_plan_stages_or(self):
+        plan = {
+            "stage": "SUBPLAN",
+            "inputStage": {
+                "stage": "OR",
+                "inputStages": [IXSCAN_PLAN, COLLSCAN_PLAN]
+            }
+        }
+
+        stages = [stage for stage, _ in get_plan_stages(plan)]
+        self.assertEqual(
+            stages, ["SUBPLAN", "OR", "FETCH", "IXSCAN", "COLLSCAN"])
+
+    def test_get_plan_stages_sbe(self):
+        plan = {"queryPlan": IXSCAN_PLAN, "slotBasedPlan": {}}
+
+        self.assertEqual(
+            get_plan_stages(plan), get_plan_stages(IXSCAN_PLAN))
+
+    def test_explain_queries(self):
+        plans = explain_queries({"by position": FakeQuerySet(IXSCAN_PLAN)})
+        self.assertEqual(plans["by position"][-1][0], "IXSCAN")
+
+    def test_explain_queries_collscan(self):
+        self.assertRaisesRegex(
+            SmarterDBException,
+            "don't use indexes",
+            explain_queries,
+            {
+                "by position": FakeQuerySet(IXSCAN_PLAN),
+                "by name": FakeQuerySet(COLLSCAN_PLAN)
+            }
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -12,12 +12,18 @@ import pathlib
 import tempfile
 from copy import deepcopy
 
+import numpy as np
+from plinkio import plinkfile
+from mongoengine.errors import DoesNotExist
+
 from src.features.smarterdb import (
     VariantSheep, Location, Breed, Dataset, SampleSheep, SEX, SampleGoat,
-    VariantGoat)
+    VariantGoat, SmarterDBException, Counter)
 from src.features.plinkio import (
     TextPlinkIO, MapRecord, CodingException, IlluminaReportIO, BinaryPlinkIO,
-    AffyPlinkIO, AssemblyConf, AffyReportIO)
+    AffyPlinkIO, AssemblyConf, AffyReportIO, INVALID_ALLELE,
+    IlluminaReportException)
+from src.features.utils import plink_chrom, plink_chrom_key
 
 from ..common import (
     MongoMockMixin, SmarterIDMixin, VariantSheepMixin, SupportedChipMixin)
@@ -85,6 +91,26 @@ class TextPlinkIOMap(VariantSheepMixin, MongoMockMixin, unittest.TestCase):
             else:
                 self.assertIsInstance(record, Location)
 
+    def test_fetch_coordinates_batches(self):
+        # search one variant for each query
+        self.plinkio.fetch_batch_size = 1
+
+        self.plinkio.read_mapfile()
+        self.plinkio.fetch_coordinates(
+            src_assembly=self.src_assembly)
+
+        self.assertEqual(len(self.plinkio.dst_locations), 4)
+        self.assertEqual(self.plinkio.filtered, {3})
+
+        reference = [
+            "250506CS3900065000002_1238.1",
+            "250506CS3900140500001_312.1",
+            "250506CS3900176800001_906.1",
+            None
+        ]
+
+        self.assertEqual(self.plinkio.variants_name, reference)
+
     def test_fetch_coordinates_by_positions(self):
         self.plinkio.read_mapfile()
         self.plinkio.fetch_coordinates_by_positions(
@@ -107,6 +133,30 @@ class TextPlinkIOMap(VariantSheepMixin, MongoMockMixin, unittest.TestCase):
             else:
                 self.assertIsInstance(record, Location)
 
+    def test_fetch_coordinates_by_positions_multiple(self):
+        # add a variant in the same position of the first SNP
+        variant = VariantSheep(
+            name="test_same_position",
+            illumina_top="A/G",
+            locations=[Location(
+                version="Oar_v3.1",
+                chrom="15",
+                position=5870057,
+                illumina="A/G",
+                imported_from="SNPchiMp v.3")]
+        )
+        variant.save()
+
+        self.plinkio.read_mapfile()
+        self.plinkio.fetch_coordinates_by_positions(
+            src_assembly=self.src_assembly)
+
+        variant.delete()
+
+        self.assertEqual(len(self.plinkio.dst_locations), 4)
+        self.assertEqual(self.plinkio.filtered, {0, 3})
+        self.assertIsNone(self.plinkio.variants_name[0])
+
     def test_fetch_coordinates_by_positions_dst_assembly(self):
         # define a custom destination assembly
         dst_assembly = AssemblyConf(
@@ -275,6 +325,44 @@ class TextPlinkIOPed(
             "illumina"
         )
 
+    def test_get_coding_table(self):
+        alleles, table, src_errors, dst_errors = \
+            self.plinkio._get_coding_table("forward", "top")
+
+        # one row for SNP, one column for allele (plus unknown alleles)
+        self.assertEqual(table.shape, (4, len(alleles) + 1))
+        self.assertEqual(src_errors, {})
+        self.assertEqual(dst_errors, {})
+
+        # forward T/C is top A/G for the first SNP
+        codes = {allele: code for code, allele in enumerate(alleles)}
+        self.assertEqual(alleles[table[0, codes["T"]]], "A")
+        self.assertEqual(alleles[table[0, codes["C"]]], "G")
+        self.assertEqual(alleles[table[0, codes["-"]]], "0")
+        self.assertEqual(table[0, codes["A"]], INVALID_ALLELE)
+        self.assertEqual(table[0, len(alleles)], INVALID_ALLELE)
+
+        # tables are cached until coordinates are fetched again
+        self.assertIs(
+            self.plinkio._get_coding_table("forward", "top")[1], table)
+
+        self.plinkio.fetch_coordinates(src_assembly=self.src_assembly)
+        self.assertIsNot(
+            self.plinkio._get_coding_table("forward", "top")[1], table)
+
+    def test_process_genotypes_missing_forward(self):
+        # remove forward information from the first SNP
+        self.plinkio.src_locations[0].illumina_forward = None
+
+        self.assertRaisesRegex(
+            SmarterDBException,
+            "There's no information for 'illumina_forward'",
+            self.plinkio._process_genotypes,
+            self.lines[0],
+            "forward",
+            True
+        )
+
     def test_process_genotypes_ignore_coding(self):
         """Convert with a wrong coding but ignore errors"""
 
@@ -658,6 +746,117 @@ class TextPlinkIOPed(
         # check that objects are the same
         self.assertEqual(reference, test)
 
+    def test_get_or_create_sample_cached(self):
+        """Resolve samples and breeds using the sample cache"""
+
+        # get a sample line
+        line = self.lines[0]
+
+        self.plinkio.prefetch_samples(self.dataset)
+        cache = self.plinkio.get_sample_cache(self.dataset)
+        self.assertEqual(len(cache.samples), 0)
+
+        breed = self.plinkio.search_breed(fid=line[0], dataset=self.dataset)
+        self.assertEqual(breed.code, "TEX")
+
+        self.assertRaises(
+            DoesNotExist,
+            self.plinkio.search_breed,
+            fid="FOO",
+            dataset=self.dataset)
+
+        # create a sample: this will be tracked in cache
+        reference = self.plinkio.get_or_create_sample(
+            line, self.dataset, breed, create_sample=True)
+        self.assertEqual(cache.samples, [reference])
+
+        # the same object is returned from cache
+        test = self.plinkio.get_or_create_sample(
+            line, self.dataset, breed, create_sample=True)
+        self.assertIs(reference, test)
+
+        # new samples have a SMARTER ID and are inserted when clearing cache
+        self.assertEqual(reference.smarter_id, "ITOA-TEX-000000001")
+        self.assertEqual(SampleSheep.objects.count(), 0)
+
+        # no cache for another dataset
+        self.assertIsNone(self.plinkio.get_sample_cache(None))
+
+        self.plinkio.clear_sample_cache()
+        self.assertIsNone(self.plinkio.get_sample_cache(self.dataset))
+
+        self.assertEqual(SampleSheep.objects.count(), 1)
+        self.assertIsNotNone(reference.id)
+
+        breed.reload()
+        self.assertEqual(breed.n_individuals, 1)
+
+        # unused SMARTER IDs are released
+        self.assertEqual(
+            Counter.objects.get(pk="sampleSheep").sequence_value, 1)
+
+    def test_create_samples_in_batches(self):
+        """New samples are inserted in blocks of sample_batch_size"""
+
+        self.plinkio.sample_batch_size = 2
+        self.plinkio.prefetch_samples(self.dataset)
+
+        breed = self.plinkio.search_breed(
+            fid=self.lines[0][0], dataset=self.dataset)
+
+        samples = []
+
+        for i in range(3):
+            line = self.lines[0].copy()
+            line[1] = f"sample{i}"
+            samples.append(self.plinkio.get_or_create_sample(
+                line, self.dataset, breed, create_sample=True))
+
+        # the first two samples are inserted, the last one is in cache
+        self.assertEqual(SampleSheep.objects.count(), 2)
+        self.assertIsNone(samples[2].id)
+
+        self.plinkio.clear_sample_cache()
+
+        self.assertEqual(SampleSheep.objects.count(), 3)
+        self.assertEqual(
+            [sample.smarter_id for sample in SampleSheep.objects],
+            [f"ITOA-TEX-00000000{i}" for i in range(1, 4)])
+
+        # one of the 4 reserved values is released
+        self.assertEqual(
+            Counter.objects.get(pk="sampleSheep").sequence_value, 3)
+
+        breed.reload()
+        self.assertEqual(breed.n_individuals, 3)
+
+    def test_create_samples_with_new_parents(self):
+        """New parents are inserted before referencing them"""
+
+        self.plinkio.prefetch_samples(self.dataset)
+
+        breed = self.plinkio.search_breed(
+            fid=self.lines[0][0], dataset=self.dataset)
+
+        line = self.lines[0].copy()
+        line[1], line[2], line[3] = "father", "0", "0"
+        father = self.plinkio.get_or_create_sample(
+            line, self.dataset, breed, create_sample=True)
+        self.assertIsNone(father.id)
+
+        line = self.lines[0].copy()
+        line[1], line[2], line[3] = "child", "father", "0"
+        child = self.plinkio.get_or_create_sample(
+            line, self.dataset, breed, create_sample=True)
+
+        self.assertIsNotNone(father.id)
+        self.assertEqual(child.father_id, father)
+
+        self.plinkio.clear_sample_cache()
+
+        child.reload()
+        self.assertEqual(child.father_id.smarter_id, father.smarter_id)
+
     def test_sample_relies_dataset(self):
         """Getting two sample with the same original id is not a problem"""
 
@@ -945,6 +1144,69 @@ class TextPlinkIOPed(
             # assert two records written
             self.assertEqual(len(list(test.read_pedfile())), 2)
 
+    def test_update_bedfile(self):
+        # create a temporary directory using the context manager
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            pedfile = pathlib.Path(tmpdirname) / "plinktest_updated.ped"
+            prefix = pathlib.Path(tmpdirname) / "plinktest_binary"
+
+            self.plinkio.update_mapfile(
+                str(pathlib.Path(tmpdirname) / "plinktest_updated.map"))
+            self.plinkio.update_pedfile(
+                str(pedfile), self.dataset, 'top', True)
+            self.plinkio.update_bedfile(
+                prefix, self.dataset, 'top', True)
+
+            # now open outputfile and test stuff
+            reference = TextPlinkIO(
+                prefix=str(pathlib.Path(tmpdirname) / "plinktest_updated"),
+                species="Sheep")
+            reference.read_mapfile()
+            ref_lines = list(reference.read_pedfile())
+
+            test = BinaryPlinkIO(prefix=str(prefix), species="Sheep")
+            test.read_mapfile()
+            self.assertEqual(len(test.mapdata), 3)
+
+            # SNPs are sorted by chromosome and position like plink does
+            self.assertEqual(
+                [(record.chrom, record.position) for record in test.mapdata],
+                sorted(
+                    (int(record.chrom), record.position)
+                    for record in reference.mapdata))
+
+            lines = list(test.read_pedfile())
+            self.assertEqual(len(lines), 2)
+
+            names = [record.name for record in test.mapdata]
+            ref_names = [record.name for record in reference.mapdata]
+
+            for line, ref in zip(lines, ref_lines):
+                # the same sample
+                self.assertEqual(line[:2], ref[:2])
+
+                # the same genotypes (heterozygous order may change)
+                for i, name in enumerate(names):
+                    j = ref_names.index(name)
+                    self.assertEqual(
+                        sorted(line[6+i*2:8+i*2]),
+                        sorted(ref[6+j*2:8+j*2]))
+
+    def test_update_bedfile_chrom(self):
+        # move the first SNP on X chromosome
+        self.plinkio.dst_locations[0].chrom = "X"
+
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            prefix = pathlib.Path(tmpdirname) / "plinktest_binary"
+            self.plinkio.update_bedfile(prefix, self.dataset, 'top', True)
+
+            with open(f"{prefix}.bim") as handle:
+                chroms = [line.split()[0] for line in handle]
+
+            # X is the last chromosome with the plink code of sheep
+            self.assertEqual(chroms[-1], "27")
+            self.assertEqual(chroms[:-1], sorted(chroms[:-1], key=int))
+
     def test_update_pedfile_no_insert(self):
         """Test no sample creating while processing genotypes"""
 
@@ -972,6 +1234,26 @@ class TextPlinkIOPed(
         self.assertEqual(reference, test)
 
 
+class PlinkChromTest(unittest.TestCase):
+    def test_plink_chrom(self):
+        self.assertEqual(plink_chrom("1", "Sheep"), "1")
+        self.assertEqual(plink_chrom("01", "Sheep"), "1")
+        self.assertEqual(plink_chrom("0", "Sheep"), "0")
+        self.assertEqual(plink_chrom("X", "Sheep"), "27")
+        self.assertEqual(plink_chrom("Y", "Sheep"), "28")
+        self.assertEqual(plink_chrom("X", "Goat"), "30")
+        self.assertEqual(plink_chrom("chrX", "Goat"), "30")
+        self.assertEqual(plink_chrom("MT", "Goat"), "33")
+        self.assertEqual(plink_chrom("NW_017189516.1", "Goat"),
+                         "NW_017189516.1")
+
+    def test_plink_chrom_key(self):
+        chroms = ["X_contig", "27", "3", "10", "0", "A_contig"]
+        self.assertEqual(
+            sorted(chroms, key=plink_chrom_key),
+            ["0", "3", "10", "27", "A_contig", "X_contig"])
+
+
 class BinaryPlinkIOTest(
         VariantSheepMixin, SmarterIDMixin, MongoMockMixin, unittest.TestCase):
     def setUp(self):
@@ -1005,6 +1287,26 @@ class BinaryPlinkIOTest(
         test = list(test)
         self.assertEqual(len(test), 2)
 
+    def test_read_genotypes(self):
+        # the same genotypes returned by plinkio
+        reference = list(plinkfile.open(str(DATA_DIR / "plinktest")))
+
+        for block_size in [1, 4, 1000]:
+            test = list(self.plinkio.read_genotypes(block_size))
+            self.assertEqual(len(test), 2)
+
+            for sample_idx, (sample, genotypes) in enumerate(test):
+                self.assertEqual(sample.iid, str(sample_idx + 1))
+                self.assertEqual(
+                    genotypes.tolist(),
+                    [row[sample_idx] for row in reference])
+
+    def test_read_pedfile_block_size(self):
+        reference = list(self.plinkio.read_pedfile())
+        test = list(self.plinkio.read_pedfile(block_size=1))
+
+        self.assertEqual(reference, test)
+
     def test_process_pedline(self):
         # define reference
         reference = [
@@ -1030,7 +1332,8 @@ class BinaryPlinkIOTest(
         self.assertEqual(reference, test)
 
 
-class IlluminaReportIOMap(VariantSheepMixin, MongoMockMixin, unittest.TestCase):
+class IlluminaReportIOMap(
+        VariantSheepMixin, MongoMockMixin, unittest.TestCase):
     def setUp(self):
         super().setUp()
 
@@ -1121,6 +1424,20 @@ class IlluminaReportIOPed(
         test = list(test)
         self.assertEqual(len(test), 2)
 
+        self.assertListEqual(
+            test[0], ["TEX", "1", "0", "0", "0", "-9", "A", "A", "B", "B"])
+
+    def test_read_reportfile_snp_mismatch(self):
+        # change SNP order
+        self.plinkio.mapdata = self.plinkio.mapdata[::-1]
+
+        self.assertRaisesRegex(
+            IlluminaReportException,
+            "snp positions doens't match",
+            list,
+            self.plinkio.read_reportfile(breed="TEX")
+        )
+
     def test_read_reportfile_no_fid(self):
         """Try to determine fid from database"""
 
@@ -1574,6 +1891,27 @@ class AffyReportIOPedTest(
         test = list(test)
         self.assertEqual(len(test), 2)
 
+    def test_read_reportfile_calls(self):
+        """Test the transposed calls matrix"""
+
+        # transpose one SNP at time
+        self.plinkio.transpose_block_size = 1
+        self.plinkio.read_reportfile()
+
+        self.assertEqual(self.plinkio.calls.shape, (2, 3))
+        self.assertEqual(self.plinkio.calls.dtype, np.uint8)
+        self.assertEqual(self.plinkio.get_samples(), ["test-one", "test-two"])
+
+        reference = [
+            ['TEX', 'test-one', '0', '0', '0', '-9',
+             '0', '0', 'B', 'B', 'B', 'B'],
+            ['TEX', 'test-two', '0', '0', '0', '-9',
+             'A', 'B', 'B', 'B', 'B', 'B'],
+        ]
+
+        self.assertEqual(
+            reference, list(self.plinkio.read_peddata(breed="TEX")))
+
     def test_read_reportfile_no_fid(self):
         """Try to determine fid from database"""
 
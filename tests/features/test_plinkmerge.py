@@ -0,0 +1,474 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 19:40:27 2026
+
+@author: Paolo Cozzi <paolo.cozzi@ibba.cnr.it>
+"""
+
+import os
+import pathlib
+import tempfile
+import unittest
+
+from unittest.mock import patch
+
+import numpy as np
+from plinkio import plinkfile
+
+from src.features.plinkmerge import (
+    BinaryPlinkMerger, PlinkMergeException, pack_genotypes, unpack_genotypes,
+    read_bim, read_fam, merge_binary_plink, read_merge_manifest,
+    plink_checksum, plink_stat, BED_MAGIC, MISSING, FLIP_CODES)
+
+DATA_DIR = pathlib.Path(__file__).parents[1] / "data/data/processed/OAR3"
+
+
+def read_codes(prefix):
+    """Return the genotype codes of a binary plink file"""
+
+    n_snps, n_samples = len(read_bim(prefix)), len(read_fam(prefix))
+
+    with open(f"{prefix}.bed", "rb") as handle:
+        handle.read(3)
+        data = np.frombuffer(handle.read(), dtype=np.uint8)
+
+    return unpack_genotypes(data.reshape(n_snps, -1), n_samples)
+
+
+def write_plink(prefix, bim, fam, codes):
+    """Write a binary plink file. bim and fam are list of records, codes is a
+    (n_snps, n_samples) array of genotype codes"""
+
+    with open(f"{prefix}.bim", "w") as handle:
+        for record in bim:
+            handle.write("\t".join(map(str, record)) + "\n")
+
+    with open(f"{prefix}.fam", "w") as handle:
+        for record in fam:
+            handle.write(" ".join(record) + "\n")
+
+    with open(f"{prefix}.bed", "wb") as handle:
+        handle.write(BED_MAGIC)
+        pack_genotypes(codes).tofile(handle)
+
+
+class PackGenotypesTest(unittest.TestCase):
+    def test_roundtrip(self):
+        rng = np.random.default_rng(42)
+
+        for n_samples in [1, 3, 4, 9]:
+            codes = rng.integers(0, 4, (5, n_samples), dtype=np.uint8)
+            data = pack_genotypes(codes)
+
+            self.assertEqual(data.shape, (5, -(-n_samples // 4)))
+            np.testing.assert_array_equal(
+                unpack_genotypes(data, n_samples), codes)
+
+    def test_pack(self):
+        # hom A1, missing, het, hom A2 for the first 4 samples
+        codes = np.array([[0, 1, 2, 3, 3]], dtype=np.uint8)
+        data = pack_genotypes(codes)
+
+        self.assertEqual(data.tolist(), [[0b11100100, 0b00000011]])
+
+
+class BinaryPlinkMergerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.working_dir = pathlib.Path(self.tmpdir.name)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_merge_processed(self):
+        prefixes = [
+            DATA_DIR / "plinktest_updated",
+            DATA_DIR / "finalreport_updated"]
+
+        merger = BinaryPlinkMerger(prefixes)
+        merger.merge(self.working_dir / "merged")
+
+        plink_file = plinkfile.open(str(self.working_dir / "merged"))
+
+        # same samples are merged
+        self.assertEqual(len(plink_file.get_samples()), 2)
+
+        locus_list = plink_file.get_loci()
+        self.assertEqual(
+            [locus.name for locus in locus_list],
+            [
+                "250506CS3900176800001_906.1",
+                "250506CS3900065000002_1238.1",
+                "250506CS3900140500001_312.1"
+            ])
+
+        # discordant genotypes become missing (3 for plinkio)
+        self.assertEqual(
+            [list(row) for row in plink_file],
+            [[2, 2], [2, 2], [3, 1]])
+
+    def test_merge(self):
+        rng = np.random.default_rng(42)
+
+        # the first file has 6 SNPs and 5 samples
+        bim1 = [
+            (1, "snp1", 0, 100, "A", "G"),
+            (1, "snp2", 0, 200, "C", "T"),
+            (2, "snp3", 0, 100, "A", "C"),
+            (2, "snp4", 0, 300, "0", "G"),
+            (10, "snp5", 0, 100, "A", "G"),
+            (3, "snp6", 0, 100, "A", "G"),
+        ]
+        fam1 = [("TEX", f"sample{i}", "0", "0", "0", "-9") for i in range(5)]
+        codes1 = rng.integers(0, 4, (len(bim1), len(fam1)), dtype=np.uint8)
+
+        # the second file has swapped alleles, new SNPs and a shared sample
+        bim2 = [
+            (1, "snp0", 0, 50, "A", "G"),
+            (1, "snp2", 0, 200, "T", "C"),
+            (2, "snp4", 0, 300, "A", "G"),
+            (2, "snp7", 0, 400, "A", "G"),
+        ]
+        fam2 = [("MER", f"sample{i}", "0", "0", "0", "-9") for i in range(3)]
+        fam2.append(fam1[0])
+        codes2 = rng.integers(0, 4, (len(bim2), len(fam2)), dtype=np.uint8)
+
+        # the shared sample has the same genotypes of the first file, or
+        # is missing
+        codes2[1, 3] = FLIP_CODES[codes1[1, 0]]
+        codes2[2, 3] = MISSING
+
+        write_plink(self.working_dir / "file1", bim1, fam1, codes1)
+        write_plink(self.working_dir / "file2", bim2, fam2, codes2)
+
+        # force processing one SNP at a time
+        merger = BinaryPlinkMerger(
+            [self.working_dir / "file1", self.working_dir / "file2"],
+            max_block_bytes=1)
+        merger.merge(self.working_dir / "merged")
+
+        bim = read_bim(self.working_dir / "merged")
+        fam = read_fam(self.working_dir / "merged")
+
+        self.assertEqual(
+            bim["name"].tolist(),
+            [
+                "snp0", "snp1", "snp2", "snp3", "snp4", "snp7", "snp6",
+                "snp5"
+            ])
+        self.assertEqual(bim.loc[2, "allele1"], "C")
+        self.assertEqual(bim.loc[2, "allele2"], "T")
+        self.assertEqual(bim.loc[4, "allele1"], "A")
+        self.assertEqual(bim.loc[4, "allele2"], "G")
+
+        self.assertEqual(len(fam), 8)
+        self.assertEqual(fam["iid"].tolist()[:5], [row[1] for row in fam1])
+
+        with open(self.working_dir / "merged.bed", "rb") as handle:
+            self.assertEqual(handle.read(3), BED_MAGIC)
+            data = np.frombuffer(handle.read(), dtype=np.uint8)
+
+        codes = unpack_genotypes(data.reshape(len(bim), -1), len(fam))
+
+        # the SNPs of the first file
+        np.testing.assert_array_equal(codes[[1, 2, 3, 4, 7, 6], :5], codes1)
+
+        # the SNPs of the second file (snp2 has swapped alleles)
+        np.testing.assert_array_equal(codes[0, 5:8], codes2[0, :3])
+        np.testing.assert_array_equal(
+            codes[2, 5:8], FLIP_CODES[codes2[1, :3]])
+        np.testing.assert_array_equal(codes[4, 5:8], codes2[2, :3])
+        np.testing.assert_array_equal(codes[5, 5:8], codes2[3, :3])
+
+        # snp7 is not in the first file and snp0 has no genotypes for
+        # the first file samples, except the shared one
+        self.assertTrue((codes[[0, 5], 1:5] == MISSING).all())
+        self.assertEqual(codes[0, 0], codes2[0, 3])
+
+        # the shared sample has the same genotypes
+        self.assertEqual(codes[2, 0], codes1[1, 0])
+        self.assertEqual(codes[4, 0], codes1[3, 0])
+
+    def test_merge_alleles_mismatch(self):
+        bim1 = [(1, "snp1", 0, 100, "A", "G")]
+        bim2 = [(1, "snp1", 0, 100, "C", "T")]
+        fam1 = [("TEX", "sample1", "0", "0", "0", "-9")]
+        fam2 = [("TEX", "sample2", "0", "0", "0", "-9")]
+        codes = np.zeros((1, 1), dtype=np.uint8)
+
+        write_plink(self.working_dir / "file1", bim1, fam1, codes)
+        write_plink(self.working_dir / "file2", bim2, fam2, codes)
+
+        merger = BinaryPlinkMerger(
+            [self.working_dir / "file1", self.working_dir / "file2"])
+
+        self.assertRaisesRegex(
+            PlinkMergeException,
+            "1 SNPs with more than two alleles",
+            merger.merge,
+            self.working_dir / "merged")
+
+    def test_merge_exclude_samples(self):
+        bim = [(1, "snp1", 0, 100, "A", "G"), (1, "snp2", 0, 200, "C", "T")]
+        fam = [("TEX", f"sample{i}", "0", "0", "0", "-9") for i in range(5)]
+        codes = np.array([[0, 1, 2, 3, 0], [3, 2, 1, 0, 3]], dtype=np.uint8)
+
+        write_plink(self.working_dir / "file1", bim, fam, codes)
+
+        merger = BinaryPlinkMerger(
+            [self.working_dir / "file1"],
+            exclude_samples={
+                self.working_dir / "file1": [
+                    ("TEX", "sample1"), ("TEX", "sample3")]})
+        merger.merge(self.working_dir / "merged")
+
+        fam = read_fam(self.working_dir / "merged")
+        self.assertEqual(
+            fam["iid"].tolist(), ["sample0", "sample2", "sample4"])
+
+        np.testing.assert_array_equal(
+            read_codes(self.working_dir / "merged"), codes[:, [0, 2, 4]])
+
+    def write_chroms(self):
+        bim1 = [
+            ("X", "snp1", 0, 100, "A", "G"),
+            (2, "snp2", 0, 300, "A", "G"),
+            ("Y", "snp3", 0, 50, "A", "G"),
+            (0, "snp4", 0, 0, "A", "G"),
+            (10, "snp5", 0, 100, "A", "G"),
+        ]
+        bim2 = [
+            ("X", "snp6", 0, 50, "A", "G"),
+            (2, "snp7", 0, 100, "A", "G"),
+            ("Y", "snp8", 0, 200, "A", "G"),
+            (0, "snp9", 0, 0, "A", "G"),
+            ("chr1", "snp10", 0, 400, "A", "G"),
+        ]
+        fam1 = [("TEX", "sample1", "0", "0", "0", "-9")]
+        fam2 = [("TEX", "sample2", "0", "0", "0", "-9")]
+
+        write_plink(
+            self.working_dir / "file1", bim1, fam1,
+            np.zeros((len(bim1), 1), dtype=np.uint8))
+        write_plink(
+            self.working_dir / "file2", bim2, fam2,
+            np.zeros((len(bim2), 1), dtype=np.uint8))
+
+        return [self.working_dir / "file1", self.working_dir / "file2"]
+
+    def assertChromBlocks(self, bim):
+        # each chromosome is a contiguous block sorted by position
+        chroms = bim["chrom"].tolist()
+        blocks = [
+            chrom for i, chrom in enumerate(chroms)
+            if i == 0 or chroms[i - 1] != chrom]
+
+        self.assertEqual(len(blocks), len(set(blocks)))
+
+        for chrom, group in bim.groupby("chrom"):
+            self.assertTrue(group["position"].is_monotonic_increasing)
+
+        return blocks
+
+    def test_merge_chrom_blocks(self):
+        merger = BinaryPlinkMerger(self.write_chroms())
+        merger.merge(self.working_dir / "merged")
+
+        bim = read_bim(self.working_dir / "merged")
+
+        self.assertEqual(
+            self.assertChromBlocks(bim), ["0", "2", "10", "X", "Y", "chr1"])
+
+    def test_merge_chrom_species(self):
+        merger = BinaryPlinkMerger(self.write_chroms(), species="Sheep")
+        merger.merge(self.working_dir / "merged")
+
+        bim = read_bim(self.working_dir / "merged")
+
+        # X and Y are coded like plink does for sheep
+        self.assertEqual(
+            self.assertChromBlocks(bim), ["0", "1", "2", "10", "27", "28"])
+        self.assertEqual(
+            bim["name"].tolist(), [
+                "snp4", "snp9", "snp10", "snp7", "snp2", "snp5", "snp6",
+                "snp1", "snp3", "snp8"])
+
+
+class MergeBinaryPlinkTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.working_dir = pathlib.Path(self.tmpdir.name)
+        self.out_prefix = self.working_dir / "merged"
+
+        rng = np.random.default_rng(42)
+
+        self.bim = [
+            (1, "snp1", 0, 100, "A", "G"),
+            (1, "snp2", 0, 200, "C", "T"),
+            (2, "snp3", 0, 100, "A", "C"),
+        ]
+
+        self.codes, self.prefixes = [], []
+
+        for i, fid in enumerate(["TEX", "MER", "FRZ"]):
+            fam = [(fid, f"sample{j}", "0", "0", "0", "-9") for j in range(3)]
+            codes = rng.integers(0, 4, (len(self.bim), len(fam)), np.uint8)
+            prefix = self.working_dir / f"file{i}"
+
+            write_plink(prefix, self.bim, fam, codes)
+
+            self.codes.append(codes)
+            self.prefixes.append(prefix)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_merge(self):
+        # files are not read to compute checksums
+        with patch(
+                "src.features.plinkmerge.plink_checksum") as my_checksum:
+            self.assertTrue(
+                merge_binary_plink(
+                    self.prefixes[:2], self.out_prefix, datasets=["1", "2"]))
+
+            my_checksum.assert_not_called()
+
+        manifest = read_merge_manifest(self.out_prefix)
+
+        self.assertEqual(
+            [item["prefix"] for item in manifest],
+            [str(prefix) for prefix in self.prefixes[:2]])
+        self.assertEqual([item["dataset"] for item in manifest], ["1", "2"])
+        self.assertEqual(manifest[0]["stat"], plink_stat(self.prefixes[0]))
+        self.assertIsNone(manifest[0]["checksum"])
+        self.assertEqual(
+            manifest[1]["samples"],
+            [["MER", f"sample{j}"] for j in range(3)])
+
+        np.testing.assert_array_equal(
+            read_codes(self.out_prefix), np.hstack(self.codes[:2]))
+
+    def test_incremental_append(self):
+        merge_binary_plink(self.prefixes[:2], self.out_prefix)
+
+        # nothing to do
+        self.assertFalse(
+            merge_binary_plink(
+                self.prefixes[:2], self.out_prefix, incremental=True))
+
+        # append a new file
+        with patch(
+                "src.features.plinkmerge.BinaryPlinkMerger",
+                wraps=BinaryPlinkMerger) as merger:
+            self.assertTrue(
+                merge_binary_plink(
+                    self.prefixes, self.out_prefix, incremental=True))
+
+            # only the new file is merged with the merged files
+            self.assertEqual(
+                merger.call_args.args[0],
+                [str(self.out_prefix), str(self.prefixes[2])])
+
+        fam = read_fam(self.out_prefix)
+        self.assertEqual(fam["fid"].tolist(), ["TEX"] * 3 + ["MER"] * 3 + [
+            "FRZ"] * 3)
+
+        np.testing.assert_array_equal(
+            read_codes(self.out_prefix), np.hstack(self.codes))
+
+        self.assertEqual(len(read_merge_manifest(self.out_prefix)), 3)
+
+    def test_incremental_checksum(self):
+        merge_binary_plink(
+            self.prefixes[:2], self.out_prefix, incremental=True)
+
+        manifest = read_merge_manifest(self.out_prefix)
+        self.assertEqual(
+            manifest[0]["checksum"], plink_checksum(self.prefixes[0]))
+
+        # unchanged files are not read again
+        with patch(
+                "src.features.plinkmerge.plink_checksum",
+                wraps=plink_checksum) as my_checksum:
+            self.assertFalse(
+                merge_binary_plink(
+                    self.prefixes[:2], self.out_prefix, incremental=True))
+
+            my_checksum.assert_not_called()
+
+    def test_incremental_touched(self):
+        merge_binary_plink(
+            self.prefixes[:2], self.out_prefix, incremental=True)
+
+        # change the modification time, not the contents
+        stat = os.stat(f"{self.prefixes[1]}.bed")
+        os.utime(
+            f"{self.prefixes[1]}.bed",
+            ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+        with patch(
+                "src.features.plinkmerge.plink_checksum",
+                wraps=plink_checksum) as my_checksum:
+            self.assertFalse(
+                merge_binary_plink(
+                    self.prefixes[:2], self.out_prefix, incremental=True))
+
+            my_checksum.assert_called_once_with(str(self.prefixes[1]))
+
+        # the new modification time is tracked
+        manifest = read_merge_manifest(self.out_prefix)
+        self.assertEqual(manifest[1]["stat"], plink_stat(self.prefixes[1]))
+        self.assertEqual(
+            manifest[1]["samples"],
+            [["MER", f"sample{j}"] for j in range(3)])
+
+    def test_incremental_changed(self):
+        merge_binary_plink(self.prefixes, self.out_prefix)
+
+        # update the second file: one sample is removed
+        fam = [("MER", f"sample{j}", "0", "0", "0", "-9") for j in range(2)]
+        codes = np.zeros((len(self.bim), 2), dtype=np.uint8)
+        write_plink(self.prefixes[1], self.bim, fam, codes)
+
+        # the third file is not merged anymore
+        merge_binary_plink(
+            self.prefixes[:2], self.out_prefix, incremental=True)
+
+        fam = read_fam(self.out_prefix)
+        self.assertEqual(fam["fid"].tolist(), ["TEX"] * 3 + ["MER"] * 2)
+
+        np.testing.assert_array_equal(
+            read_codes(self.out_prefix), np.hstack([self.codes[0], codes]))
+
+        self.assertEqual(
+            [item["prefix"] for item in read_merge_manifest(
+                self.out_prefix)],
+            [str(prefix) for prefix in self.prefixes[:2]])
+
+    def test_incremental_snps_changed(self):
+        merge_binary_plink(self.prefixes[:2], self.out_prefix)
+
+        # a new SNP require a full merge
+        fam = [("FRZ", f"sample{j}", "0", "0", "0", "-9") for j in range(3)]
+        bim = self.bim + [(3, "snp4", 0, 100, "A", "G")]
+        codes = np.zeros((len(bim), 3), dtype=np.uint8)
+        write_plink(self.prefixes[2], bim, fam, codes)
+
+        with patch(
+                "src.features.plinkmerge.BinaryPlinkMerger",
+                wraps=BinaryPlinkMerger) as merger:
+            with self.assertLogs("src.features.plinkmerge", "WARNING"):
+                merge_binary_plink(
+                    self.prefixes, self.out_prefix, incremental=True)
+
+            self.assertEqual(
+                merger.call_args.args[0],
+                [str(prefix) for prefix in self.prefixes])
+
+        self.assertEqual(len(read_bim(self.out_prefix)), 4)
+        self.assertEqual(len(read_fam(self.out_prefix)), 9)
+
+
+if __name__ == '__main__':
+    unittest.main()
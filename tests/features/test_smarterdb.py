@@ -13,7 +13,8 @@ from unittest.mock import patch
 
 from src.features.smarterdb import (
     VariantSheep, Location, SampleSheep,
-    SmarterDBException, getSmarterId, Breed, get_or_create_breed, Dataset,
+    SmarterDBException, getSmarterId, getSmarterIds, bulk_create_samples,
+    Breed, get_or_create_breed, Dataset,
     BreedAlias, get_or_create_sample, SEX, get_sample_type, Country)
 
 from ..common import MongoMockMixin, SmarterIDMixin
@@ -537,6 +538,54 @@ class VariantSheepTestCase(VariantMixin, MongoMockMixin, unittest.TestCase):
             imported_from='SNPchiMp v.3'
         )
 
+    def test_location_index_invalidation(self):
+        "Modifying locations invalidates the location index"
+
+        index = self.variant.get_location_index(
+            version="Oar_v3.1",
+            imported_from='SNPchiMp v.3'
+        )
+        self.assertEqual(index, 1)
+
+        # append a new location
+        location = Location(
+            version="Oar_v4.1",
+            imported_from='SNPchiMp v.3',
+            chrom="15",
+            position=5870057,
+            illumina_top="A/G")
+        self.variant.locations.append(location)
+
+        self.assertEqual(
+            self.variant.get_location(
+                version="Oar_v4.1", imported_from='SNPchiMp v.3'),
+            location)
+
+        # replace all locations
+        self.variant.locations = [location]
+
+        self.assertEqual(
+            self.variant.get_location_index(
+                version="Oar_v4.1", imported_from='SNPchiMp v.3'),
+            0)
+
+        # modify location in place
+        self.variant.locations[0].version = "Oar_rambouillet_v1.0"
+
+        self.assertEqual(
+            self.variant.get_location_index(
+                version="Oar_rambouillet_v1.0",
+                imported_from='SNPchiMp v.3'),
+            0)
+
+        self.assertRaisesRegex(
+            SmarterDBException,
+            "is not in locations",
+            self.variant.get_location_index,
+            version="Oar_v4.1",
+            imported_from='SNPchiMp v.3'
+        )
+
 
 class AffyVariantTestCase(VariantMixin, MongoMockMixin, unittest.TestCase):
     def setUp(self):
@@ -622,6 +671,77 @@ class GetSmarterIdTestCase(SmarterIDMixin, MongoMockMixin, unittest.TestCase):
         reference = "UNOA-TEX-000000001"
         self.assertEqual(reference, test)
 
+    def test_get_smarter_ids(self):
+        test = getSmarterIds("Sheep", "Italy", "Texel", 3)
+        reference = [
+            "ITOA-TEX-000000001",
+            "ITOA-TEX-000000002",
+            "ITOA-TEX-000000003"]
+        self.assertEqual(reference, test)
+
+        # sequence numbers are shared by breeds
+        test = getSmarterId("Sheep", "Italy", "Merino")
+        self.assertEqual("ITOA-MER-000000004", test)
+
+
+class BulkCreateSamplesTestCase(
+        SmarterIDMixin, MongoMockMixin, unittest.TestCase):
+    """Testing bulk_create_samples function"""
+
+    def create_sample(self, original_id, breed, country="Italy"):
+        return SampleSheep(
+            original_id=original_id,
+            country=country,
+            breed=breed.name,
+            breed_code=breed.code,
+            dataset=self.dataset,
+            type_="background")
+
+    def test_bulk_create_samples(self):
+        samples = [
+            self.create_sample("TEST-1", self.breed),
+            self.create_sample("TEST-2", self.breed2),
+            self.create_sample("TEST-3", self.breed, country="Unknown"),
+        ]
+
+        test = bulk_create_samples(SampleSheep, samples)
+
+        self.assertEqual(
+            [sample.smarter_id for sample in test],
+            ["ITOA-TEX-000000001", "ITOA-MER-000000002",
+             "UNOA-TEX-000000003"])
+
+        self.assertEqual(SampleSheep.objects.count(), 3)
+
+        for sample in test:
+            self.assertIsNotNone(sample.id)
+            self.assertEqual(
+                SampleSheep.objects.get(id=sample.id).smarter_id,
+                sample.smarter_id)
+
+        # breed counters are updated
+        self.breed.reload()
+        self.breed2.reload()
+        self.assertEqual(self.breed.n_individuals, 2)
+        self.assertEqual(self.breed2.n_individuals, 1)
+
+        # can't insert the same samples twice
+        self.assertRaisesRegex(
+            SmarterDBException,
+            "is already saved",
+            bulk_create_samples,
+            SampleSheep,
+            samples)
+
+        # the next sample will get the next smarter_id
+        sample = self.create_sample("TEST-4", self.breed)
+        sample.save()
+        self.assertEqual(sample.smarter_id, "ITOA-TEX-000000004")
+
+    def test_bulk_create_no_samples(self):
+        self.assertEqual(bulk_create_samples(SampleSheep, []), [])
+        self.assertEqual(SampleSheep.objects.count(), 0)
+
 
 class SampleSheepTestCase(SmarterIDMixin, MongoMockMixin, unittest.TestCase):
     def setUp(self):
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 11:24:10 2026
+
+@author: Paolo Cozzi <paolo.cozzi@ibba.cnr.it>
+"""
+
+import unittest
+import pathlib
+import tempfile
+
+from src.features.smarterdb import VariantSheep, Location, SmarterDBException
+from src.features.plinkio import TextPlinkIO, AffyPlinkIO, AssemblyConf
+from src.features.snapshot import export_snapshot, VariantSnapshot
+
+from ..common import MongoMockMixin, VariantSheepMixin
+
+# set data dir
+DATA_DIR = pathlib.Path(__file__).parent / "data"
+
+
+class SnapshotMixin():
+    assemblies = [
+        AssemblyConf(version="Oar_v3.1", imported_from="SNPchiMp v.3"),
+        AssemblyConf(version="Oar_v4.0", imported_from="SNPchiMp v.3")]
+
+    chip_name = None
+
+    def setUp(self):
+        super().setUp()
+
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.tmpdir.name) / "snapshot.npz"
+
+        self.n_variants = export_snapshot(
+            self.path, VariantSheep, self.assemblies, self.chip_name)
+
+        self.snapshot = VariantSnapshot(self.path)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+        super().tearDown()
+
+    def assertSameCoordinates(self, plinkio, reference):
+        self.assertEqual(plinkio.filtered, reference.filtered)
+        self.assertEqual(plinkio.variants_name, reference.variants_name)
+
+        for location, expected in zip(
+                plinkio.dst_locations, reference.dst_locations):
+            if expected is None:
+                self.assertIsNone(location)
+                continue
+
+            self.assertIsInstance(location, Location)
+
+            for attr in [
+                    "version", "imported_from", "chrom", "position",
+                    "illumina", "illumina_forward", "illumina_strand",
+                    "affymetrix_ab", "strand", "illumina_top"]:
+                self.assertEqual(
+                    getattr(location, attr), getattr(expected, attr))
+
+
+class VariantSnapshotTest(
+        SnapshotMixin, VariantSheepMixin, MongoMockMixin, unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        self.plinkio = TextPlinkIO(
+            prefix=str(DATA_DIR / "plinktest"),
+            species="Sheep")
+        self.plinkio.read_mapfile()
+
+        self.reference = TextPlinkIO(
+            prefix=str(DATA_DIR / "plinktest"),
+            species="Sheep")
+        self.reference.read_mapfile()
+
+    def test_snapshot(self):
+        self.assertEqual(len(self.snapshot), self.n_variants)
+        self.assertEqual(self.snapshot.species, "Sheep")
+        self.assertEqual(
+            self.snapshot.assemblies,
+            [tuple(assembly) for assembly in self.assemblies])
+
+    def test_get_location(self):
+        matches = self.snapshot.search_variants(
+            ["250506CS3900065000002_1238.1"], "name", None, self.assemblies)
+        [variant] = matches["250506CS3900065000002_1238.1"].values()
+
+        variant_db = VariantSheep.objects.get(name=variant.name)
+
+        for assembly in self.assemblies:
+            self.assertEqual(
+                variant.get_location(**assembly._asdict()),
+                variant_db.get_location(**assembly._asdict()))
+
+    def test_get_location_not_in_snapshot(self):
+        matches = self.snapshot.search_variants(
+            ["250506CS3900065000002_1238.1"], "name", None, self.assemblies)
+        [variant] = matches["250506CS3900065000002_1238.1"].values()
+
+        self.assertRaisesRegex(
+            SmarterDBException,
+            "is not in snapshot",
+            variant.get_location,
+            version="Oar_v3.1",
+            imported_from="manifest")
+
+    def test_fetch_coordinates(self):
+        self.plinkio.fetch_coordinates(
+            src_assembly=self.assemblies[0],
+            dst_assembly=self.assemblies[1],
+            snapshot=self.snapshot)
+
+        self.reference.fetch_coordinates(
+            src_assembly=self.assemblies[0],
+            dst_assembly=self.assemblies[1])
+
+        self.assertEqual(self.plinkio.filtered, {3})
+        self.assertSameCoordinates(self.plinkio, self.reference)
+
+    def test_fetch_coordinates_chip_name(self):
+        self.plinkio.fetch_coordinates(
+            src_assembly=self.assemblies[0],
+            chip_name="IlluminaOvineHDSNP",
+            snapshot=self.snapshot)
+
+        self.reference.fetch_coordinates(
+            src_assembly=self.assemblies[0],
+            chip_name="IlluminaOvineHDSNP")
+
+        self.assertSameCoordinates(self.plinkio, self.reference)
+
+    def test_fetch_coordinates_by_rs_id(self):
+        plinkio = TextPlinkIO(
+            mapfile=str(DATA_DIR / "plinktest_rsid.map"),
+            pedfile=str(DATA_DIR / "plinktest.ped"),
+            species="Sheep")
+        plinkio.read_mapfile()
+        plinkio.fetch_coordinates(
+            src_assembly=self.assemblies[0],
+            search_field='rs_id',
+            snapshot=self.snapshot)
+
+        self.assertEqual(plinkio.filtered, {0, 3})
+
+    def test_fetch_coordinates_by_positions(self):
+        self.plinkio.fetch_coordinates_by_positions(
+            src_assembly=self.assemblies[0],
+            dst_assembly=self.assemblies[1],
+            snapshot=self.snapshot)
+
+        self.reference.fetch_coordinates_by_positions(
+            src_assembly=self.assemblies[0],
+            dst_assembly=self.assemblies[1])
+
+        self.assertEqual(self.plinkio.filtered, {3})
+        self.assertSameCoordinates(self.plinkio, self.reference)
+
+
+class AffySnapshotTest(
+        SnapshotMixin, VariantSheepMixin, MongoMockMixin, unittest.TestCase):
+
+    variant_fixture = "affy_sheep_variants.json"
+
+    assemblies = [
+        AssemblyConf(version="Oar_v4.0", imported_from="affymetrix"),
+        AssemblyConf(version="Oar_v3.1", imported_from="SNPchiMp v.3")]
+
+    chip_name = "AffymetrixAxiomOviCan"
+
+    def test_fetch_coordinates(self):
+        plinkio = AffyPlinkIO(
+            prefix=str(DATA_DIR / "affytest"),
+            species="Sheep",
+            chip_name=self.chip_name)
+        plinkio.read_mapfile()
+
+        reference = AffyPlinkIO(
+            prefix=str(DATA_DIR / "affytest"),
+            species="Sheep",
+            chip_name=self.chip_name)
+        reference.read_mapfile()
+
+        plinkio.fetch_coordinates(
+            src_assembly=self.assemblies[0],
+            dst_assembly=self.assemblies[1],
+            search_field='probeset_id',
+            chip_name=self.chip_name,
+            snapshot=self.snapshot)
+
+        reference.fetch_coordinates(
+            src_assembly=self.assemblies[0],
+            dst_assembly=self.assemblies[1],
+            search_field='probeset_id',
+            chip_name=self.chip_name)
+
+        self.assertEqual(plinkio.filtered, {2, 3})
+        self.assertSameCoordinates(plinkio, reference)
+
+
+if __name__ == '__main__':
+    unittest.main()
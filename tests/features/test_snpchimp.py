@@ -10,7 +10,7 @@ import types
 import pathlib
 import unittest
 
-from src.features.snpchimp import read_snpChimp
+from src.features.snpchimp import read_snpChimp, read_snpChimp_columns
 
 FEATURE_DATA_DIR = pathlib.Path(__file__).parents[1] / "features/data"
 
@@ -25,3 +25,24 @@ class ReadSnpchimpTest(unittest.TestCase):
 
         test = next(iterator)
         self.assertEqual(test.snp_name, '250506CS3900065000002_1238.1')
+
+    def test_read_snpChimp_columns(self):
+        records = list(read_snpChimp(self.data_path))
+
+        chunks = list(read_snpChimp_columns(self.data_path, chunksize=2))
+
+        # each chunk has at most chunksize records
+        for chunk in chunks:
+            self.assertLessEqual(len(chunk["snp_name"]), 2)
+
+        # join chunks and compare with records
+        for column in records[0]._fields:
+            values = []
+
+            for chunk in chunks:
+                values += chunk[column]
+
+            self.assertListEqual(
+                values, [getattr(record, column) for record in records])
+
+        self.assertIsInstance(chunks[0]["position"][0], int)